@@ -0,0 +1,85 @@
+# Benchmark of batched card descriptions: describes boards with one card per request and with K cards per request,
+# against the offline stub backend (a fixed latency per request plus a latency per image), and compares the wall
+# time, the number of requests and the input tokens of the describe stage. No description cache is used, so every
+# board is described from scratch.
+# Run from the project root with e.g.:
+#   python -m benchmarks.description_benchmark --boards 5 --batch-sizes 1 2 5 10 --latency 1.0 --image-latency 0.2
+import argparse
+import contextlib
+import io
+import random
+import tempfile
+import time
+
+import main_visual
+from board_sources import ImageDownloads, LocalBoardSource
+from llm_backends import StubBackend
+from openrouter_client import set_backend
+from simulator import make_synthetic_deck
+from telemetry import call_telemetry
+
+
+# Function to get the describe stage totals recorded in the call telemetry so far
+def describe_totals():
+    totals = call_telemetry.stage_summary().get("describe")
+    return (totals.calls, totals.prompt_tokens, totals.completion_tokens) if totals else (0, 0, 0)
+
+
+# Function to describe a number of boards with a batch size, returning the wall time and the describe stage totals
+def run_batch_size(batch_size, num_boards, cards_path, max_workers, seed=0, api_key="benchmark"):
+    calls_before, prompt_before, completion_before = describe_totals()
+    start = time.perf_counter()
+    errors = 0
+    for i in range(num_boards):
+        image_urls = LocalBoardSource(cards_path, rng=random.Random(seed + i)).load()
+        with contextlib.redirect_stdout(io.StringIO()):
+            descriptions = main_visual.generate_descriptions(image_urls, api_key, max_workers,
+                                                             downloads=ImageDownloads(image_urls),
+                                                             batch_size=batch_size)
+        errors += sum(1 for description in descriptions if description.startswith("Error:"))
+    elapsed = time.perf_counter() - start
+    calls, prompt_tokens, completion_tokens = describe_totals()
+
+    return {
+        "batch_size": batch_size,
+        "seconds": elapsed,
+        "requests": calls - calls_before,
+        "input_tokens": prompt_tokens - prompt_before,
+        "output_tokens": completion_tokens - completion_before,
+        "errors": errors
+    }
+
+
+def print_results(results):
+    baseline = results[0]
+    print(f"{'batch size':>10} {'seconds':>9} {'requests':>9} {'input tok':>10} {'output tok':>11} {'errors':>7}"
+          f" {'time vs K=' + str(baseline['batch_size']):>12} {'tokens vs K=' + str(baseline['batch_size']):>14}")
+    for result in results:
+        print(f"{result['batch_size']:>10} {result['seconds']:>9.2f} {result['requests']:>9} "
+              f"{result['input_tokens']:>10} {result['output_tokens']:>11} {result['errors']:>7} "
+              f"{result['seconds'] / baseline['seconds'] - 1:>+12.1%} "
+              f"{result['input_tokens'] / max(1, baseline['input_tokens']) - 1:>+14.1%}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--boards", type=int, default=3, help="Number of boards to describe per batch size")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 2, 5, 10])
+    parser.add_argument("--cards", help="Directory of card images (default: a synthetic deck)")
+    parser.add_argument("--latency", type=float, default=0.5, help="Simulated latency per request, in seconds")
+    parser.add_argument("--image-latency", type=float, default=0.1, help="Simulated latency per image, in seconds")
+    parser.add_argument("--concurrency", type=int, default=main_visual.description_concurrency,
+                        help="Maximum number of description requests in flight")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    set_backend(StubBackend(latency=args.latency, image_latency=args.image_latency, seed=args.seed))
+    with tempfile.TemporaryDirectory() as deck:
+        cards_path = args.cards or make_synthetic_deck(deck)
+        results = [run_batch_size(batch_size, args.boards, cards_path, args.concurrency, args.seed)
+                   for batch_size in args.batch_sizes]
+    print_results(results)
+
+
+if __name__ == "__main__":
+    main()
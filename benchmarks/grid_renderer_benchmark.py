@@ -0,0 +1,84 @@
+# Benchmark of the per-update render time of the game grid, before and after the tile-cached GridRenderer.
+# Run from the project root with: python -m benchmarks.grid_renderer_benchmark
+import random
+import time
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageFont
+
+from grid_renderer import GridRenderer, card_colors
+
+
+# Function to build a board of synthetic card images, similar in size to the real card images
+def synthetic_board(num_cards=25, size=(400, 400)):
+    labels = ['blue'] * 8 + ['red'] * 7 + ['neutral'] * 9 + ['assassin']
+    random.shuffle(labels)
+    images = []
+    for i in range(num_cards):
+        img = Image.effect_noise(size, 64).convert('RGB')
+        img_bytes = BytesIO()
+        img.save(img_bytes, format='JPEG')
+        images.append({
+            "image_bytes": img_bytes.getvalue(),
+            "card_number": i + 1,
+            "card_color": labels[i],
+            "viewed": False
+        })
+    return images
+
+
+# The previous implementation: decode, resize and compose all 25 cards on every update
+def render_from_scratch(images, grid_size=5, image_size=200, margin=10):
+    grid_img = Image.new('RGB', (
+        grid_size * (image_size + margin) + margin,
+        grid_size * (image_size + margin) + margin
+    ), 'white')
+    draw = ImageDraw.Draw(grid_img)
+    font = ImageFont.load_default()
+
+    for i, img_data in enumerate(images):
+        img = Image.open(BytesIO(img_data['image_bytes'])).resize((image_size, image_size))
+        x = (i % grid_size) * (image_size + margin) + margin
+        y = (i // grid_size) * (image_size + margin) + margin
+        grid_img.paste(img, (x, y))
+        draw.text((x + 10, y + 10), str(img_data['card_number']), fill='black', font=font)
+        draw.ellipse([(x + image_size - 20, y + 10), (x + image_size - 10, y + 20)],
+                     fill=card_colors[img_data['card_color']])
+        if img_data['viewed']:
+            overlay = Image.new('RGBA', (image_size, image_size), (0, 0, 0, 128))
+            grid_img.paste(overlay, (x, y), overlay)
+    return grid_img
+
+
+# Function to time one render per revealed card, like the game loop does after every guess
+def time_updates(images, render):
+    for img_data in images:
+        img_data['viewed'] = False
+    render(images)  # Initial render of the board
+
+    timings = []
+    for img_data in random.sample(images, len(images)):
+        img_data['viewed'] = True
+        start = time.perf_counter()
+        render(images)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def main():
+    random.seed(0)
+    images = synthetic_board()
+
+    before = time_updates(images, render_from_scratch)
+    after = time_updates(images, GridRenderer().render)
+
+    for name, timings in (("from scratch", before), ("tile-cached", after)):
+        timings = sorted(timings)
+        mean = sum(timings) / len(timings)
+        print(f"{name:>13}: mean {mean * 1000:7.2f} ms, p50 {timings[len(timings) // 2] * 1000:7.2f} ms, "
+              f"max {timings[-1] * 1000:7.2f} ms per update")
+    print(f"Speedup: {sum(before) / sum(after):.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+# Report of the card image resolution settings: downloads one board once, then for every maximum size and JPEG
+# quality preprocesses its images as the game does, and reports the bytes sent to the model (the data URLs), the
+# estimated vision tokens (OpenAI's tiling rule) and the latency of describing the cards one by one. Against the stub
+# backend the latency is the same for every setting; use a real backend (--llm-url, or the API) to measure it.
+# Run from the project root with e.g.:
+#   python -m benchmarks.image_preprocessing_report --stub --sizes none 1024 768 512 --qualities 85 70
+import argparse
+import contextlib
+import io
+import random
+import statistics
+import tempfile
+import time
+from pathlib import Path
+
+from PIL import Image
+
+import main_visual
+from board_sources import LocalBoardSource, fetch_image_bytes, image_data_url
+from description_pipeline import describe_concurrently
+from image_preprocessing import estimate_vision_tokens, image_size, preprocess_image
+from llm_backends import add_backend_arguments, configure_backend
+from telemetry import call_telemetry
+
+
+# Function to make a deck of photo-like card images (gradients with noise), which compress like real cards do
+def make_photo_deck(directory, num_cards=25, size=(1536, 1024)):
+    rng = random.Random(0)
+    for i in range(num_cards):
+        gradient = Image.linear_gradient('L').resize(size).rotate(rng.randrange(360), expand=False)
+        noise = Image.effect_noise(size, rng.uniform(20, 60))
+        image = Image.merge('RGB', (gradient, noise, Image.blend(gradient, noise, 0.5)))
+        image.save(Path(directory) / f"card_{i:03d}.jpg", quality=95)
+    return directory
+
+
+def parse_size(value):
+    return None if value.lower() == "none" else int(value)
+
+
+# Function to preprocess and describe the cards with one setting, returning the sizes, tokens and latencies
+def run_setting(original_images, max_size, quality, api_key, concurrency):
+    images = {url: preprocess_image(image_bytes, max_size, quality) for url, image_bytes in original_images.items()}
+    sizes = [image_size(image_bytes) for image_bytes in images.values()]
+
+    prompt_before = getattr(call_telemetry.stage_summary().get("describe"), "prompt_tokens", 0)
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = describe_concurrently(list(images),
+                                        lambda url: main_visual.describe_image(url, api_key, images[url]), concurrency)
+    elapsed = time.perf_counter() - start
+    prompt_after = getattr(call_telemetry.stage_summary().get("describe"), "prompt_tokens", 0)
+    latencies = [result["latency"] for result in results]
+
+    return {
+        "setting": f"{max_size}px q{quality}" if max_size else "original",
+        "resolution": f"{max(width for width, _ in sizes)}x{max(height for _, height in sizes)}",
+        "image_kb": sum(len(image_bytes) for image_bytes in images.values()) / 1024,
+        "sent_kb": sum(len(image_data_url(image_bytes)) for image_bytes in images.values()) / 1024,
+        "vision_tokens": sum(estimate_vision_tokens(width, height) for width, height in sizes),
+        "input_tokens": prompt_after - prompt_before,
+        "latency_mean": statistics.mean(latencies),
+        "latency_max": max(latencies),
+        "seconds": elapsed,
+        "errors": sum(1 for result in results
+                      if result["error"] is not None or result["description"].startswith("Error:"))
+    }
+
+
+def print_results(results, num_cards):
+    print(f"Totals over {num_cards} cards")
+    print(f"{'setting':>14} {'max res':>10} {'image KB':>9} {'sent KB':>9} {'vision tok':>11} {'input tok':>10} "
+          f"{'mean s':>7} {'max s':>7} {'wall s':>7} {'errors':>7}")
+    for result in results:
+        print(f"{result['setting']:>14} {result['resolution']:>10} {result['image_kb']:>9.1f} "
+              f"{result['sent_kb']:>9.1f} {result['vision_tokens']:>11} {result['input_tokens']:>10} "
+              f"{result['latency_mean']:>7.2f} {result['latency_max']:>7.2f} {result['seconds']:>7.2f} "
+              f"{result['errors']:>7}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cards", help="Directory or JSON manifest of card images (default: a synthetic deck)")
+    parser.add_argument("--sizes", type=parse_size, nargs="+", default=[None, 1024, 768, 512, 256],
+                        help="Maximum sizes of the longest side, in pixels ('none': the images as served)")
+    parser.add_argument("--qualities", type=int, nargs="+", default=[main_visual.image_quality],
+                        help="JPEG qualities of the downscaled images")
+    parser.add_argument("--concurrency", type=int, default=main_visual.description_concurrency,
+                        help="Maximum number of description requests in flight")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+
+    api_key = configure_backend(args, main_visual.fetch_api_key)
+    with tempfile.TemporaryDirectory() as deck:
+        cards_path = args.cards or make_photo_deck(deck)
+        image_urls = LocalBoardSource(cards_path, rng=random.Random(args.seed)).load()
+        original_images = {url: fetch_image_bytes(url) for url in dict.fromkeys(image_urls)}
+
+    results = []
+    for max_size in args.sizes:
+        for quality in args.qualities if max_size else args.qualities[:1]:
+            results.append(run_setting(original_images, max_size, quality, api_key, args.concurrency))
+    print_results(results, len(original_images))
+
+
+if __name__ == "__main__":
+    main()
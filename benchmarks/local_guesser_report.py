@@ -0,0 +1,143 @@
+# Report of the local fast-path guesser against the pure-LLM guesser on a set of replayed games. Every game is
+# replayed from its cassette with the LLM guesser, so it follows the recorded game exactly; at every hint the local
+# guesser is asked as well, on the same board, and both sets of picks are checked against the card colours.
+# Run from the project root with a manifest of recorded games, e.g.:
+#   python -m benchmarks.local_guesser_report --games games.json
+# where games.json lists {"cassette": "game1.jsonl.gz", "cards": "path/to/cards", "seed": 1} entries (record them with
+# main_visual.py --board ... --seed ... --record ...). Without a manifest, a game set is recorded with the stub backend.
+import argparse
+import json
+import os
+import tempfile
+
+import main_visual
+from llm_backends import RecordingBackend, ReplayBackend, StubBackend
+from local_guesser import local_guesses
+from openrouter_client import set_backend
+from simulator import make_synthetic_deck, run_game
+
+
+# Function to record a game set against the stub backend, for runs without recorded games
+def record_stub_games(directory, num_games, cards_path):
+    games = []
+    for seed in range(num_games):
+        cassette = os.path.join(directory, f"game_{seed}.jsonl")
+        set_backend(RecordingBackend(StubBackend(), cassette))
+        run_game(seed, cards_path, api_key="offline", make_guesses=llm_guesser("offline"))
+        games.append({"cassette": cassette, "cards": cards_path, "seed": seed})
+    set_backend(None)
+    return games
+
+
+def llm_guesser(api_key):
+    def make_guesses(board, word, number, current_team, previous_hints):
+        return main_visual.make_guesses(board, word, number, current_team, previous_hints, api_key, mode="llm")
+    return make_guesses
+
+
+# Function to score a list of picks against the card colours: the picks the turn would reveal (up to number + 1,
+# stopping at the first card that is not the team's) and how many of those were the team's
+def score_picks(board, picks, number, current_team):
+    revealed = correct = 0
+    for guess in picks[:number + 1 if number else None]:
+        card = board.card(guess["card_number"])
+        if card is None or card.viewed:
+            continue
+        revealed += 1
+        if card.card_color != current_team:
+            break
+        correct += 1
+    return revealed, correct
+
+
+# Function to replay one game with the LLM guesser, asking the local guesser at every hint as well
+def compare_game(game, margin, stats):
+    ask_llm = llm_guesser("offline")
+
+    def make_guesses(board, word, number, current_team, previous_hints):
+        llm_picks = list(ask_llm(board, word, number, current_team, previous_hints))
+        local_picks = local_guesses(main_visual.board_hint_affinity(board), word, number,
+                                    board.partition(current_team), margin)
+
+        stats["hints"] += 1
+        llm_revealed, llm_correct = score_picks(board, llm_picks, number, current_team)
+        stats["llm_revealed"] += llm_revealed
+        stats["llm_correct"] += llm_correct
+        if local_picks is None:
+            stats["fallbacks"] += 1
+        else:
+            local_revealed, local_correct = score_picks(board, local_picks, number, current_team)
+            stats["local_revealed"] += local_revealed
+            stats["local_correct"] += local_correct
+            stats["local_hints_llm_revealed"] += llm_revealed
+            stats["local_hints_llm_correct"] += llm_correct
+            llm_cards = {guess["card_number"] for guess in llm_picks[:number]}
+            stats["agreements"] += {guess["card_number"] for guess in local_picks} == llm_cards
+        return llm_picks
+
+    replay = ReplayBackend(game["cassette"])
+    set_backend(replay)
+    run_game(game["seed"], game["cards"], api_key="offline", make_guesses=make_guesses)
+    set_backend(None)
+    stats["replay_misses"] += replay.misses
+
+
+def ratio(numerator, denominator):
+    return numerator / denominator if denominator else 0.0
+
+
+def report(games, margin):
+    stats = dict.fromkeys(("hints", "fallbacks", "agreements", "llm_revealed", "llm_correct", "local_revealed",
+                           "local_correct", "local_hints_llm_revealed", "local_hints_llm_correct", "replay_misses"), 0)
+    for game in games:
+        compare_game(game, margin, stats)
+
+    local_hints = stats["hints"] - stats["fallbacks"]
+    return {
+        "games": len(games),
+        "margin": margin,
+        "hints": stats["hints"],
+        "fallback_rate": ratio(stats["fallbacks"], stats["hints"]),
+        "llm_round_trips_saved": local_hints,
+        "llm_accuracy": ratio(stats["llm_correct"], stats["llm_revealed"]),
+        "local_accuracy": ratio(stats["local_correct"], stats["local_revealed"]),
+        "llm_accuracy_on_local_hints": ratio(stats["local_hints_llm_correct"], stats["local_hints_llm_revealed"]),
+        "agreement_on_local_hints": ratio(stats["agreements"], local_hints),
+        "replay_misses": stats["replay_misses"]  # LLM requests missing from the cassettes; should be 0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", help="JSON manifest of recorded games (default: record a stub game set)")
+    parser.add_argument("--stub-games", type=int, default=20, help="Number of stub games to record without --games")
+    parser.add_argument("--margin", type=float, default=main_visual.local_guess_margin)
+    parser.add_argument("--output", help="Save the report as JSON to this file")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        if args.games:
+            with open(args.games) as f:
+                games = json.load(f)
+        else:
+            cards_path = os.path.join(directory, "cards")
+            os.makedirs(cards_path)
+            games = record_stub_games(directory, args.stub_games, make_synthetic_deck(cards_path))
+        results = report(games, args.margin)
+
+    print(f"{results['games']} games, {results['hints']} hints, local guess margin {results['margin']}")
+    print(f"Fallback to the LLM guesser: {results['fallback_rate']:.1%} of hints "
+          f"({results['llm_round_trips_saved']} guess round trips saved)")
+    print(f"Accuracy of the revealed picks: LLM {results['llm_accuracy']:.1%} on all hints; on the hints picked "
+          f"locally, local {results['local_accuracy']:.1%} vs LLM {results['llm_accuracy_on_local_hints']:.1%} "
+          f"({results['agreement_on_local_hints']:.1%} identical picks)")
+    if results["replay_misses"]:
+        print(f"Warning: {results['replay_misses']} LLM requests were not in the cassettes, so some games did not "
+              f"follow their recording")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,256 @@
+# Benchmark of where the time of a turn goes: descriptions, associations, hint candidates, scoring, JSON conversion,
+# guessing, rendering and the game bookkeeping in between. Games are played by main_visual against the offline stub
+# backend, which adds a configurable latency to every LLM call, and the p50/p95 per stage and per turn are saved as
+# JSON so that runs on different commits can be compared.
+# Run from the project root with e.g.:
+#   python -m benchmarks.pipeline_benchmark --games 5 --latency 0.05 --stage-latency describe=0.5 --output before.json
+#   python -m benchmarks.pipeline_benchmark --games 5 --latency 0.05 --stage-latency describe=0.5 --baseline before.json
+import argparse
+import contextlib
+import inspect
+import io
+import json
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from functools import wraps
+
+import main_visual
+from board_sources import LocalBoardSource
+from game_engine import play_game, silent
+from llm_backends import StubBackend
+from openrouter_client import set_backend
+from simulator import make_synthetic_deck
+from telemetry import LatencyHistogram
+
+# Pipeline functions of main_visual that are timed, by stage name
+TIMED_FUNCTIONS = {
+    "describe": "generate_descriptions",
+    "best_hint": "generate_best_hint",
+    "associations": "generate_associations",
+    "hint_candidate": "generate_hint",
+    "scoring": "score_hint",
+    "json_conversion": ("convert_hint_evaluation_to_json", "convert_guesses_to_json"),
+    "guessing": ("generate_guesses", "stream_guesses"),
+    "render": "visualize_game_grid"
+}
+
+
+# Collects timings per stage, and the time spent in each stage during the current turn
+class StageTimings:
+    def __init__(self):
+        self.histograms = {}
+        self.turn_stages = {}
+        self._lock = threading.Lock()
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            self.histograms.setdefault(stage, LatencyHistogram()).observe(seconds)
+            self.turn_stages[stage] = self.turn_stages.get(stage, 0.0) + seconds
+
+    def start_turn(self):
+        with self._lock:
+            self.turn_stages = {}
+
+    # Wrap a function to time its calls. A function that returns a generator (such as the guess stream) is timed
+    # until the generator is exhausted or closed, counting only the time spent producing its items, not the time the
+    # consumer spends between them (revealing and rendering the cards).
+    def wrap(self, stage, function):
+        @wraps(function)
+        def timed(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except BaseException:
+                self.observe(stage, time.perf_counter() - start)
+                raise
+            if inspect.isgenerator(result):
+                return self.timed_generator(stage, result, time.perf_counter() - start)
+            self.observe(stage, time.perf_counter() - start)
+            return result
+        return timed
+
+    def timed_generator(self, stage, generator, seconds):
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    item = next(generator)
+                except StopIteration:
+                    break
+                finally:
+                    seconds += time.perf_counter() - start
+                yield item
+        finally:
+            start = time.perf_counter()
+            generator.close()
+            self.observe(stage, seconds + time.perf_counter() - start)
+
+    def summary(self):
+        with self._lock:
+            return {stage: {key: value for key, value in histogram.summary().items() if key != "buckets"}
+                    for stage, histogram in sorted(self.histograms.items())}
+
+
+# Backend wrapper that times every LLM call per stage and keeps the answers to benchmark JSON parsing on
+class TimedBackend:
+    def __init__(self, backend, timings):
+        self.backend = backend
+        self.timings = timings
+        self.answers = []
+
+    def chat_completion(self, model, messages, stage="default", **request_fields):
+        start = time.perf_counter()
+        result = self.backend.chat_completion(model, messages, stage=stage, **request_fields)
+        self.timings.observe(f"llm.{stage}", time.perf_counter() - start)
+        if result is not None and stage in ("score", "guesses"):
+            self.answers.append(result["choices"][0]["message"]["content"])
+        return result
+
+
+# Function to replace the pipeline functions of main_visual by timed versions; returns the originals to restore
+def instrument_pipeline(timings):
+    originals = {}
+    for stage, names in TIMED_FUNCTIONS.items():
+        for name in (names,) if isinstance(names, str) else names:
+            originals[name] = getattr(main_visual, name)
+            setattr(main_visual, name, timings.wrap(stage, originals[name]))
+    return originals
+
+
+# Function to play one game, timing every turn. The turn time not spent in hinting, guessing or rendering is
+# reported as bookkeeping. make_guesses covers the whole guessing, also when the guesses are streamed: its time
+# includes the time spent reading the stream.
+def run_game(seed, cards_path, timings, api_key="benchmark"):
+    random.seed(seed)
+    turn_start = None
+
+    def end_turn():
+        turn_seconds = time.perf_counter() - turn_start
+        timings.observe("turn", turn_seconds)
+        accounted = sum(timings.turn_stages.get(stage, 0.0) for stage in ("give_hint", "make_guesses", "render"))
+        timings.observe("bookkeeping", max(0.0, turn_seconds - accounted))
+
+    def give_hint(board, current_team):
+        nonlocal turn_start
+        if turn_start is not None:
+            end_turn()
+        timings.start_turn()
+        turn_start = time.perf_counter()
+        return main_visual.give_hint(board, current_team, api_key=api_key)
+
+    def make_guesses(board, word, number, current_team, previous_hints):
+        return main_visual.make_guesses(board, word, number, current_team, previous_hints, api_key=api_key)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        starting_player, grid_labels = main_visual.generate_spymaster_grid_labels()
+        image_urls = LocalBoardSource(cards_path, board_size=len(grid_labels)).load()
+        descriptions = main_visual.generate_descriptions(image_urls, api_key)  # No cache: every game describes its cards
+        board = main_visual.download_and_enrich_images(image_urls, grid_labels, descriptions)
+        main_visual.visualize_game_grid(board, show=False)
+        result = play_game(board, starting_player, timings.wrap("give_hint", give_hint),
+                           timings.wrap("make_guesses", make_guesses),
+                           on_reveal=lambda board, card: main_visual.visualize_game_grid(board, show=False),
+                           guess_history_token_budget=main_visual.guess_history_token_budget, log=silent)
+        if turn_start is not None:
+            end_turn()
+    return result
+
+
+# Function to time parse_clean_json on the model answers collected during the games
+def time_json_parsing(answers, timings, repeat=20):
+    for answer in answers:
+        start = time.perf_counter()
+        for _ in range(repeat):
+            main_visual.parse_clean_json(answer)
+        timings.observe("parse_clean_json", (time.perf_counter() - start) / repeat)
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_benchmark(num_games, cards_path, seed=0, latency=0.0, stage_latency=None, jitter=0.0):
+    timings = StageTimings()
+    backend = TimedBackend(StubBackend(latency=latency, jitter=jitter, stage_latency=stage_latency), timings)
+    set_backend(backend)
+    originals = instrument_pipeline(timings)
+    try:
+        start = time.perf_counter()
+        for i in range(num_games):
+            run_game(seed + i, cards_path, timings)
+        elapsed = time.perf_counter() - start
+    finally:
+        for name, function in originals.items():
+            setattr(main_visual, name, function)
+        set_backend(None)
+    time_json_parsing(backend.answers, timings)
+
+    return {
+        "commit": git_commit(),
+        "games": num_games,
+        "seconds": elapsed,
+        "config": {"seed": seed, "latency": latency, "stage_latency": stage_latency or {}, "jitter": jitter,
+                   "hint_search_mode": main_visual.hint_search_mode, "hint_candidates": main_visual.hint_candidates},
+        "stages": timings.summary()
+    }
+
+
+def print_results(results, baseline=None):
+    print(f"{results['games']} games in {results['seconds']:.2f}s (commit {results['commit']})")
+    print(f"{'stage':>24} {'count':>6} {'p50 ms':>10} {'p95 ms':>10}" + (f" {'p50 change':>11}" if baseline else ""))
+    for stage, summary in results["stages"].items():
+        line = f"{stage:>24} {summary['count']:>6} {summary['p50'] * 1000:>10.2f} {summary['p95'] * 1000:>10.2f}"
+        previous = (baseline or {}).get("stages", {}).get(stage)
+        if previous and previous["p50"]:
+            line += f" {(summary['p50'] / previous['p50'] - 1):>+11.1%}"
+        print(line)
+
+
+# Function to parse "stage=seconds" options
+def parse_stage_latency(values):
+    stage_latency = {}
+    for value in values or []:
+        stage, _, seconds = value.partition("=")
+        stage_latency[stage] = float(seconds)
+    return stage_latency
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=5)
+    parser.add_argument("--cards", help="Directory of card images (default: a synthetic deck)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated latency per LLM call, in seconds")
+    parser.add_argument("--stage-latency", action="append", metavar="STAGE=SECONDS",
+                        help="Simulated latency for one stage (describe, associations, hint, score, guesses, ...)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Random variation of the simulated latency")
+    parser.add_argument("--output", help="Save the results as JSON to this file")
+    parser.add_argument("--baseline", help="Results JSON of an earlier run to compare against")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as deck_directory:
+        cards_path = args.cards or make_synthetic_deck(deck_directory)
+        results = run_benchmark(args.games, cards_path, args.seed, args.latency,
+                                parse_stage_latency(args.stage_latency), args.jitter)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Results saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
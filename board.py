@@ -0,0 +1,131 @@
+from collections import Counter
+
+TEAMS = ('blue', 'red')
+
+
+# Function to get the opposing team
+def other_team(team):
+    return 'red' if team == 'blue' else 'blue'
+
+
+# A single card on the board. Fields can also be read and written dict-style (card['viewed']), like the
+# image dicts this replaces.
+class Card:
+    __slots__ = ('card_number', 'card_color', 'description', 'image_url', 'image_bytes', 'viewed')
+
+    def __init__(self, card_number, card_color, description, image_url=None, image_bytes=None, viewed=False):
+        self.card_number = card_number
+        self.card_color = card_color
+        self.description = description
+        self.image_url = image_url
+        self.image_bytes = image_bytes
+        self.viewed = viewed
+
+    def __getitem__(self, key):
+        try:
+            return getattr(self, key)
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def __setitem__(self, key, value):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+    def get(self, key, default=None):
+        return getattr(self, key, default)
+
+    def to_dict(self):
+        return {field: getattr(self, field) for field in self.__slots__}
+
+    def __repr__(self):
+        return f"Card({self.card_number}, {self.card_color!r}, viewed={self.viewed})"
+
+
+# The unviewed cards of the board, split from the point of view of one team
+class Partition:
+    __slots__ = ('unviewed', 'current_team', 'other_team', 'neutral', 'assassin', 'memo')
+
+    def __init__(self, cards, team):
+        self.unviewed = [card for card in cards if not card.viewed]
+        self.current_team = [card for card in self.unviewed if card.card_color == team]
+        self.other_team = [card for card in self.unviewed if card.card_color == other_team(team)]
+        self.neutral = [card for card in self.unviewed if card.card_color == 'neutral']
+        self.assassin = [card for card in self.unviewed if card.card_color == 'assassin']
+        self.memo = {}  # Values derived from this partition, such as prompt sections
+
+
+# Game state: the cards in board order, indexed by card number, with per-colour counters of the cards that are
+# still hidden and per-team partitions that are cached until the next reveal.
+class Board:
+    def __init__(self, cards):
+        self.cards = list(cards)
+        self.by_number = {card.card_number: card for card in self.cards}
+        self.remaining = Counter(card.card_color for card in self.cards if not card.viewed)
+        self.version = 0  # Incremented on every reveal
+        self._partitions = {}
+        self._reveal_listeners = []
+
+    @classmethod
+    def from_images(cls, images):
+        return cls(Card(img['card_number'], img['card_color'], img['description'], img.get('image_url'),
+                        img.get('image_bytes'), img.get('viewed', False)) for img in images)
+
+    def __iter__(self):
+        return iter(self.cards)
+
+    def __len__(self):
+        return len(self.cards)
+
+    def __getitem__(self, index):
+        return self.cards[index]
+
+    def card(self, card_number):
+        return self.by_number.get(card_number)
+
+    # Mark a card as viewed and return it, or None when there is no card with that number
+    def reveal(self, card_number):
+        card = self.by_number.get(card_number)
+        if card is None:
+            return None
+        if not card.viewed:
+            card.viewed = True
+            self.remaining[card.card_color] -= 1
+            self.version += 1
+            self._partitions.clear()
+            for listener in self._reveal_listeners:
+                listener(card)
+        return card
+
+    # Register a function that is called with every card that gets revealed, to keep derived state up to date
+    def add_reveal_listener(self, listener):
+        self._reveal_listeners.append(listener)
+
+    def partition(self, team):
+        partition = self._partitions.get(team)
+        if partition is None:
+            partition = Partition(self.cards, team)
+            self._partitions[team] = partition
+        return partition
+
+    # Build a value from a team's partition once per turn; it is dropped together with the partition on the next reveal
+    def memoized(self, team, key, build):
+        partition = self.partition(team)
+        value = partition.memo.get(key)
+        if value is None:
+            value = build(partition)
+            partition.memo[key] = value
+        return value
+
+    def unviewed(self):
+        return [card for card in self.cards if not card.viewed]
+
+    def all_found(self, color):
+        return self.remaining[color] == 0
+
+    # The team that has found all of its agents, if any
+    def winner(self):
+        for team in TEAMS:
+            if self.all_found(team):
+                return team
+        return None
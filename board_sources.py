@@ -0,0 +1,155 @@
+import base64
+import json
+import mimetypes
+import random
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+import requests
+from requests.adapters import HTTPAdapter
+
+URL = 'https://samdemaeyer.github.io/codenames-pictures/#/play'
+SITE_ROOT = 'https://samdemaeyer.github.io'
+BOARD_SIZE = 20
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp'}
+download_concurrency = 8
+
+# Shared keep-alive session for card image downloads
+image_session = requests.Session()
+image_session.mount('https://', HTTPAdapter(pool_maxsize=download_concurrency))
+image_session.mount('http://', HTTPAdapter(pool_maxsize=download_concurrency))
+
+
+# Board source that opens the Codenames Pictures site in Chrome and reads the card image URLs from the page
+class SeleniumBoardSource:
+    def __init__(self, url=URL, timeout=10):
+        self.url = url
+        self.timeout = timeout
+
+    def load(self):
+        # Imported here so that browser-free board sources do not need Selenium or BeautifulSoup installed
+        from bs4 import BeautifulSoup
+        from selenium import webdriver
+        from selenium.webdriver.common.by import By
+        from selenium.webdriver.support import expected_conditions as EC
+        from selenium.webdriver.support.ui import WebDriverWait
+
+        driver = webdriver.Chrome()
+        try:
+            driver.get(self.url)
+
+            # Wait for images to load
+            try:
+                WebDriverWait(driver, self.timeout).until(
+                    EC.presence_of_all_elements_located((By.CLASS_NAME, 'card-img'))
+                )
+            except Exception as e:
+                print(f"Error: {e}")
+                return []
+
+            # Parse the page once; the URL list is shared by the description and download steps
+            soup = BeautifulSoup(driver.page_source, 'html.parser')
+            image_elements = soup.find_all('img', class_='card-img')
+            return [SITE_ROOT + img['src'] for img in image_elements]
+        finally:
+            driver.quit()
+
+
+# Board source that loads card images from a local directory, or from a JSON manifest listing image paths or URLs.
+# A directory with more images than fit on the board is sampled at random (with rng), so it can hold a whole deck.
+class LocalBoardSource:
+    def __init__(self, path, board_size=BOARD_SIZE, rng=random):
+        self.path = Path(path)
+        self.board_size = board_size
+        self.rng = rng
+
+    def load(self):
+        if self.path.is_dir():
+            files = sorted(p for p in self.path.iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+            if len(files) > self.board_size:
+                files = self.rng.sample(files, self.board_size)
+            return [p.resolve().as_uri() for p in files]
+
+        with open(self.path) as f:
+            manifest = json.load(f)
+        entries = manifest["cards"] if isinstance(manifest, dict) else manifest
+
+        image_urls = []
+        for entry in entries:
+            if urlparse(entry).scheme in ('http', 'https', 'file', 'data'):
+                image_urls.append(entry)
+            else:
+                image_urls.append((self.path.parent / entry).resolve().as_uri())
+        return image_urls
+
+
+# Function to pick the board source: a local directory or manifest when a path is given, otherwise the website
+def make_board_source(board_path=None):
+    if board_path:
+        return LocalBoardSource(board_path)
+    return SeleniumBoardSource()
+
+
+# Function to read the bytes of a card image, from the web, a local file:// URL or a data URL
+def fetch_image_bytes(image_url, timeout=30):
+    parsed = urlparse(image_url)
+    if parsed.scheme == 'file':
+        with open(url2pathname(parsed.path), 'rb') as f:
+            return f.read()
+    if parsed.scheme == 'data':
+        return base64.b64decode(image_url.split(',', 1)[1])
+    response = image_session.get(image_url, timeout=timeout)
+    response.raise_for_status()
+    return response.content
+
+
+# Function to tell the type of an image from its first bytes
+def image_mime_type(image_bytes):
+    if image_bytes.startswith(b'\x89PNG'):
+        return 'image/png'
+    if image_bytes.startswith(b'GIF8'):
+        return 'image/gif'
+    if image_bytes[:4] == b'RIFF' and image_bytes[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/jpeg'
+
+
+# Function to build a data URL from image bytes
+def image_data_url(image_bytes, mime_type=None):
+    mime_type = mime_type or image_mime_type(image_bytes)
+    return f"data:{mime_type};base64,{base64.b64encode(image_bytes).decode('ascii')}"
+
+
+# Function to turn a card image URL into one the model provider can read. Local files are sent inline.
+def model_image_url(image_url):
+    parsed = urlparse(image_url)
+    if parsed.scheme != 'file':
+        return image_url
+    path = url2pathname(parsed.path)
+    mime_type = mimetypes.guess_type(path)[0] or 'image/jpeg'
+    return image_data_url(fetch_image_bytes(image_url), mime_type)
+
+
+# Background download of all card images. Downloads start immediately and run concurrently, so they overlap with
+# whatever runs next (typically the descriptions). Every image is downloaded once; the bytes are kept as served, or
+# as returned by preprocess(image_bytes) when it is given, so the descriptions and the rendering use the same bytes.
+class ImageDownloads:
+    def __init__(self, image_urls, max_workers=download_concurrency, preprocess=None):
+        self.preprocess = preprocess
+        unique_urls = list(dict.fromkeys(image_urls))
+        executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(unique_urls) or 1)))
+        self.futures = {url: executor.submit(self.fetch, url) for url in unique_urls}
+        executor.shutdown(wait=False)
+
+    def fetch(self, image_url):
+        image_bytes = fetch_image_bytes(image_url)
+        return self.preprocess(image_bytes) if self.preprocess is not None else image_bytes
+
+    # Wait for (and return) the bytes of one image
+    def get(self, image_url):
+        future = self.futures.get(image_url)
+        if future is None:
+            return self.fetch(image_url)
+        return future.result()
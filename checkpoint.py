@@ -0,0 +1,87 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+
+from board import Board, Card
+from guess_history import GuessHistory
+
+CHECKPOINT_VERSION = 1
+
+
+# Function to write a file atomically: the data goes to a temporary file in the same directory, which then replaces
+# the target, so a crash leaves either the old or the new file and never a partial one
+def write_atomically(path, data):
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temporary_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=os.path.basename(path))
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(temporary_path, 0o644)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+# Everything needed to continue a game without scraping or describing the board again: the cards (labels,
+# descriptions, image references and whether they have been viewed), the guess histories, the result so far and the
+# team whose turn it is. The checkpoint itself is a small JSON file; the card images are stored once, by content
+# hash, in a directory next to it, so resuming needs no network.
+class GameCheckpoint:
+    def __init__(self, board, current_team, guess_history, result):
+        self.board = board
+        self.current_team = current_team
+        self.guess_history = guess_history
+        self.result = result
+        self._image_names = {}  # (path, card number) -> (image bytes, file name), to store every image only once
+
+    @staticmethod
+    def image_directory(path):
+        return Path(f"{path}.images")
+
+    # Store the image of a card and return its file name
+    def store_image(self, path, card):
+        stored = self._image_names.get((path, card.card_number))
+        if stored is not None and stored[0] is card.image_bytes:
+            return stored[1]
+        directory = self.image_directory(path)
+        name = hashlib.sha1(card.image_bytes).hexdigest()
+        image_path = directory / name
+        if not image_path.exists():
+            directory.mkdir(parents=True, exist_ok=True)
+            write_atomically(image_path, card.image_bytes)
+        self._image_names[(path, card.card_number)] = (card.image_bytes, name)
+        return name
+
+    def to_dict(self, path):
+        return {
+            "version": CHECKPOINT_VERSION,
+            "current_team": self.current_team,
+            "result": self.result,
+            "cards": [[card.card_number, card.card_color, card.description, card.image_url, card.viewed,
+                       self.store_image(path, card) if card.image_bytes else None]
+                      for card in self.board],
+            "guess_history": {team: history.to_dict() for team, history in self.guess_history.items()}
+        }
+
+    def save(self, path):
+        write_atomically(path, json.dumps(self.to_dict(path), separators=(",", ":")).encode("utf-8"))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("version") != CHECKPOINT_VERSION:
+            raise ValueError(f"Unsupported checkpoint version {data.get('version')} in {path}")
+
+        directory = cls.image_directory(path)
+        cards = []
+        for card_number, card_color, description, image_url, viewed, image_name in data["cards"]:
+            image_bytes = (directory / image_name).read_bytes() if image_name else None
+            cards.append(Card(card_number, card_color, description, image_url, image_bytes, viewed))
+        guess_history = {team: GuessHistory.from_dict(history) for team, history in data["guess_history"].items()}
+        return cls(Board(cards), data["current_team"], guess_history, data["result"])
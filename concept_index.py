@@ -0,0 +1,99 @@
+from collections import defaultdict
+
+from board import other_team
+from hint_affinity import stem, tokenize
+
+
+# Board-level index of the concepts in the card descriptions (content words, with plural and verb forms merged),
+# mapping every concept to the unviewed cards that mention it. It is built once per board; a revealed card is
+# removed from the index incrementally, so the per-turn associations can be read from it instead of being
+# rediscovered by the LLM.
+class ConceptIndex:
+    def __init__(self, cards):
+        self.colors = {card.card_number: card.card_color for card in cards}
+        self.surface_forms = {}  # Concept -> the first word it was seen as
+        self.cards_by_concept = defaultdict(set)
+        self.concepts_by_card = {}
+        for card in cards:
+            concepts = set()
+            for word in tokenize(card.description or ""):
+                concept = stem(word)
+                self.surface_forms.setdefault(concept, word)
+                concepts.add(concept)
+            self.concepts_by_card[card.card_number] = concepts
+            if not card.viewed:
+                for concept in concepts:
+                    self.cards_by_concept[concept].add(card.card_number)
+
+    @classmethod
+    def for_board(cls, board):
+        index = cls(board.cards)
+        board.add_reveal_listener(index.remove_card)
+        return index
+
+    # Remove a revealed card: only the concepts of that card are touched
+    def remove_card(self, card):
+        card_number = card.card_number if hasattr(card, "card_number") else card
+        for concept in self.concepts_by_card.get(card_number, ()):
+            cards = self.cards_by_concept.get(concept)
+            if cards is not None:
+                cards.discard(card_number)
+                if not cards:
+                    del self.cards_by_concept[concept]
+
+    # Concepts with the unviewed cards that mention them, split by the kind of card from the point of view of a team
+    def concept_groups(self, team):
+        kinds = {team: "current_team", other_team(team): "other_team", "neutral": "neutral", "assassin": "assassin"}
+        groups = {}
+        for concept, cards in self.cards_by_concept.items():
+            group = {"current_team": [], "other_team": [], "neutral": [], "assassin": []}
+            for card_number in sorted(cards):
+                group[kinds[self.colors[card_number]]].append(card_number)
+            groups[concept] = group
+        return groups
+
+    # Associations to aim for (concepts of the team's cards, most shared first, least risky first) and to avoid
+    # (concepts of the other cards, grouped by how bad it is to hit them)
+    def associations(self, team, max_aim=12, max_avoid=12):
+        groups = self.concept_groups(team)
+
+        def risk(group):
+            return 10 * len(group["assassin"]) + 2 * len(group["other_team"]) + len(group["neutral"])
+
+        aim = sorted((concept for concept, group in groups.items() if group["current_team"]),
+                     key=lambda concept: (-len(groups[concept]["current_team"]), risk(groups[concept]), concept))
+        avoid = {}
+        for kind in ("assassin", "other_team", "neutral"):
+            avoid[kind] = sorted((concept for concept, group in groups.items() if group[kind]),
+                                 key=lambda concept: (-len(groups[concept][kind]), concept))[:max_avoid]
+        return {
+            "aim": [(self.surface_forms[concept], groups[concept]) for concept in aim[:max_aim]],
+            "avoid": {kind: [(self.surface_forms[concept], groups[concept][kind]) for concept in concepts]
+                      for kind, concepts in avoid.items()}
+        }
+
+    # Render the associations in the shape of the associations prompt section
+    def render_associations(self, team):
+        associations = self.associations(team)
+
+        def cards(card_numbers):
+            return ("card " if len(card_numbers) == 1 else "cards ") + ", ".join(map(str, card_numbers))
+
+        lines = ["Associations to aim for (concept: team cards that show it):"]
+        for word, group in associations["aim"]:
+            line = f"- {word}: {cards(group['current_team'])}"
+            risky = [f"{kind.replace('_', ' ')} {cards(group[kind])}"
+                     for kind in ("assassin", "other_team", "neutral") if group[kind]]
+            if risky:
+                line += f" (also on {'; '.join(risky)})"
+            lines.append(line)
+
+        lines.append("Associations to avoid:")
+        for kind, label in (("assassin", "Catastrophic (assassin)"), ("other_team", "Bad (other team)"),
+                            ("neutral", "Not ideal (neutral)")):
+            entries = [f"{word} ({cards(card_numbers)})" for word, card_numbers in associations["avoid"][kind]]
+            lines.append(f"- {label}: {', '.join(entries) or 'none'}")
+        return "\n".join(lines)
+
+    def __len__(self):
+        return len(self.cards_by_concept)
@@ -0,0 +1,78 @@
+import hashlib
+import sqlite3
+import threading
+import time
+
+
+# Function to build the cache key for an image description: the image content plus everything that shapes the answer
+def description_cache_key(image_bytes, model, prompt):
+    digest = hashlib.sha256()
+    digest.update(image_bytes)
+    digest.update(b"\0" + model.encode("utf-8"))
+    digest.update(b"\0" + prompt.encode("utf-8"))
+    return digest.hexdigest()
+
+
+# Persistent, content-addressed store of image descriptions with least-recently-used eviction
+class DescriptionCache:
+    def __init__(self, path="description_cache.sqlite", max_entries=1000):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS descriptions ("
+            "key TEXT PRIMARY KEY, description TEXT NOT NULL, model TEXT NOT NULL, last_used REAL NOT NULL)"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS descriptions_last_used ON descriptions (last_used)")
+        self._connection.commit()
+
+    def get(self, image_bytes, model, prompt):
+        key = description_cache_key(image_bytes, model, prompt)
+        with self._lock:
+            row = self._connection.execute("SELECT description FROM descriptions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._connection.execute("UPDATE descriptions SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._connection.commit()
+            return row[0]
+
+    def put(self, image_bytes, model, prompt, description):
+        key = description_cache_key(image_bytes, model, prompt)
+        with self._lock:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO descriptions (key, description, model, last_used) VALUES (?, ?, ?, ?)",
+                (key, description, model, time.time())
+            )
+            self._evict()
+            self._connection.commit()
+
+    def _evict(self):
+        count = self._connection.execute("SELECT COUNT(*) FROM descriptions").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._connection.execute(
+                "DELETE FROM descriptions WHERE key IN (SELECT key FROM descriptions ORDER BY last_used LIMIT ?)",
+                (excess,)
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM descriptions").fetchone()[0]
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self)
+        }
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
@@ -0,0 +1,65 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Function to describe a single image and measure how long it took, without letting errors escape
+def timed_describe(describe_fn, image_url):
+    start = time.perf_counter()
+    try:
+        description = describe_fn(image_url)
+        error = None
+    except Exception as e:
+        description = None
+        error = e
+    return {
+        "image_url": image_url,
+        "description": description,
+        "error": error,
+        "latency": time.perf_counter() - start
+    }
+
+
+# Function to describe all images with a bounded number of concurrent requests.
+# Results are returned in the same order as the image URLs, and a failing card only fails its own entry.
+def describe_concurrently(image_urls, describe_fn, max_workers=8):
+    if not image_urls:
+        return []
+
+    max_workers = max(1, min(max_workers, len(image_urls)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return list(executor.map(lambda url: timed_describe(describe_fn, url), image_urls))
+
+
+# Function to describe images in batches of batch_size images per request, with a bounded number of batches in
+# flight. describe_batch_fn(image_urls) returns {image_url: description} for the images it could describe; the images
+# missing from its answer (or from a batch that failed as a whole) are described one by one with describe_fn.
+# Results are returned as by describe_concurrently; the latency of a card is that of its batch, plus its retry.
+def describe_in_batches(image_urls, describe_batch_fn, describe_fn, batch_size=5, max_workers=8):
+    if not image_urls:
+        return []
+
+    def run_batch(batch):
+        start = time.perf_counter()
+        try:
+            descriptions = describe_batch_fn(batch)
+        except Exception:
+            descriptions = {}
+        latency = time.perf_counter() - start
+
+        missing = [image_url for image_url in batch if image_url not in descriptions]
+        retried = {result["image_url"]: result for result in describe_concurrently(missing, describe_fn, len(missing))}
+        results = []
+        for image_url in batch:
+            result = retried.get(image_url)
+            if result is None:
+                result = {"image_url": image_url, "description": descriptions[image_url], "error": None,
+                          "latency": latency}
+            else:
+                result = dict(result, latency=latency + result["latency"])
+            results.append(result)
+        return results
+
+    batches = [image_urls[i:i + batch_size] for i in range(0, len(image_urls), batch_size)]
+    max_workers = max(1, min(max_workers, len(batches)))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return [result for results in executor.map(run_batch, batches) for result in results]
@@ -0,0 +1,130 @@
+import time
+
+from board import other_team
+from guess_history import GuessHistory
+
+
+def silent(*args, **kwargs):
+    pass
+
+
+# Function to play one turn of a team: the hint, then the guesses until the turn or the game ends. The result dict of
+# the game is updated in place. Returns (game_over, end_turn_reason).
+def play_turn(board, current_team, give_hint, make_guesses, guess_history, result, on_reveal=None, guess_delay=0,
+              log=print, on_guessing=None):
+    # Generate a hint for the current team
+    word, number = give_hint(board, current_team)
+    log(f"Hint given by the {current_team} team: {word} {number}")
+    if on_guessing is not None:
+        on_guessing(board, current_team)
+
+    # Generate list of guesses
+    guesses_json = make_guesses(board, word, number, current_team, guess_history[current_team].render())
+    guess_history[current_team].start_hint(word, number)
+
+    guesses = 0
+    max_guesses = number + 1 if number != 0 else float('inf')
+
+    end_turn_reason = "All guesses made."
+    game_over = False
+
+    for guess in guesses_json:
+        if guesses > max_guesses:
+            end_turn_reason = "Maximum number of guesses reached."
+            break
+
+        card_number = guess['card_number']
+        reasoning = guess['reasoning']
+
+        selected_card = board.reveal(card_number)
+        if selected_card is not None:
+            selected_card_color = selected_card.card_color
+            result["guesses"] += 1
+
+            if on_reveal is not None:
+                on_reveal(board, selected_card)
+
+            log(f"Card {card_number} selected by the {current_team} team. Reasoning: {reasoning}")
+
+            if selected_card_color == 'assassin':
+                log(f"Game over! {current_team} team selected the assassin.")
+                result["assassin_picked_by"] = current_team
+                result["winner"] = other_team(current_team)
+                game_over = True
+                break
+
+            guess_history[current_team].record_pick(card_number, selected_card_color)
+
+            # Check if any team has found all their agents
+            winning_team = board.winner()
+            if winning_team is not None:
+                log(f"{winning_team} team wins! All agents found.")
+                result["winner"] = winning_team
+                game_over = True
+                break
+
+            if selected_card_color == current_team:
+                log(f"Correct guess! The {current_team} team can continue.")
+            else:
+                end_turn_reason = "Wrong guess!"
+                break  # Switch turns after a wrong guess
+
+        guesses += 1
+
+        if guess_delay:
+            time.sleep(guess_delay)
+
+    if hasattr(guesses_json, "close"):
+        guesses_json.close()
+
+    return game_over, end_turn_reason
+
+
+# Function to create the per-team guess histories and the result dict of a game
+def new_game(starting_team, guess_history_token_budget=300):
+    guess_history = {
+        "blue": GuessHistory("blue", guess_history_token_budget),
+        "red": GuessHistory("red", guess_history_token_budget)
+    }
+    result = {
+        "starting_team": starting_team,
+        "winner": None,
+        "assassin_picked_by": None,
+        "turns": 0,
+        "guesses": 0
+    }
+    return guess_history, result
+
+
+# Function to play one game on a board, from the first hint until a team wins or picks the assassin.
+# The spymaster and guessers are passed in as functions, so the same loop runs the interactive scripts and the
+# headless simulator:
+#   give_hint(board, team) -> (word, number)
+#   make_guesses(board, word, number, team, history_lines) -> [{"card_number": ..., "reasoning": ...}, ...]
+# make_guesses may also return a generator that yields the guesses while they are still being generated; it is
+# closed as soon as the turn ends, which stops the generation of the remaining guesses.
+# on_reveal(board, card) is called after every revealed card, e.g. to redraw the grid.
+# on_guessing(board, team) is called when a team starts guessing, e.g. to start the other team's spymaster work.
+# on_turn_end(board, next_team, guess_history, result) is called after every turn, e.g. to write a checkpoint.
+# A game is resumed by passing the guess_history and result of new_game from where it stopped, with starting_team
+# the team whose turn it is.
+def play_game(board, starting_team, give_hint, make_guesses, on_reveal=None, guess_delay=0,
+              guess_history_token_budget=300, max_turns=100, log=print, on_guessing=None, on_turn_end=None,
+              guess_history=None, result=None):
+    if guess_history is None:
+        guess_history, result = new_game(starting_team, guess_history_token_budget)
+
+    current_team = starting_team
+    game_over = False
+    while not game_over and result["turns"] < max_turns:
+        result["turns"] += 1
+        game_over, end_turn_reason = play_turn(board, current_team, give_hint, make_guesses, guess_history, result,
+                                               on_reveal, guess_delay, log, on_guessing)
+
+        current_team = other_team(current_team)
+        if on_turn_end is not None:
+            on_turn_end(board, current_team, guess_history, result)
+        if not game_over:
+            log(f"Switching to the {current_team} team. Reason: {end_turn_reason}")
+
+    return result
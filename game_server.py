@@ -0,0 +1,288 @@
+# Long-running game service: many games in one process, multiplexed over one pooled LLM client, one description
+# cache and one process-wide rate limiter, behind a small local HTTP API:
+#   POST   /games            {"board": "path/to/cards", "seed": 7}  create a game and describe its cards
+#   GET    /games                                                  the games and their status
+#   GET    /games/<id>                                             the state of a game
+#   POST   /games/<id>/turn                                        play the next turn of a game
+#   GET    /games/<id>/grid                                        the rendered grid of a game (PNG)
+#   DELETE /games/<id>                                             drop a game
+#   GET    /stats                                                  games in flight and throughput
+# Run it with e.g.:
+#   python game_server.py --cards path/to/cards --port 8080 --max-concurrent-calls 16
+import argparse
+import asyncio
+import contextlib
+import io
+import itertools
+import json
+import os
+import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from http import HTTPStatus
+
+import main_visual
+from board import other_team
+from board_sources import LocalBoardSource
+from description_cache import DescriptionCache
+from game_engine import new_game, play_turn
+from grid_renderer import GridRenderer
+from hedging import HedgePolicy
+from llm_backends import add_backend_arguments, configure_backend
+from openrouter_client import RateLimiter, get_rate_limiter, set_hedge_policy, set_rate_limiter
+from telemetry import call_telemetry
+
+max_turns = 100  # A game that has not ended after this many turns is stopped
+throughput_window = 60  # Seconds over which the turn rate is reported
+
+
+# One game of the service. Turns are played on a worker thread; the lock keeps the turns of a game in order.
+class Game:
+    def __init__(self, game_id, board, starting_team, seed=None):
+        self.id = game_id
+        self.board = board
+        self.seed = seed
+        self.current_team = starting_team
+        self.guess_history, self.result = new_game(starting_team, main_visual.guess_history_token_budget)
+        self.log = []
+        self.finished = False
+        self.renderer = GridRenderer()
+        self.lock = asyncio.Lock()
+        self.created = time.time()
+
+    # Play the next turn (blocking: it makes the LLM calls of the turn)
+    def play_turn(self, api_key):
+        self.result["turns"] += 1
+        game_over, end_turn_reason = play_turn(self.board, self.current_team,
+                                               partial(main_visual.give_hint, api_key=api_key),
+                                               partial(main_visual.make_guesses, api_key=api_key),
+                                               self.guess_history, self.result, log=self.log.append)
+        self.current_team = other_team(self.current_team)
+        self.finished = game_over or self.result["turns"] >= max_turns
+        if not game_over:
+            self.log.append(f"Switching to the {self.current_team} team. Reason: {end_turn_reason}")
+
+    def render_grid(self):
+        output = io.BytesIO()
+        self.renderer.render(self.board).save(output, format="PNG")
+        return output.getvalue()
+
+    def state(self):
+        return {
+            "id": self.id,
+            "seed": self.seed,
+            "finished": self.finished,
+            "current_team": None if self.finished else self.current_team,
+            "result": self.result,
+            "remaining": {color: count for color, count in self.board.remaining.items()},
+            "cards": [{"card_number": card.card_number, "card_color": card.card_color, "viewed": card.viewed,
+                       "description": card.description} for card in self.board],
+            "log": self.log
+        }
+
+
+# The game service. The blocking work of the games (describing the cards, playing turns) runs on a shared thread
+# pool, so one event loop serves the HTTP API of every game while their LLM calls are in flight.
+class GameService:
+    def __init__(self, api_key, cards_path=None, workers=32, description_cache=None):
+        self.api_key = api_key
+        self.cards_path = cards_path
+        self.description_cache = description_cache
+        self.games = {}
+        self.next_id = itertools.count(1)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="game")
+        self.started = time.monotonic()
+        self.busy = 0  # Games with a setup or turn running
+        self.games_finished = 0
+        self.turns_played = 0
+        self.recent_turns = deque()  # Completion times of the turns in the throughput window
+
+    # Run blocking game work on the thread pool
+    async def run_blocking(self, function, *args):
+        self.busy += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.executor, function, *args)
+        finally:
+            self.busy -= 1
+
+    def setup_board(self, board_path, seed):
+        rng = random.Random(seed)
+        starting_team, grid_labels = main_visual.generate_spymaster_grid_labels(rng)
+        image_urls = LocalBoardSource(board_path, board_size=len(grid_labels), rng=rng).load()
+        downloads = main_visual.card_image_downloads(image_urls)
+        descriptions = main_visual.generate_descriptions(image_urls, self.api_key, cache=self.description_cache,
+                                                         downloads=downloads)
+        board = main_visual.download_and_enrich_images(image_urls, grid_labels, descriptions, downloads)
+        main_visual.board_concept_index(board)
+        return board, starting_team
+
+    async def create_game(self, request):
+        board_path = request.get("board") or self.cards_path
+        if not board_path or not os.path.exists(board_path):
+            raise RequestError(HTTPStatus.BAD_REQUEST, "A board directory or manifest is required")
+        seed = request.get("seed")
+        board, starting_team = await self.run_blocking(self.setup_board, board_path, seed)
+        if not board:
+            raise RequestError(HTTPStatus.BAD_REQUEST, f"No card images found in {board_path}")
+        game = Game(str(next(self.next_id)), board, starting_team, seed)
+        self.games[game.id] = game
+        return game
+
+    def game(self, game_id):
+        game = self.games.get(game_id)
+        if game is None:
+            raise RequestError(HTTPStatus.NOT_FOUND, f"No game {game_id}")
+        return game
+
+    async def play_turn(self, game):
+        async with game.lock:
+            if game.finished:
+                raise RequestError(HTTPStatus.CONFLICT, f"Game {game.id} has ended")
+            await self.run_blocking(game.play_turn, self.api_key)
+            self.turns_played += 1
+            self.recent_turns.append(time.monotonic())
+            self.games_finished += game.finished
+
+    def stats(self):
+        now = time.monotonic()
+        while self.recent_turns and self.recent_turns[0] < now - throughput_window:
+            self.recent_turns.popleft()
+        window = min(throughput_window, now - self.started) or 1.0
+        calls = sum(totals.calls for totals in call_telemetry.stage_summary().values())
+        rate_limiter = get_rate_limiter()
+        return {
+            "uptime_seconds": round(now - self.started, 1),
+            "games": len(self.games),
+            "games_in_flight": sum(1 for game in self.games.values() if not game.finished),
+            "games_busy": self.busy,
+            "games_finished": self.games_finished,
+            "turns_played": self.turns_played,
+            "turns_per_second": round(len(self.recent_turns) / window, 3),
+            "llm_calls": calls,
+            "llm_calls_per_second": round(calls / max(now - self.started, 1.0), 3),
+            "llm_calls_in_flight": rate_limiter.in_flight if rate_limiter is not None else None,
+            "rate_limit_wait_seconds": round(rate_limiter.waited, 3) if rate_limiter is not None else None,
+            "description_cache": self.description_cache.stats() if self.description_cache is not None else None
+        }
+
+    # Route a request to the service; returns (status, content type, body)
+    async def route(self, method, path, body):
+        parts = [part for part in path.split("/") if part]
+        request = json.loads(body) if body else {}
+        if parts == ["stats"] and method == "GET":
+            return json_response(self.stats())
+        if parts == ["games"] and method == "POST":
+            return json_response((await self.create_game(request)).state(), HTTPStatus.CREATED)
+        if parts == ["games"] and method == "GET":
+            return json_response([{"id": game.id, "finished": game.finished, "result": game.result}
+                                  for game in self.games.values()])
+        if len(parts) >= 2 and parts[0] == "games":
+            game = self.game(parts[1])
+            if len(parts) == 2 and method == "GET":
+                return json_response(game.state())
+            if len(parts) == 2 and method == "DELETE":
+                del self.games[game.id]
+                return json_response({"id": game.id, "deleted": True})
+            if parts[2:] == ["turn"] and method == "POST":
+                await self.play_turn(game)
+                return json_response(game.state())
+            if parts[2:] == ["grid"] and method == "GET":
+                async with game.lock:
+                    return HTTPStatus.OK, "image/png", await self.run_blocking(game.render_grid)
+        raise RequestError(HTTPStatus.NOT_FOUND, f"No route for {method} {path}")
+
+    async def handle_connection(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, target, _ = request_line.decode("latin-1").split(" ", 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b"\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length") or 0))
+
+            try:
+                status, content_type, payload = await self.route(method, target.split("?", 1)[0], body)
+            except RequestError as e:
+                status, content_type, payload = json_response({"error": e.message}, e.status)
+            except ValueError as e:
+                status, content_type, payload = json_response({"error": f"Invalid request: {e}"},
+                                                              HTTPStatus.BAD_REQUEST)
+            except Exception as e:
+                print(f"{method} {target} failed: {e!r}", file=sys.stderr)
+                status, content_type, payload = json_response({"error": str(e)}, HTTPStatus.INTERNAL_SERVER_ERROR)
+
+            writer.write(f"HTTP/1.1 {status.value} {status.phrase}\r\nContent-Type: {content_type}\r\n"
+                         f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("latin-1") + payload)
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass  # The client went away or sent garbage
+        finally:
+            writer.close()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class RequestError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def json_response(body, status=HTTPStatus.OK):
+    return status, "application/json", json.dumps(body).encode("utf-8")
+
+
+async def serve(service, host, port):
+    server = await asyncio.start_server(service.handle_connection, host, port)
+    print(f"Serving games on http://{host}:{port}", file=sys.stderr)
+    async with server:
+        await server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--cards", help="Default directory or JSON manifest of card images for new games")
+    parser.add_argument("--workers", type=int, default=32, help="Threads for the blocking game work")
+    parser.add_argument("--max-concurrent-calls", type=int, default=16,
+                        help="Maximum number of LLM calls in flight over all games")
+    parser.add_argument("--calls-per-second", type=float, help="Maximum average rate of LLM calls over all games")
+    parser.add_argument("--verbose", action="store_true", help="Print the console output of the games")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+
+    api_key = configure_backend(args, main_visual.fetch_api_key)
+    call_telemetry.stream_to(main_visual.telemetry_path)
+    set_hedge_policy(HedgePolicy(main_visual.fallback_models, main_visual.hedge_deadlines,
+                                 main_visual.hedge_min_samples, main_visual.hedge_min_delay))
+    set_rate_limiter(RateLimiter(rate=args.calls_per_second, max_concurrent=args.max_concurrent_calls))
+    description_cache = DescriptionCache(main_visual.description_cache_path, main_visual.description_cache_max_entries)
+
+    # The games share the console, so their output is only shown on request; the service itself logs to stderr
+    service = GameService(api_key, args.cards, args.workers, description_cache)
+    try:
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(sys.stdout if args.verbose else devnull):
+            asyncio.run(serve(service, args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.shutdown()
+        call_telemetry.write_prometheus(main_visual.telemetry_snapshot_path)
+        call_telemetry.close()
+        description_cache.close()
+
+
+if __name__ == "__main__":
+    main()
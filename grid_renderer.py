@@ -0,0 +1,66 @@
+from io import BytesIO
+
+from PIL import Image, ImageDraw, ImageFont
+
+card_colors = {
+    'blue': 'blue',
+    'red': 'red',
+    'neutral': 'yellow',
+    'assassin': 'black'
+}
+
+
+# Persistent renderer for the game grid. Every card is decoded and resized once, the composed canvas is kept
+# between calls, and only tiles whose state changed since the last render are redrawn.
+class GridRenderer:
+    def __init__(self, grid_size=5, image_size=200, margin=10):
+        self.grid_size = grid_size
+        self.image_size = image_size
+        self.margin = margin
+        self.font = ImageFont.load_default()
+        self.canvas = Image.new('RGB', (
+            grid_size * (image_size + margin) + margin,
+            grid_size * (image_size + margin) + margin
+        ), 'white')
+        self.draw = ImageDraw.Draw(self.canvas)
+        self.overlay = Image.new('RGBA', (image_size, image_size), (0, 0, 0, 128))
+        self.thumbnails = {}  # tile index -> (image bytes, thumbnail)
+        self.tile_states = {}  # tile index -> state the tile was last drawn with
+
+    def thumbnail(self, index, image_bytes):
+        cached = self.thumbnails.get(index)
+        if cached is not None and cached[0] is image_bytes:
+            return cached[1]
+        thumbnail = Image.open(BytesIO(image_bytes)).convert('RGB').resize((self.image_size, self.image_size))
+        self.thumbnails[index] = (image_bytes, thumbnail)
+        return thumbnail
+
+    def tile_position(self, index):
+        row = index // self.grid_size
+        col = index % self.grid_size
+        return (col * (self.image_size + self.margin) + self.margin,
+                row * (self.image_size + self.margin) + self.margin)
+
+    def draw_tile(self, index, img_data):
+        x, y = self.tile_position(index)
+        self.canvas.paste(self.thumbnail(index, img_data['image_bytes']), (x, y))
+
+        # Draw the number on the image
+        self.draw.text((x + 10, y + 10), str(img_data['card_number']), fill='black', font=self.font)
+
+        # Draw the circle for the color
+        color = card_colors[img_data['card_color']]
+        self.draw.ellipse([(x + self.image_size - 20, y + 10), (x + self.image_size - 10, y + 20)], fill=color)
+
+        # Draw overlay if viewed
+        if img_data['viewed']:
+            self.canvas.paste(self.overlay, (x, y), self.overlay)
+
+    # Redraw the tiles that changed since the previous call and return the composed canvas
+    def render(self, images):
+        for index, img_data in enumerate(images):
+            state = (id(img_data['image_bytes']), img_data['card_number'], img_data['card_color'], img_data['viewed'])
+            if self.tile_states.get(index) != state:
+                self.draw_tile(index, img_data)
+                self.tile_states[index] = state
+        return self.canvas
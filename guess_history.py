@@ -0,0 +1,92 @@
+# Rough token estimate for prompt budgeting (about four characters per token for English text)
+def estimate_tokens(text):
+    return (len(text) + 3) // 4
+
+
+# A card picked for a hint and the colour it turned out to be
+class PickRecord:
+    __slots__ = ('card_number', 'card_color')
+
+    def __init__(self, card_number, card_color):
+        self.card_number = card_number
+        self.card_color = card_color
+
+
+# A hint the team received and the cards it picked for it
+class HintRecord:
+    __slots__ = ('word', 'number', 'team', 'picks')
+
+    def __init__(self, word, number, team):
+        self.word = word
+        self.number = number
+        self.team = team
+        self.picks = []
+
+    def found(self):
+        return sum(1 for pick in self.picks if pick.card_color == self.team)
+
+    # A hint is resolved once all of its cards have been found; hints with number 0 never point at cards to find
+    def resolved(self):
+        return self.found() >= self.number
+
+    def render(self):
+        picks = ", ".join(f"card {pick.card_number} ({pick.card_color})" for pick in self.picks) or "no cards"
+        remaining = self.number - self.found()
+        return (f"Hint '{self.word} {self.number}': picked {picks}. "
+                f"{remaining} card{'s' if remaining != 1 else ''} for this hint may still be unguessed.")
+
+
+# Compact guess history for one team. Outcomes are stored as structured records instead of sentences with the
+# model's reasoning, resolved hints are left out of the prompt, and the rendered history stays within a token budget.
+class GuessHistory:
+    def __init__(self, team, token_budget=300):
+        self.team = team
+        self.token_budget = token_budget
+        self.hints = []
+
+    def start_hint(self, word, number):
+        record = HintRecord(word, number, self.team)
+        self.hints.append(record)
+        return record
+
+    def record_pick(self, card_number, card_color):
+        if self.hints:
+            self.hints[-1].picks.append(PickRecord(card_number, card_color))
+
+    def open_hints(self):
+        return [hint for hint in self.hints if not hint.resolved()]
+
+    # Render the open hints as prompt lines, newest first, summarizing the oldest ones when over the token budget
+    def render(self):
+        lines = []
+        used = 0
+        open_hints = self.open_hints()
+        for i, hint in enumerate(reversed(open_hints)):
+            line = hint.render()
+            if used + estimate_tokens(line) > self.token_budget:
+                older = open_hints[:len(open_hints) - i]
+                summary = ", ".join(f"'{hint.word}' ({hint.number - hint.found()} left)" for hint in older[-10:])
+                if len(older) > 10:
+                    summary += f" and {len(older) - 10} more"
+                lines.append(f"Older hints that may still have unguessed cards: {summary}.")
+                break
+            lines.append(line)
+            used += estimate_tokens(line)
+        return list(reversed(lines))
+
+    def __len__(self):
+        return len(self.hints)
+
+    def to_dict(self):
+        return {"team": self.team, "token_budget": self.token_budget,
+                "hints": [{"word": hint.word, "number": hint.number,
+                           "picks": [[pick.card_number, pick.card_color] for pick in hint.picks]}
+                          for hint in self.hints]}
+
+    @classmethod
+    def from_dict(cls, data):
+        history = cls(data["team"], data["token_budget"])
+        for hint in data["hints"]:
+            record = history.start_hint(hint["word"], hint["number"])
+            record.picks = [PickRecord(card_number, card_color) for card_number, card_color in hint["picks"]]
+        return history
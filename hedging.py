@@ -0,0 +1,120 @@
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from telemetry import call_telemetry
+
+_call_context = threading.local()
+
+
+# Function to check, from inside a call, whether the hedge it belongs to has already been decided. Backends check it
+# between attempts and while an answer arrives, and abort the losing call: the OpenRouter client streams hedged calls
+# and closes the stream, which stops the generation. A request still waiting for its response to start cannot be
+# aborted; it is dropped as soon as the response starts.
+def call_cancelled():
+    cancel_event = getattr(_call_context, "cancel_event", None)
+    return cancel_event is not None and cancel_event.is_set()
+
+
+# Function to check whether the current call is part of a hedge, and so may be cancelled
+def in_hedged_call():
+    return getattr(_call_context, "cancel_event", None) is not None
+
+
+# Function to sleep inside a call, waking up early when the hedge it belongs to is decided
+def cancellable_sleep(seconds):
+    cancel_event = getattr(_call_context, "cancel_event", None)
+    if cancel_event is None:
+        time.sleep(seconds)
+    else:
+        cancel_event.wait(seconds)
+
+
+# Function to mark, from inside a call, that its request is about to go out (after waiting for the rate limiter, if
+# any). The hedge deadline of the call counts from here.
+def mark_call_started():
+    started = getattr(_call_context, "started", None)
+    if started is not None:
+        started.set()
+
+
+def run_cancellable(cancel_event, started, function, *args):
+    _call_context.cancel_event = cancel_event
+    _call_context.started = started
+    try:
+        return function(*args)
+    finally:
+        _call_context.cancel_event = None
+        _call_context.started = None
+
+
+# Hedged requests per stage: when a call is still running after the stage's deadline, a duplicate request goes to the
+# stage's fallback model and the first good answer wins. The deadline is the configured one for the stage, or else the
+# p95 latency observed for the stage and model so far (once there are min_samples calls to go by), but at least
+# min_delay seconds. The deadline counts from the moment the request goes out (see mark_call_started), not from when
+# the call was queued on the executor or waited for the rate limiter, so a busy process does not cause hedges. The
+# losing call is cancelled (see call_cancelled).
+class HedgePolicy:
+    def __init__(self, fallback_models, deadlines=None, min_samples=10, min_delay=0.5, max_workers=32,
+                 telemetry=call_telemetry):
+        self.fallback_models = fallback_models
+        self.deadlines = deadlines or {}
+        self.min_samples = min_samples
+        self.min_delay = min_delay
+        self.telemetry = telemetry
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    def hedge_delay(self, stage, model):
+        if stage in self.deadlines:
+            return self.deadlines[stage]
+        p95 = self.telemetry.latency_percentile(stage, model, 0.95, self.min_samples)
+        return max(p95, self.min_delay) if p95 is not None else None
+
+    # Make a call with send(model, hedge) -> result or None, hedging it to the fallback model when it is slow. send
+    # calls mark_call_started() when its request is about to go out.
+    def call(self, send, stage, model):
+        fallback_model = self.fallback_models.get(stage)
+        delay = self.hedge_delay(stage, model) if fallback_model and fallback_model != model else None
+        if delay is None:
+            return send(model, False)
+
+        cancel_events = {}
+        primary_cancel, primary_started = threading.Event(), threading.Event()
+        primary = self._executor.submit(run_cancellable, primary_cancel, primary_started, send, model, False)
+        primary.add_done_callback(lambda _: primary_started.set())  # Also wakes the wait below if it never started
+        cancel_events[primary] = primary_cancel
+        primary_started.wait()
+        wait([primary], timeout=delay)
+        if primary.done():
+            return primary.result()
+
+        hedge_cancel = threading.Event()
+        hedge = self._executor.submit(run_cancellable, hedge_cancel, threading.Event(), send, fallback_model, True)
+        cancel_events[hedge] = hedge_cancel
+        print(f"[{stage}] {model} is slower than {delay:.2f}s, hedging with {fallback_model}")
+
+        # Take the first good answer; a failed call leaves the other one to finish
+        pending = set(cancel_events)
+        result, winner, error = None, None, None
+        while pending and result is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    answer = future.result()
+                except Exception as e:
+                    error = e
+                    continue
+                if answer is not None and result is None:
+                    result, winner = answer, future
+
+        for future in pending:
+            cancel_events[future].set()
+            future.cancel()
+        self.telemetry.record_hedge(stage, model, fallback_model, delay, won=winner is hedge)
+
+        if result is None and error is not None:
+            raise error
+        return result
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
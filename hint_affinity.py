@@ -0,0 +1,152 @@
+import re
+
+import numpy as np
+
+WORD_PATTERN = re.compile(r"[a-z]+")
+STOP_WORDS = frozenset("""
+    a about above across after again against all almost along also although always among an and another any are
+    around as at away be because been before behind being below beside between both but by can could down during each
+    either else every few for from front further has have having her here his how however if in into is it its itself
+    just large left less like many may more most much near next no nor not of off on one onto or other our out over own
+    perhaps right same seems several she should side small so some something such than that the their them then there
+    these they this those three through to together too top two under up upon very was were what when where which
+    while who whose why will with within without would you your
+    appears background center image picture scene shows shown showing visible depicted features""".split())
+
+
+# Crude suffix stripping, so that e.g. 'dogs' and 'dog' or 'flying' and 'fly' share a term
+def stem(word):
+    for suffix, replacement in (("ies", "y"), ("ing", ""), ("ed", ""), ("es", ""), ("s", "")):
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3 and not word.endswith("ss"):
+            return word[:len(word) - len(suffix)] + replacement
+    return word
+
+
+def tokenize(text):
+    return [word for word in WORD_PATTERN.findall(text.lower()) if len(word) > 2 and word not in STOP_WORDS]
+
+
+# Function to load word vectors from a GloVe-style text file (a word followed by its vector on every line). Only the
+# first max_words words are kept; the files are sorted by word frequency.
+def load_word_vectors(path, max_words=50000):
+    words, vectors = [], []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            parts = line.rstrip().split(" ")
+            if len(parts) < 3:
+                continue
+            words.append(parts[0])
+            vectors.append(np.asarray(parts[1:], dtype=np.float32))
+            if len(words) >= max_words:
+                break
+    return words, np.vstack(vectors)
+
+
+def normalize_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1, norms)
+
+
+# Local hint scorer for one board. The card descriptions are embedded once: as TF-IDF vectors over the board's own
+# vocabulary, or, with word vectors, as the TF-IDF weighted average of their word vectors. Candidate hint words are
+# embedded in a batch, and one matrix product gives the hint x card cosine similarity, from which the coverage of the
+# team's cards and the risk of the other cards are derived for every candidate at once.
+class HintAffinity:
+    def __init__(self, cards, word_vectors=None, vocabulary_size=2000):
+        self.card_numbers = [card.card_number for card in cards]
+        self.card_index = {card_number: i for i, card_number in enumerate(self.card_numbers)}
+
+        documents = [tokenize(card.description or "") for card in cards]
+        self.surface_forms = {}  # Term -> the first word it was seen as, to give hints as real words
+        for document in documents:
+            for word in document:
+                self.surface_forms.setdefault(stem(word), word)
+        self.terms = sorted(self.surface_forms)
+        self.term_index = {term: i for i, term in enumerate(self.terms)}
+
+        counts = np.zeros((len(cards), len(self.terms)), dtype=np.float32)
+        for i, document in enumerate(documents):
+            for word in document:
+                counts[i, self.term_index[stem(word)]] += 1
+        document_frequency = (counts > 0).sum(axis=0)
+        self.idf = np.log((1 + len(cards)) / (1 + document_frequency)).astype(np.float32) + 1
+        tfidf = normalize_rows(counts * self.idf)
+
+        self.word_vectors = None
+        self.vocabulary = []
+        if word_vectors is not None:
+            words, vectors = word_vectors
+            self.word_vectors = (normalize_rows(vectors), {word: i for i, word in enumerate(words)})
+            self.vocabulary = tokenize(" ".join(word for word in words[:vocabulary_size] if word.isalpha()))
+            term_vectors = self.embed_words([self.surface_forms[term] for term in self.terms])
+            self.card_matrix = normalize_rows(tfidf @ term_vectors)
+        else:
+            self.card_matrix = tfidf
+
+    # Embed a batch of words as the rows of a matrix; unknown words get a zero row
+    def embed_words(self, words):
+        if self.word_vectors is not None:
+            vectors, index = self.word_vectors
+            rows = [index.get(word.lower(), index.get(stem(word.lower()))) for word in words]
+            embedded = np.zeros((len(words), vectors.shape[1]), dtype=np.float32)
+            known = [i for i, row in enumerate(rows) if row is not None]
+            embedded[known] = vectors[[rows[i] for i in known]]
+            return embedded
+
+        embedded = np.zeros((len(words), len(self.terms)), dtype=np.float32)
+        for i, word in enumerate(words):
+            column = self.term_index.get(stem(word.lower()))
+            if column is not None:
+                embedded[i, column] = 1.0
+        return embedded
+
+    def similarity(self, words):
+        return self.embed_words(words) @ self.card_matrix.T
+
+    # Similarity of one word to each of the given cards
+    def card_similarity(self, word, cards):
+        return self.similarity([word])[0, [self.card_index[card.card_number] for card in cards]]
+
+    # Candidate hint words: the words of the descriptions of the team's cards, plus the most frequent words of the
+    # word vectors when there are any
+    def candidate_words(self, partition):
+        words = [self.surface_forms[stem(word)] for card in partition.current_team
+                 for word in tokenize(card.description or "")]
+        return list(dict.fromkeys(words + self.vocabulary))
+
+    # Rank candidate hint words for a team. A word covers the team cards that are more similar to it than every
+    # card to avoid, since guessers pick the most similar cards first; its score is the number of covered cards plus
+    # their margins, minus the weighted similarity of the closest card of each kind to avoid.
+    def rank(self, words, partition, min_similarity=0.05, assassin_weight=3.0, other_weight=1.0, neutral_weight=0.5):
+        groups = {name: [self.card_index[card.card_number] for card in getattr(partition, name)]
+                  for name in ("current_team", "other_team", "neutral", "assassin")}
+        if not words or not groups["current_team"]:
+            return []
+        similarity = self.similarity(words)
+
+        def closest(name):
+            columns = groups[name]
+            return similarity[:, columns].max(axis=1) if columns else np.zeros(len(words), dtype=np.float32)
+
+        assassin, other, neutral = closest("assassin"), closest("other_team"), closest("neutral")
+        avoid = np.maximum(np.maximum(assassin, other), neutral)
+        team = similarity[:, groups["current_team"]]
+        covered = (team > avoid[:, None]) & (team > min_similarity)
+        number = covered.sum(axis=1)
+        score = (number - assassin_weight * assassin - other_weight * other - neutral_weight * neutral
+                 + np.where(covered, team - avoid[:, None], 0).sum(axis=1))
+
+        ranked = []
+        for i in np.argsort(-score):
+            if number[i] == 0:
+                continue
+            ranked.append({
+                "word": words[i],
+                "number": int(number[i]),
+                "score": float(score[i]),
+                "cards": [partition.current_team[j].card_number for j in np.flatnonzero(covered[i])],
+                "assassin_risk": float(assassin[i]),
+                "other_team_risk": float(other[i]),
+                "neutral_risk": float(neutral[i])
+            })
+        return ranked
@@ -0,0 +1,38 @@
+import math
+from io import BytesIO
+
+from PIL import Image
+
+
+def image_size(image_bytes):
+    with Image.open(BytesIO(image_bytes)) as image:
+        return image.size
+
+
+# Function to downscale a card image so that its longest side is at most max_size pixels, and recompress it as a JPEG
+# of the given quality. Images are never scaled up, and the original bytes are kept when they are already smaller
+# than the result (or when max_size is None).
+def preprocess_image(image_bytes, max_size=768, quality=85):
+    if max_size is None:
+        return image_bytes
+    with Image.open(BytesIO(image_bytes)) as image:
+        image = image.convert('RGB')
+        if max(image.size) > max_size:
+            scale = max_size / max(image.size)
+            image = image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                                 Image.LANCZOS)
+        output = BytesIO()
+        image.save(output, format='JPEG', quality=quality, optimize=True)
+    processed = output.getvalue()
+    return processed if len(processed) < len(image_bytes) else image_bytes
+
+
+# Function to estimate the vision tokens of an image, by OpenAI's rule for high-detail images: the image is fitted in
+# 2048x2048, its shortest side is scaled down to 768, and every 512x512 tile costs 170 tokens on top of 85. Other
+# providers count differently, but their counts also grow with the resolution.
+def estimate_vision_tokens(width, height):
+    scale = min(1.0, 2048 / max(width, height))
+    width, height = width * scale, height * scale
+    scale = min(1.0, 768 / min(width, height))
+    width, height = width * scale, height * scale
+    return 85 + 170 * math.ceil(width / 512) * math.ceil(height / 512)
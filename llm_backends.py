@@ -0,0 +1,333 @@
+import gzip
+import hashlib
+import json
+import random
+import re
+import threading
+import time
+
+from hedging import call_cancelled, cancellable_sleep
+from openrouter_client import get_client, set_backend
+
+# Words the stub backend uses to describe cards and to give hints
+STUB_VOCABULARY = [
+    "anchor", "apple", "balloon", "bicycle", "bird", "book", "bridge", "candle", "castle", "cat", "clock", "cloud",
+    "crown", "desert", "dog", "dragon", "drum", "egg", "feather", "fire", "fish", "flower", "forest", "ghost",
+    "guitar", "hat", "heart", "horse", "ice", "island", "key", "kite", "ladder", "lamp", "leaf", "lion", "map",
+    "mask", "moon", "mountain", "mushroom", "ocean", "owl", "piano", "pirate", "planet", "rain", "robot", "rocket",
+    "rope", "ship", "snake", "snow", "spider", "star", "sun", "sword", "train", "tree", "umbrella", "wheel", "window"
+]
+
+SECTION_HEADINGS = (
+    ("other", re.compile(r"^\s*other team images", re.IGNORECASE)),
+    ("neutral", re.compile(r"^\s*neutral images", re.IGNORECASE)),
+    ("assassin", re.compile(r"^\s*assassin image", re.IGNORECASE)),
+    ("current", re.compile(r"^\s*current team images", re.IGNORECASE)),
+    ("unviewed", re.compile(r"^\s*images descriptions", re.IGNORECASE))
+)
+CARD_LINE_PATTERN = re.compile(r"^\s*Card (\d+):\s*(.*)$")
+GUESS_HINT_PATTERN = re.compile(r"hint [\"']([^\"'\n]+?) (\d+)[\"']")
+SCORED_HINT_PATTERN = re.compile(r"Hint: (.+)")
+STUB_HINT_PATTERN = re.compile(r"\b([A-Za-z]+) (\d+)\b")
+
+
+# Function to get all the text of a list of chat messages, and the image URLs they contain
+def message_text(messages):
+    texts, image_urls = [], []
+    for message in messages:
+        content = message["content"]
+        if isinstance(content, str):
+            texts.append(content)
+            continue
+        for part in content:
+            if part.get("type") == "text":
+                texts.append(part["text"])
+            elif part.get("type") == "image_url":
+                image_urls.append(part["image_url"]["url"])
+    return "\n".join(texts), image_urls
+
+
+# Function to split the board sections of a prompt into (card number, description) pairs per section.
+# A section runs from its heading to the next heading or blank line; card numbers are None when the prompt
+# lists bare descriptions.
+def parse_board_sections(text):
+    sections = {}
+    current = None
+    for line in text.splitlines():
+        heading = next((name for name, pattern in SECTION_HEADINGS if pattern.match(line)), None)
+        if heading is not None:
+            current = heading
+            sections.setdefault(current, [])
+        elif not line.strip():
+            current = None
+        elif current is not None:
+            match = CARD_LINE_PATTERN.match(line)
+            if match:
+                sections[current].append((int(match.group(1)), match.group(2)))
+            else:
+                sections[current].append((None, line.strip()))
+    return sections
+
+
+def words_in(description):
+    return set(re.findall(r"[a-z]+", description.lower()))
+
+
+def completion(content, prompt_tokens=0, completion_tokens=0):
+    return {
+        "choices": [{"message": {"role": "assistant", "content": content}}],
+        "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens}
+    }
+
+
+# Offline stand-in for the LLM provider. Cards are described with a few words from a fixed vocabulary (derived from
+# the image, so descriptions are stable), the spymaster hints the word shared by most of its team's cards while
+# avoiding the others, and the guessers pick the cards whose description contains the hint. Answers follow the
+# requested JSON schema, so a whole game runs without network access. latency adds a simulated delay per call,
+# stage_latency overrides it for individual stages ({"describe": 1.5, ...}), and image_latency is added per image in
+# the request. Streamed answers arrive in pieces of chunk_size characters, chunk_latency apart.
+class StubBackend:
+    def __init__(self, latency=0.0, jitter=0.0, seed=0, stage_latency=None, chunk_size=16, chunk_latency=0.0,
+                 image_latency=0.0):
+        self.latency = latency
+        self.image_latency = image_latency
+        self.jitter = jitter
+        self.seed = seed
+        self.stage_latency = stage_latency or {}
+        self.chunk_size = chunk_size
+        self.chunk_latency = chunk_latency
+        self.calls = 0
+        self._last_stream = threading.local()
+
+    def chat_completion(self, model, messages, stage="default", **request_fields):
+        self.calls += 1
+        text, image_urls = message_text(messages)
+        latency = self.stage_latency.get(stage, self.latency) + self.image_latency * len(image_urls)
+        if latency or self.jitter:
+            cancellable_sleep(max(0.0, latency + random.uniform(-self.jitter, self.jitter)))
+            if call_cancelled():
+                return None  # Aborted like a real losing hedge call
+
+        schema_name = (request_fields.get("response_format") or {}).get("json_schema", {}).get("name")
+        prompt_tokens = (len(text) + 3) // 4 + 85 * len(image_urls)
+
+        if stage == "describe" and schema_name == "card_descriptions":
+            content = json.dumps({"descriptions": [{"card_id": card_id, "description": self.describe(image_url)}
+                                                   for card_id, image_url in enumerate(image_urls, start=1)]})
+        elif stage == "describe":
+            content = self.describe(image_urls[0] if image_urls else text)
+        elif stage == "associations":
+            content = self.associations(text)
+        elif stage == "hint":
+            content = self.hint(text, schema_name, request_fields.get("seed"), request_fields.get("temperature"))
+        elif stage == "score":
+            content = self.score(text)
+        elif stage == "guesses":
+            content = self.guesses(text)
+        else:
+            content = self.convert(text)
+        return completion(content, prompt_tokens, (len(content) + 3) // 4)
+
+    def stream_chat_completion(self, model, messages, stage="default", **request_fields):
+        result = self.chat_completion(model, messages, stage=stage, **request_fields)
+        self._last_stream.usage = None
+        content = result["choices"][0]["message"]["content"]
+        for i in range(0, len(content), self.chunk_size):
+            if self.chunk_latency and i:
+                time.sleep(self.chunk_latency)
+            yield content[i:i + self.chunk_size]
+        self._last_stream.usage = result["usage"]
+
+    def last_stream_usage(self):
+        return getattr(self._last_stream, "usage", None)
+
+    def describe(self, image_url):
+        digest = hashlib.sha256(f"{self.seed}:{image_url}".encode("utf-8")).digest()
+        rng = random.Random(digest)
+        words = rng.sample(STUB_VOCABULARY, 3)
+        return f"A picture showing a {words[0]}, a {words[1]} and a {words[2]}."
+
+    # Score every vocabulary word by how many team cards it covers, minus the risk of the cards to avoid
+    def rank_hint_words(self, sections):
+        counts = {}
+        for name in ("current", "other", "neutral", "assassin"):
+            for _, description in sections.get(name, []):
+                for word in words_in(description) & set(STUB_VOCABULARY):
+                    counts.setdefault(word, {}).setdefault(name, 0)
+                    counts[word][name] += 1
+
+        ranked = []
+        for word, count in counts.items():
+            own = count.get("current", 0)
+            if own == 0:
+                continue
+            risk = 10 * count.get("assassin", 0) + 2 * count.get("other", 0) + count.get("neutral", 0)
+            ranked.append((own - risk, own, word))
+        ranked.sort(reverse=True)
+        return ranked, counts
+
+    def associations(self, text):
+        ranked, _ = self.rank_hint_words(parse_board_sections(text))
+        return "Associations to aim for: " + ", ".join(word for _, _, word in ranked[:5])
+
+    def hint(self, text, schema_name, seed, temperature):
+        ranked, _ = self.rank_hint_words(parse_board_sections(text))
+        if ranked:
+            # Higher temperatures (and other seeds) pick among more of the top-ranked words
+            top = ranked[:1 + int(2 * (temperature or 0))]
+            _, own, word = random.Random(f"{self.seed}:{seed}").choice(top)
+        else:
+            word, own = STUB_VOCABULARY[0], 1
+        word = word.capitalize()
+        if schema_name == "hint":
+            return json.dumps({"brainstorm": f"{word} covers {own} cards.", "hint": word, "number": own,
+                               "reasoning": f"{word} links {own} of our cards."})
+        return f"Hint: {word} {own}"
+
+    def score(self, text):
+        match = SCORED_HINT_PATTERN.search(text)
+        hint = STUB_HINT_PATTERN.search(match.group(1)) if match else None
+        word, number = (hint.group(1), int(hint.group(2))) if hint else ("", 0)
+
+        sections = parse_board_sections(text)
+        _, counts = self.rank_hint_words(sections)
+        count = counts.get(word.lower(), {})
+        risk = 10 * count.get("assassin", 0) + 2 * count.get("other", 0) + count.get("neutral", 0)
+        general_score = max(1.0, min(10.0, 2.0 * count.get("current", 0) - risk + 2))
+        card_scores = [{"card_number": card_number, "score": 9 if word.lower() in words_in(description) else 1}
+                       for name in ("other", "neutral", "assassin", "current")
+                       for card_number, description in sections.get(name, []) if card_number is not None]
+        return json.dumps({"card_scores": card_scores, "word": word, "number": number, "general_score": general_score,
+                           "reasoning": f"{word} covers {count.get('current', 0)} team cards with risk {risk}."})
+
+    def guesses(self, text):
+        match = GUESS_HINT_PATTERN.search(text)
+        word, number = (match.group(1).lower(), int(match.group(2))) if match else ("", 0)
+        cards = parse_board_sections(text).get("unviewed", [])
+        picks = [(card_number, description) for card_number, description in cards
+                 if card_number is not None and word in words_in(description)]
+        if number:
+            picks = picks[:number]
+        return json.dumps({"analysis": f"Cards mentioning {word}.", "guesses": [
+            {"card_number": card_number, "reasoning": f"The picture shows a {word}."} for card_number, _ in picks
+        ]})
+
+    def convert(self, text):
+        if "JSON list" in text:
+            return "[]"
+        return json.dumps({"hint": "", "word": "", "number": 0, "reasoning": "", "general_score": 0})
+
+
+# Function to compute the cassette key of a request: a hash of the model, the messages and the request options
+def request_key(model, messages, request_fields):
+    payload = json.dumps({"model": model, "messages": messages, "options": request_fields}, sort_keys=True,
+                         separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:32]
+
+
+def open_cassette(path, mode):
+    if str(path).endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+# Function to load a cassette: one JSON entry per line, with the request key, stage, model and response
+def load_cassette(path):
+    entries = {}
+    with open_cassette(path, "r") as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                entries.setdefault(entry["key"], []).append(entry)
+    return entries
+
+
+# Backend that passes every request on to another backend and appends the request/response pairs to a cassette
+class RecordingBackend:
+    def __init__(self, backend, path):
+        self.backend = backend
+        self.path = path
+        self._lock = threading.Lock()
+
+    def chat_completion(self, model, messages, stage="default", **request_fields):
+        start = time.perf_counter()
+        response = self.backend.chat_completion(model, messages, stage=stage, **request_fields)
+        if response is not None:
+            entry = {"key": request_key(model, messages, request_fields), "stage": stage, "model": model,
+                     "seconds": round(time.perf_counter() - start, 3), "response": response}
+            with self._lock, open_cassette(self.path, "a") as f:
+                f.write(json.dumps(entry, separators=(",", ":")) + "\n")
+        return response
+
+    def last_call_stats(self):
+        return self.backend.last_call_stats() if hasattr(self.backend, "last_call_stats") else {}
+
+
+# Backend that serves responses from a cassette. Requests that were recorded more than once get their responses in
+# recording order. latency simulates a fixed delay per call; use_recorded_latency replays the recorded durations.
+class ReplayBackend:
+    def __init__(self, path, latency=0.0, use_recorded_latency=False):
+        self.entries = load_cassette(path)
+        self.latency = latency
+        self.use_recorded_latency = use_recorded_latency
+        self.hits = 0
+        self.misses = 0
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    def chat_completion(self, model, messages, stage="default", **request_fields):
+        key = request_key(model, messages, request_fields)
+        with self._lock:
+            recorded = self.entries.get(key)
+            if not recorded:
+                self.misses += 1
+                print(f"[{stage}] No recorded response for this {model} request")
+                return None
+            self.hits += 1
+            position = self._positions.get(key, 0)
+            self._positions[key] = position + 1
+            entry = recorded[position % len(recorded)]
+
+        delay = entry.get("seconds", 0.0) if self.use_recorded_latency else self.latency
+        if delay:
+            cancellable_sleep(delay)
+            if call_cancelled():
+                return None
+        return entry["response"]
+
+
+# Function to add the LLM backend options to a script's command line
+def add_backend_arguments(parser):
+    parser.add_argument("--record", metavar="CASSETTE", help="Record every LLM request and response to a cassette file")
+    parser.add_argument("--replay", metavar="CASSETTE", help="Serve LLM responses from a cassette file instead of the API")
+    parser.add_argument("--replay-latency", type=float, default=0.0, help="Simulated latency per replayed call")
+    parser.add_argument("--stub", action="store_true", help="Answer LLM requests with the offline stub backend")
+    parser.add_argument("--llm-url", help="Send chat completions to this OpenAI-compatible endpoint instead")
+    parser.add_argument("--seed", type=int, help="Seed the board and label randomness, for reproducible games")
+
+
+# Function to set up the backend selected on the command line and return the API key to use. The OpenRouter API key
+# is only loaded when requests actually go to OpenRouter.
+def configure_backend(args, fetch_api_key):
+    if args.seed is not None:
+        random.seed(args.seed)
+
+    api_key = "offline"
+    backend = None
+    if args.replay:
+        backend = ReplayBackend(args.replay, latency=args.replay_latency)
+    elif args.stub:
+        backend = StubBackend()
+    elif args.llm_url:
+        # The shared client, pointed at the other endpoint, so every call still uses its connection pool
+        backend = get_client(api_key)
+        backend.url = args.llm_url
+    else:
+        api_key = fetch_api_key()
+        if args.record:
+            backend = get_client(api_key)
+
+    if args.record and not args.replay:
+        backend = RecordingBackend(backend, args.record)
+    set_backend(backend)
+    return api_key
@@ -0,0 +1,118 @@
+# Stand-in for an OpenAI-compatible chat completions endpoint, serving canned responses from a cassette or the
+# offline stub backend. Run it with e.g.:
+#   python llm_server.py --replay game.jsonl.gz --port 8000
+# and point a game at it with:
+#   python main_visual.py --llm-url http://127.0.0.1:8000/v1/chat/completions
+import argparse
+import json
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from llm_backends import ReplayBackend, StubBackend, message_text
+
+CHAT_COMPLETION_PATHS = ("/v1/chat/completions", "/api/v1/chat/completions")
+
+# Stage of the structured-output requests, by the name of their JSON schema
+SCHEMA_STAGES = {"hint": "hint", "hint_evaluation": "score", "guesses": "guesses"}
+
+
+# Function to work out which pipeline stage a request comes from. The stub answers per stage, but the stage is not
+# part of the HTTP request, so it is taken from the images, the JSON schema or the instructions of the last message.
+def infer_stage(messages, request_fields):
+    _, image_urls = message_text(messages)
+    if image_urls:
+        return "describe"
+    schema_name = (request_fields.get("response_format") or {}).get("json_schema", {}).get("name")
+    if schema_name in SCHEMA_STAGES:
+        return SCHEMA_STAGES[schema_name]
+    last_text, _ = message_text(messages[-1:])
+    if "Create two lists of associations" in last_text:
+        return "associations"
+    if "generate a possible hint" in last_text:
+        return "hint"
+    return "json_conversion"
+
+
+def make_handler(backend):
+    class ChatCompletionHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            if self.path not in CHAT_COMPLETION_PATHS:
+                self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+                return
+
+            try:
+                payload = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+                model = payload.pop("model")
+                messages = payload.pop("messages")
+            except (ValueError, KeyError) as e:
+                self.send_json(400, {"error": {"message": f"Invalid request: {e}"}})
+                return
+
+            stream = payload.pop("stream", False)
+            response = backend.chat_completion(model, messages, stage=infer_stage(messages, payload), **payload)
+            if response is None:
+                self.send_json(404, {"error": {"message": "No canned response for this request"}})
+            elif stream:
+                self.send_events(response)
+            else:
+                self.send_json(200, response)
+
+        def send_json(self, status, body):
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        # Send a response as server-sent events: the content in small deltas, then the usage, then [DONE]
+        def send_events(self, response, chunk_size=16):
+            content = response["choices"][0]["message"]["content"]
+            events = [{"choices": [{"index": 0, "delta": {"content": content[i:i + chunk_size]}}]}
+                      for i in range(0, len(content), chunk_size)]
+            events.append({"choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+                           "usage": response.get("usage")})
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.end_headers()
+            try:
+                for event in events:
+                    self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                self.wfile.write(b"data: [DONE]\n\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # The client closed the stream early
+            self.close_connection = True
+
+        def log_message(self, format, *args):
+            pass
+
+    return ChatCompletionHandler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--replay", metavar="CASSETTE", help="Serve recorded responses (default: the stub backend)")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated latency per request, in seconds")
+    args = parser.parse_args()
+
+    if args.replay:
+        backend = ReplayBackend(args.replay, latency=args.latency)
+    else:
+        backend = StubBackend(latency=args.latency)
+
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(backend))
+    print(f"Serving chat completions on http://{args.host}:{args.port}/v1/chat/completions")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    main()
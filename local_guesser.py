@@ -0,0 +1,42 @@
+import threading
+from collections import Counter
+
+import numpy as np
+
+# How often the local guesser committed to its picks, and how often it left the hint to the LLM
+guesser_counts = Counter()
+_guesser_lock = threading.Lock()
+
+
+def record_guesser(kind):
+    with _guesser_lock:
+        guesser_counts[kind] += 1
+
+
+# Function to summarize how often the local guesser needed the LLM fallback
+def guesser_summary():
+    with _guesser_lock:
+        total = sum(guesser_counts.values())
+        return dict(guesser_counts, total=total, fallback_rate=guesser_counts["fallback"] / total if total else 0.0)
+
+
+# Function to pick the cards for a hint from the similarity of the hint word to the unviewed card descriptions.
+# The picks are only committed when the hint is clear: the number-th closest card is at least min_similarity close to
+# the hint and leads the next closest card by margin. Otherwise None is returned and the LLM guesser should be asked.
+# Hints with number 0 are always left to the LLM. Only descriptions are used, never the card colours.
+def local_guesses(affinity, word, number, partition, margin=0.15, min_similarity=0.1):
+    cards = partition.unviewed
+    if not cards or number <= 0 or number > len(cards):
+        return None
+
+    similarity = affinity.card_similarity(word, cards)
+    order = np.argsort(-similarity, kind="stable")
+    picks = order[:number]
+    weakest = similarity[picks[-1]]
+    runner_up = similarity[order[number]] if len(order) > number else 0.0
+    if weakest < min_similarity or weakest - runner_up < margin:
+        return None
+
+    return [{"card_number": cards[i].card_number,
+             "reasoning": f"Closest description to '{word}' (similarity {similarity[i]:.2f}, next best card "
+                          f"{runner_up:.2f})."} for i in picks]
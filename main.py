@@ -1,20 +1,111 @@
-import requests
-from bs4 import BeautifulSoup
+from functools import partial
+
 import random
-from PIL import Image
-from io import BytesIO
 import json
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import argparse
+
+from board import Board, Card
+from board_sources import ImageDownloads, fetch_image_bytes, image_data_url, make_board_source, model_image_url
+from checkpoint import GameCheckpoint
+from description_cache import DescriptionCache
+from description_pipeline import describe_concurrently, describe_in_batches
+from game_engine import new_game, play_game
+from hedging import HedgePolicy
+from image_preprocessing import preprocess_image
+from llm_backends import add_backend_arguments, configure_backend
+from openrouter_client import chat_completion, set_hedge_policy, stream_chat_completion
+from prompt_layout import cached_prefix_messages
+from structured_output import (CARD_DESCRIPTIONS_SCHEMA, GUESSES_SCHEMA, HINT_SCHEMA, GuessStreamParser,
+                               conversion_summary, convert_answer, extract_guesses, extract_hint,
+                               parse_card_descriptions, record_conversion, response_format, validate_guesses,
+                               validate_hint)
+from telemetry import call_telemetry
 
 # Configuration
-URL = 'https://samdemaeyer.github.io/codenames-pictures/#/play'
 description_model = "google/gemini-pro-1.5"
 hints_model = "openai/gpt-4o"
 guesses_model = "openai/gpt-4o"
 json_conversion_model = "anthropic/claude-3-haiku:beta"
+# Fallback model per stage: a call still running after the stage's deadline is duplicated to it and the first good
+# answer wins
+fallback_models = {
+    "describe": "openai/gpt-4o",
+    "hint": "anthropic/claude-3.5-sonnet",
+    "guesses": "anthropic/claude-3.5-sonnet",
+    "json_conversion": "openai/gpt-4o-mini"
+}
+hedge_deadlines = {}  # Seconds before a call is hedged, per stage (default: the p95 latency observed for the stage)
+hedge_min_samples = 10  # Number of calls to observe per stage before hedging on their p95 latency
+# Shortest p95-based hedge delay, in seconds. The p95 of a fast stage can be a few milliseconds, and below this floor
+# nearly every call would be duplicated for a gain no one notices
+hedge_min_delay = 0.5
+description_concurrency = 8  # Maximum number of description requests in flight at once
+# Cards described per request; with more than 1, the images of a batch go into one request (each after its card
+# ID) and the cards missing from the answer are described one by one
+description_batch_size = 1
+image_max_size = 768  # Longest side, in pixels, of the card images sent to the model and rendered (None: as served)
+image_quality = 85  # JPEG quality of the downscaled card images
+description_cache_path = "description_cache.sqlite"
+description_cache_max_entries = 1000
+guess_history_token_budget = 300  # Maximum size of the guess history in the guess prompt
+guess_streaming = True  # Reveal each guess as soon as it has been streamed, and stop the answer when the turn ends
+telemetry_path = "llm_calls.jsonl"  # One JSON record per LLM call is appended here
+telemetry_snapshot_path = "llm_metrics.prom"  # Prometheus text snapshot of the LLM call metrics, written after a game
+checkpoint_path = "game_checkpoint.json"  # Written after every turn; --resume continues the game from it
+
+# Static hint instructions, sent as the system prompt so providers can cache them
+hint_instructions = """
+    ### Instructions for Giving Hints in Codenames: Pictures
+
+    **1. Basics of Hints:**
+       - **Hint Structure:** A hint consists of one word and a number. The word should relate to one or more pictures on your team's grid, and the number indicates how many pictures it relates to.
+       - **Goal:** Help your team identify all of their agents (pictures) before the opposing team finds theirs, without accidentally leading them to guess the assassin.
+
+    **2. Crafting Effective Hints:**
+       - **Common Themes:** Look for elements linking multiple pictures on your team's grid (objects, actions, colors, concepts).
+       - **Specificity:** Make the hint specific enough to guide your team but broad enough to cover all relevant pictures. Avoid vague hints.
+       - **Avoid Ambiguity:** Ensure the hint doesn't relate to pictures on the opposing team’s grid or the assassin. Consider all possible associations.
+       - **Cultural Awareness:** Be mindful of your team's cultural context and knowledge to avoid misunderstood references.
+       - **Single Word:** Stick to one word, though compound or hyphenated words are allowed if commonly recognized.
+       - **Risk Management:** Balance between guiding your team effectively and avoiding dangerous associations, especially with the assassin.
+
+    **3. Using Hints with the Number 0:**
+       - **Purpose of 0:** Indicates that none of your team’s pictures are related to the given word. Used strategically to rule out associations and guide your team away from incorrect guesses.
+       - **Strategic Application:** 
+         - **Example:** If your team has 4 animals (deer, tiger, cat, shark) and the opposing team has 1 animal (boar), you could say "Boar 0." This tells your team to select all animal-related pictures except the boar.
+         - **Distraction Elimination:** Steer your team away from incorrect themes.
+         - **Assassin Avoidance:** Avoid a picture strongly associated with a dangerous word.
+
+    **4. Examples:**
+       - **Positive Hint:** If your pictures include a cat, a lion, and a tiger, you might give the hint "Feline 3."
+       - **Negative Hint with 0:** If there are no pictures related to water on your grid but some on the opposing team's grid, you could say "Water 0" to indicate avoiding water-related guesses.
+
+    **5. Considerations for Successful Hints:**
+       - **Contextual Relevance:** Think about how your team interprets pictures. Visual elements can be subjective.
+       - **Cross-checking:** Mentally check your hint against all pictures on both grids to avoid misleading your team.
+       - **Adaptability:** Adapt your strategy based on your team's progress and hints already given. Pay attention to their thought processes.
+       - **Numbers:** 2 is kind of average, if you get 3 hints that is good, 4+ is great, but can be risky. Try not to give hints with number 1, unless you have only 1 card left to guess.
+
+    """
+
+# Static guess instructions, sent as the system prompt so providers can cache them
+guess_instructions = """
+    ### Instructions for Guessing in Codenames: Pictures
+
+    **1. Basics of Guessing:**
+       - **Guess Structure:** Provide a list of card numbers and reasons for each guess. Order the list based on the certainty of each guess, with the most certain guess first.
+       - **Goal:** Identify all of your team's agents based on the given hint, avoiding the assassin and the opposing team's agents.
+
+    **2. Considerations for Successful Guessing:** 
+        - **Hint Interpretation:** Match the hint to the image descriptions, considering previous hints and guesses. 
+        - **Association:** Ensure the guesses are strongly associated with the hint. Avoid ambiguous associations. 
+        - **Previous Hints:** After guessing all cards related to the current hint, you can consider previous hints that were not fully guessed for the extra 1 guess you can make. Don't use this if you are not confident, or if you have already guessed all cards related to the previous hints.
+        - **Risk Management:** Balance between confident guesses and avoiding the assassin or opposing team's cards. If you don't know, don't guess more than the number you got with the current hint. 
+
+    """
+
+description_prompt = "Describe the image above in a few sentences. Don't describe the style or the colors, but focus on the content of the image. Don't start with an introductory phrase like 'The image depicts / shows...', just describe the image right away."
+batch_description_prompt = "Each of the images above follows a line with its card ID ('Card 1:', 'Card 2:', ...). Describe every image separately, following these instructions for each of them: " + description_prompt.replace("the image above", "the image") + " Answer with the card ID and the description of every image."
 
 
 # Function to fetch API key from settings file
@@ -25,37 +116,90 @@ def fetch_api_key(filepath="settings.json"):
 
 
 # Function to describe an image using OpenAI
-def describe_image(image_url, api_key):
+def describe_image(image_url, api_key, image_bytes=None):
     prompt = [
         {
             'type': 'image_url',
             'image_url': {
-                'url': image_url
+                'url': image_data_url(image_bytes) if image_bytes is not None else model_image_url(image_url)
             }
         },
         {
             'type': 'text',
-            'text': "Describe the image above in a few sentences. Don't describe the style or the colors, but focus on the content of the image. Don't start with an introductory phrase like 'The image depicts / shows...', just describe the image right away."
+            'text': description_prompt
         }
     ]
 
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers={"Authorization": f"Bearer {api_key}"},
-        json={
-            "model": description_model,
-            "messages": [{"role": "user", "content": prompt}]
-        }
-    )
+    result = chat_completion(api_key, description_model, [{"role": "user", "content": prompt}], stage="describe")
 
-    if response.status_code == 200:
-        result = response.json()
+    if result is not None:
         description = result["choices"][0]["message"]["content"]
         return description
     else:
         return "Error: Unable to get description from the API."
 
 
+# Function to describe an image, consulting the description cache before calling the API
+def describe_image_cached(image_url, api_key, cache=None, downloads=None):
+    if cache is None:
+        return describe_image(image_url, api_key, downloads.get(image_url) if downloads is not None else None)
+
+    image_bytes = downloads.get(image_url) if downloads is not None else fetch_image_bytes(image_url)
+    description = cache.get(image_bytes, description_model, description_prompt)
+    if description is None:
+        description = describe_image(image_url, api_key, image_bytes)
+        if not description.startswith("Error:"):
+            cache.put(image_bytes, description_model, description_prompt, description)
+    return description
+
+
+# Function to start downloading the card images, downscaled and recompressed for the model and the grid
+def card_image_downloads(image_urls):
+    return ImageDownloads(image_urls, preprocess=partial(preprocess_image, max_size=image_max_size,
+                                                         quality=image_quality))
+
+
+# Function to describe several images in one request. Every image follows a line with its card ID, and the answer is
+# mapped back to the images by these IDs. Returns {image_url: description} for the images that were described.
+def describe_image_batch(image_urls, api_key, downloads=None):
+    prompt = []
+    for card_id, image_url in enumerate(image_urls, start=1):
+        url = image_data_url(downloads.get(image_url)) if downloads is not None else model_image_url(image_url)
+        prompt.append({'type': 'text', 'text': f"Card {card_id}:"})
+        prompt.append({'type': 'image_url', 'image_url': {'url': url}})
+    prompt.append({'type': 'text', 'text': batch_description_prompt})
+
+    result = chat_completion(api_key, description_model, [{"role": "user", "content": prompt}], stage="describe",
+                             response_format=response_format("card_descriptions", CARD_DESCRIPTIONS_SCHEMA))
+    if result is None:
+        return {}
+    descriptions = parse_card_descriptions(result["choices"][0]["message"]["content"], len(image_urls))
+    return {image_urls[card_id - 1]: description for card_id, description in descriptions.items()}
+
+
+# Function to describe a batch of images, consulting the description cache first and only sending the cards that
+# are not in it. The descriptions are cached under the batch prompt, which is the prompt that produced them.
+def describe_image_batch_cached(image_urls, api_key, cache=None, downloads=None):
+    if cache is None:
+        return describe_image_batch(image_urls, api_key, downloads)
+
+    descriptions, uncached = {}, []
+    for image_url in image_urls:
+        image_bytes = downloads.get(image_url) if downloads is not None else fetch_image_bytes(image_url)
+        description = cache.get(image_bytes, description_model, batch_description_prompt)
+        if description is None:
+            uncached.append((image_url, image_bytes))
+        else:
+            descriptions[image_url] = description
+    if uncached:
+        batch_descriptions = describe_image_batch([image_url for image_url, _ in uncached], api_key, downloads)
+        for image_url, image_bytes in uncached:
+            if image_url in batch_descriptions:
+                cache.put(image_bytes, description_model, batch_description_prompt, batch_descriptions[image_url])
+                descriptions[image_url] = batch_descriptions[image_url]
+    return descriptions
+
+
 # Function to generate the spymaster grid labels
 def generate_spymaster_grid_labels():
     starting_player = random.choice(['blue', 'red'])
@@ -73,127 +217,99 @@ def generate_spymaster_grid_labels():
 
 
 # Function to generate descriptions for all image URLs
-def generate_descriptions(image_urls, api_key):
+def generate_descriptions(image_urls, api_key, max_workers=description_concurrency, cache=None, downloads=None,
+                          batch_size=description_batch_size):
+    if batch_size > 1:
+        results = describe_in_batches(image_urls,
+                                      lambda urls: describe_image_batch_cached(urls, api_key, cache, downloads),
+                                      lambda url: describe_image_cached(url, api_key, cache, downloads),
+                                      batch_size, max_workers)
+    else:
+        results = describe_concurrently(image_urls, lambda url: describe_image_cached(url, api_key, cache, downloads),
+                                        max_workers)
+
     descriptions = []
-    for url in image_urls:
-        description = describe_image(url, api_key)
-        print(f"Description for {url}: {description}")
+    for result in results:
+        description = result["description"]
+        if result["error"] is not None:
+            description = f"Error: Unable to get description from the API ({result['error']})."
+        print(f"Description for {result['image_url']} ({result['latency']:.2f}s): {description}")
         descriptions.append(description)
-    return descriptions
 
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Description cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries.")
+    return descriptions
 
-# Function to download and process images from the website
-def download_and_enrich_images(driver, grid_labels, descriptions):
-    # Parse page source with BeautifulSoup
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
 
-    image_elements = soup.find_all('img', class_='card-img')
-    image_urls = ['https://samdemaeyer.github.io' + img['src'] for img in image_elements]
+# Function to collect the downloaded board images and enrich them with labels and descriptions.
+# The image bytes are those the descriptions were made from; they are only decoded when something needs the pixels.
+def download_and_enrich_images(image_urls, grid_labels, descriptions, downloads=None):
+    downloads = downloads or card_image_downloads(image_urls)
 
     images = []
     for i, (img_url, description) in enumerate(zip(image_urls, descriptions), start=1):
-        img_response = requests.get(img_url)
-        img = Image.open(BytesIO(img_response.content))
-        img_bytes = BytesIO()
-        img.save(img_bytes, format='JPEG')
-        img_bytes = img_bytes.getvalue()
+        img_bytes = downloads.get(img_url)
 
-        images.append({
-            "image_bytes": img_bytes,
-            "image_url": img_url,
-            "card_number": i,
-            "card_color": grid_labels[i - 1],  # Assign pre-generated color
-            "description": description,  # Add description
-            "viewed": False  # Initialize as not viewed
-        })
+        images.append(Card(
+            card_number=i,
+            card_color=grid_labels[i - 1],  # Assign pre-generated color
+            description=description,
+            image_url=img_url,
+            image_bytes=img_bytes
+        ))
 
-    return images
+    return Board(images)
 
 
-# Function to generate hints for the current team
-def generate_hints(images, current_team, api_key):
-    unviewed_images = [img for img in images if not img['viewed']]
-    current_team_images = [img for img in unviewed_images if img['card_color'] == current_team]
-    other_team_images = [img for img in unviewed_images if
-                         img['card_color'] != current_team and img['card_color'] != 'neutral' and img[
-                             'card_color'] != 'assassin']
-    neutral_images = [img for img in unviewed_images if img['card_color'] == 'neutral']
-    assassin_image = [img for img in unviewed_images if img['card_color'] == 'assassin']
-
-    hint_instructions = """
-    ### Instructions for Giving Hints in Codenames: Pictures
-
-    **1. Basics of Hints:**
-       - **Hint Structure:** A hint consists of one word and a number. The word should relate to one or more pictures on your team's grid, and the number indicates how many pictures it relates to.
-       - **Goal:** Help your team identify all of their agents (pictures) before the opposing team finds theirs, without accidentally leading them to guess the assassin.
-
-    **2. Crafting Effective Hints:**
-       - **Common Themes:** Look for elements linking multiple pictures on your team's grid (objects, actions, colors, concepts).
-       - **Specificity:** Make the hint specific enough to guide your team but broad enough to cover all relevant pictures. Avoid vague hints.
-       - **Avoid Ambiguity:** Ensure the hint doesn't relate to pictures on the opposing team’s grid or the assassin. Consider all possible associations.
-       - **Cultural Awareness:** Be mindful of your team's cultural context and knowledge to avoid misunderstood references.
-       - **Single Word:** Stick to one word, though compound or hyphenated words are allowed if commonly recognized.
-       - **Risk Management:** Balance between guiding your team effectively and avoiding dangerous associations, especially with the assassin.
-
-    **3. Using Hints with the Number 0:**
-       - **Purpose of 0:** Indicates that none of your team’s pictures are related to the given word. Used strategically to rule out associations and guide your team away from incorrect guesses.
-       - **Strategic Application:** 
-         - **Example:** If your team has 4 animals (deer, tiger, cat, shark) and the opposing team has 1 animal (boar), you could say "Boar 0." This tells your team to select all animal-related pictures except the boar.
-         - **Distraction Elimination:** Steer your team away from incorrect themes.
-         - **Assassin Avoidance:** Avoid a picture strongly associated with a dangerous word.
+# Function to render the board section of the hint prompt, once per turn
+def hints_board_prompt(board, current_team):
+    def build(partition):
+        return f"""
+    Current team images:
+    {chr(10).join([img['description'] for img in partition.current_team])}
 
-    **4. Examples:**
-       - **Positive Hint:** If your pictures include a cat, a lion, and a tiger, you might give the hint "Feline 3."
-       - **Negative Hint with 0:** If there are no pictures related to water on your grid but some on the opposing team's grid, you could say "Water 0" to indicate avoiding water-related guesses.
+    Be careful to avoid these images:
+    Other team images:
+    {chr(10).join([img['description'] for img in partition.other_team])}
+    Neutral images:
+    {chr(10).join([img['description'] for img in partition.neutral])}
+    Assassin image:
+    {chr(10).join([img['description'] for img in partition.assassin])}
+    """
 
-    **5. Considerations for Successful Hints:**
-       - **Contextual Relevance:** Think about how your team interprets pictures. Visual elements can be subjective.
-       - **Cross-checking:** Mentally check your hint against all pictures on both grids to avoid misleading your team.
-       - **Adaptability:** Adapt your strategy based on your team's progress and hints already given. Pay attention to their thought processes.
-       - **Numbers:** 2 is kind of average, if you get 3 hints that is good, 4+ is great, but can be risky. Try not to give hints with number 1, unless you have only 1 card left to guess.
+    return board.memoized(current_team, "hints_board_prompt", build)
 
-    """
 
+# Function to generate hints for the current team
+def generate_hints(board, current_team, api_key):
     prompt_text = f"""
-    Generate a brainstorm on hints for the {current_team} team that describe as many of these images as possible, along with reasoning for each hint.
-    Give some different options, and consider all the hint instructions provided below.
-
-    {hint_instructions}
+    Generate a brainstorm on hints for the {current_team} team that describe as many of the current team images above as possible, along with reasoning for each hint.
+    Give some different options, and consider all the hint instructions provided.
 
     To conclude, pick a hint that you think is the best and provide a reasoning for it.
-
-    Current team images:
-    {chr(10).join([img['description'] for img in current_team_images])}
-
-    Be careful to avoid these images:
-    Other team images:
-    {chr(10).join([img['description'] for img in other_team_images])}
-    Neutral images:
-    {chr(10).join([img['description'] for img in neutral_images])}
-    Assassin image:
-    {chr(10).join([img['description'] for img in assassin_image])}
     """
 
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers={"Authorization": f"Bearer {api_key}"},
-        json={
-            "model": hints_model,
-            "messages": [{"role": "user", "content": prompt_text}]
-        }
-    )
+    messages = cached_prefix_messages(hints_model, hint_instructions, [hints_board_prompt(board, current_team)],
+                                      prompt_text)
+    result = chat_completion(api_key, hints_model, messages, stage="hint",
+                             response_format=response_format("hint", HINT_SCHEMA))
 
-    if response.status_code == 200:
-        result = response.json()
-        print("Hint generation result:", result)
+    if result is not None:
         hints = result["choices"][0]["message"]["content"]
         return hints
     else:
         return "Error: Unable to get hints from the API."
 
 
-# Function to convert hint to JSON
+# Function to convert hint to JSON, only asking the LLM when the answer is neither structured nor extractable
 def convert_hint_to_json(hint_with_reasoning, api_key):
+    return convert_answer(hint_with_reasoning, validate_hint, extract_hint,
+                          lambda: convert_hint_to_json_with_llm(hint_with_reasoning, api_key))
+
+
+# Function to convert hint to JSON with an extra LLM call (last-resort fallback)
+def convert_hint_to_json_with_llm(hint_with_reasoning, api_key):
     prompt_text = f"""
     Convert the best hint into a JSON object with two fields: 'hint' and 'number'.
     For example: "Feline 3" should be converted to {{"hint": "Feline", "number": 3}}.
@@ -202,82 +318,69 @@ def convert_hint_to_json(hint_with_reasoning, api_key):
     {hint_with_reasoning}
     """
 
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers={"Authorization": f"Bearer {api_key}"},
-        json={
-            "model": json_conversion_model,
-            "messages": [{"role": "user", "content": prompt_text}]
-        }
-    )
+    result = chat_completion(api_key, json_conversion_model, [{"role": "user", "content": prompt_text}], stage="json_conversion")
 
-    if response.status_code == 200:
-        result = response.json()
-        print("Hint to JSON conversion result:", result)
+    if result is not None:
         hint_json = result["choices"][0]["message"]["content"]
         return parse_clean_json(hint_json)
     else:
         return {"hint": "", "number": 0}
 
 
-# Function to generate a list of guesses
-def generate_guesses(images, hint, number, api_key, current_team, previous_hints=[]):
-    unviewed_images = [img for img in images if not img['viewed']]
-
-    if not unviewed_images:
-        return "No cards available to select."
-
-    guess_instructions = """
-    ### Instructions for Guessing in Codenames: Pictures
-
-    **1. Basics of Guessing:**
-       - **Guess Structure:** Provide a list of card numbers and reasons for each guess. Order the list based on the certainty of each guess, with the most certain guess first.
-       - **Goal:** Identify all of your team's agents based on the given hint, avoiding the assassin and the opposing team's agents.
+# Function to render the unviewed image descriptions for the guesser, once per turn
+def guesser_board_prompt(board, current_team):
+    def build(partition):
+        return f"""
+    Images descriptions:
+    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in partition.unviewed])}
+    """
 
-    **2. Considerations for Successful Guessing:** 
-        - **Hint Interpretation:** Match the hint to the image descriptions, considering previous hints and guesses. 
-        - **Association:** Ensure the guesses are strongly associated with the hint. Avoid ambiguous associations. 
-        - **Previous Hints:** After guessing all cards related to the current hint, you can consider previous hints that were not fully guessed for the extra 1 guess you can make. Don't use this if you are not confident, or if you have already guessed all cards related to the previous hints.
-        - **Risk Management:** Balance between confident guesses and avoiding the assassin or opposing team's cards. If you don't know, don't guess more than the number you got with the current hint. 
+    return board.memoized(current_team, "guesser_board_prompt", build)
 
-    """
 
+# Function to build the guesses request for a hint
+def guesses_messages(board, hint, number, current_team, previous_hints):
     prompt_text = f"""
     You are on the {current_team} team.
 
     Previous information: {chr(10).join(previous_hints)}
 
-    Images descriptions:
-    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in unviewed_images])}
-
-    {guess_instructions}
-
     Given the images and the hint '{hint} {number}', generate a list of guesses ordered by certainty. When the number is 0, you can guess any number of cards, otherwise, you should guess the number of cards given by the hint. You can guess one card more than the number given by the hint if you are confident.
     Usually it is best to guess the number of cards given by the hint, but you can guess fewer if you are not confident, or more if in the last rounds you didn't guess all the cards.
 
     Conclude with a list of guesses you would make (so don't include ones you don't want to risk), along with the reasoning for each guess.
     """
 
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers={"Authorization": f"Bearer {api_key}"},
-        json={
-            "model": guesses_model,
-            "messages": [{"role": "user", "content": prompt_text}]
-        }
-    )
+    return cached_prefix_messages(guesses_model, guess_instructions, [guesser_board_prompt(board, current_team)],
+                                  prompt_text)
+
+
+# Function to generate a list of guesses
+def generate_guesses(board, hint, number, api_key, current_team, previous_hints=[]):
+    unviewed_images = board.partition(current_team).unviewed
+
+    if not unviewed_images:
+        return "No cards available to select."
 
-    if response.status_code == 200:
-        result = response.json()
-        print("Guesses generation result:", result)
+    messages = guesses_messages(board, hint, number, current_team, previous_hints)
+    result = chat_completion(api_key, guesses_model, messages, stage="guesses",
+                             response_format=response_format("guesses", GUESSES_SCHEMA))
+
+    if result is not None:
         guesses = result["choices"][0]["message"]["content"]
         return guesses
     else:
         return "Error: Unable to get guesses from the API."
 
 
-# Function to convert guesses to JSON
+# Function to convert guesses to JSON, only asking the LLM when the answer is neither structured nor extractable
 def convert_guesses_to_json(guesses, api_key):
+    return convert_answer(guesses, validate_guesses, extract_guesses,
+                          lambda: convert_guesses_to_json_with_llm(guesses, api_key))
+
+
+# Function to convert guesses to JSON with an extra LLM call (last-resort fallback)
+def convert_guesses_to_json_with_llm(guesses, api_key):
     prompt_text = f"""
     Convert the following guesses into a valid JSON list with fields: 'card_number' (integer) and 'reasoning' (string).
     Return just the JSON object, starting with [ and ending with ].
@@ -285,25 +388,38 @@ def convert_guesses_to_json(guesses, api_key):
     {guesses}
     """
 
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers={"Authorization": f"Bearer {api_key}"},
-        json={
-            "model": json_conversion_model,
-            "messages": [
-                {"role": "user", "content": prompt_text}
-            ]
-        }
-    )
+    result = chat_completion(api_key, json_conversion_model, [{"role": "user", "content": prompt_text}], stage="json_conversion")
 
-    if response.status_code == 200:
-        result = response.json()
+    if result is not None:
         guesses_json = result["choices"][0]["message"]["content"]
         return parse_clean_json(guesses_json)
     else:
         return []
 
 
+# Function to stream the guesses for a hint, yielding each guess as soon as its JSON object is complete. When the
+# answer does not follow the schema, it is converted as a whole once it is complete. Closing the generator (the turn
+# ended) aborts the request.
+def stream_guesses(board, hint, number, api_key, current_team, previous_hints=[]):
+    if not board.partition(current_team).unviewed:
+        return
+
+    parser = GuessStreamParser()
+    chunks = stream_chat_completion(api_key, guesses_model,
+                                    guesses_messages(board, hint, number, current_team, previous_hints),
+                                    stage="guesses", response_format=response_format("guesses", GUESSES_SCHEMA))
+    try:
+        for chunk in chunks:
+            yield from parser.feed(chunk)
+    finally:
+        chunks.close()
+        if parser.guesses:
+            record_conversion("structured")
+
+    if not parser.guesses:
+        yield from convert_guesses_to_json(parser.text or "Error: Unable to get guesses from the API.", api_key)
+
+
 def parse_clean_json(message_content):
     # Find the first occurrences of '[' and '{'
     first_square_bracket = message_content.find("[")
@@ -339,133 +455,99 @@ def parse_clean_json(message_content):
 
 
 # Main function to coordinate the grid generation, image download, description, and hint generation
-def main():
+def main(board_path=None, api_key=None, resume_path=None):
     # Fetch API key
-    api_key = fetch_api_key()
-
-    # Generate spymaster grid labels
-    starting_player, grid_labels = generate_spymaster_grid_labels()
+    api_key = api_key or fetch_api_key()
+    call_telemetry.stream_to(telemetry_path)
+    set_hedge_policy(HedgePolicy(fallback_models, hedge_deadlines, hedge_min_samples, hedge_min_delay))
+
+    if resume_path:
+        # Rebuild the game from its checkpoint, without scraping or describing the board again
+        checkpoint = GameCheckpoint.load(resume_path)
+        board, starting_player = checkpoint.board, checkpoint.current_team
+        if checkpoint.result["winner"] is not None:
+            print(f"The game in {resume_path} has already ended: the {checkpoint.result['winner']} team won.")
+            return
+        print(f"Resuming the game from {resume_path} at turn {checkpoint.result['turns'] + 1}.")
+    else:
+        # Generate spymaster grid labels
+        starting_player, grid_labels = generate_spymaster_grid_labels()
 
-    # Set up Selenium WebDriver (Chrome in this case)
-    driver = webdriver.Chrome()
-    driver.get(URL)
+        # Load the board image URLs, from the website or from a local directory / manifest
+        image_urls = make_board_source(board_path).load()
+        if not image_urls:
+            print("No images found on the board.")
+            return
 
-    # Wait for images to load
-    try:
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_all_elements_located((By.CLASS_NAME, 'card-img'))
-        )
-    except Exception as e:
-        print(f"Error: {e}")
-        driver.quit()
-        return []
+        # Start downloading the images in the background, so the downloads overlap with the descriptions
+        downloads = card_image_downloads(image_urls)
 
-    # Use the same browser instance to get image URLs and generate descriptions
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
+        # Generate descriptions for all image URLs, reusing cached descriptions for cards we have seen before
+        description_cache = DescriptionCache(description_cache_path, description_cache_max_entries)
+        descriptions = generate_descriptions(image_urls, api_key, cache=description_cache, downloads=downloads)
 
-    image_elements = soup.find_all('img', class_='card-img')
-    image_urls = ['https://samdemaeyer.github.io' + img['src'] for img in image_elements]
+        # Enrich the downloaded images with the grid labels and descriptions
+        board = download_and_enrich_images(image_urls, grid_labels, descriptions, downloads)
 
-    # Generate descriptions for all image URLs
-    descriptions = generate_descriptions(image_urls, api_key)
+        if not board:
+            print("No images found or error in downloading images.")
+            return
+        checkpoint = GameCheckpoint(board, starting_player, *new_game(starting_player, guess_history_token_budget))
 
-    # Download and enrich images with the grid labels and descriptions
-    enriched_images = download_and_enrich_images(driver, grid_labels, descriptions)
+    # Write a checkpoint now and after every turn, so a crashed game can be resumed
+    checkpoint_file = resume_path or checkpoint_path
+    checkpoint.save(checkpoint_file)
 
-    # driver.quit()
-
-    if not enriched_images:
-        print("No images found or error in downloading images.")
-        return
+    def save_checkpoint(board, next_team, guess_history, result):
+        checkpoint.current_team = next_team
+        checkpoint.save(checkpoint_file)
 
     print(f"Starting player: {starting_player}")
-    for card in enriched_images:
+    for card in board:
         print(
             f"Card {card['card_number']}: {card['card_color']}, URL: {card['image_url']}, Description: {card['description']}")
 
-    previous_hints = {
-        "blue": [],
-        "red": []
-    }
-    current_team = starting_player
-    game_over = False
-    while not game_over:
-        # Generate hints for the current team
-        hints_with_reasoning = generate_hints(enriched_images, current_team, api_key)
+    # Functions that let the game engine ask the spymaster for a hint and the team for guesses
+    def give_hint(board, current_team):
+        hints_with_reasoning = generate_hints(board, current_team, api_key)
         print(f"Hints with reasoning for the {current_team} team: {hints_with_reasoning}")
 
         # Convert hint to JSON
         hint_json = convert_hint_to_json(hints_with_reasoning, api_key)
-        hint = hint_json["hint"]
-        number = hint_json["number"]
         print(f"Hint JSON for the {current_team} team: {hint_json}")
+        return hint_json["hint"], int(hint_json["number"])
 
-        # Generate list of guesses
-        guesses_with_reasoning = generate_guesses(enriched_images, hint, number, api_key, current_team,
-                                                  previous_hints[current_team])
+    def make_guesses(board, hint, number, current_team, previous_hints):
+        if guess_streaming:
+            return stream_guesses(board, hint, number, api_key, current_team, previous_hints)
+
+        guesses_with_reasoning = generate_guesses(board, hint, number, api_key, current_team, previous_hints)
         print(f"Guesses with reasoning: {guesses_with_reasoning}")
 
         # Convert guesses to JSON
         guesses_json = convert_guesses_to_json(guesses_with_reasoning, api_key)
         print(f"Guesses JSON: {guesses_json}")
+        return guesses_json
+
+    play_game(board, starting_player, give_hint, make_guesses, guess_history_token_budget=guess_history_token_budget,
+              on_turn_end=save_checkpoint, guess_history=checkpoint.guess_history, result=checkpoint.result)
 
-        guesses = 0
-        correct_guesses = 0
-        max_guesses = number + 1 if number != 0 else float('inf')
-
-        for guess in guesses_json:
-            if guesses > max_guesses:
-                current_team = 'blue' if current_team == 'red' else 'red'
-                print(f"Maximum number of guesses reached. Switching to the {current_team} team.")
-                break
-
-            print(f"Guess: {guess}")
-
-            card_number = guess['card_number']
-            reasoning = guess['reasoning']
-
-            selected_card_index = next(
-                (i for i, img in enumerate(enriched_images) if img['card_number'] == card_number), None)
-            if selected_card_index is not None:
-                selected_card_color = enriched_images[selected_card_index]['card_color']
-                enriched_images[selected_card_index]['viewed'] = True
-
-                if selected_card_color == 'assassin':
-                    print(f"Game over! {current_team} team selected the assassin.")
-                    game_over = True
-                    break
-
-                previous_hints[current_team].append(
-                    f"I picked card {card_number}, for hint {hint}, because {reasoning}. The card turned out to be {selected_card_color}.")
-                print(f"Card {card_number} selected by the {current_team} team. Reasoning: {reasoning}")
-
-                # Check if any team has found all their agents
-                blue_agents_found = all(img['viewed'] for img in enriched_images if img['card_color'] == 'blue')
-                red_agents_found = all(img['viewed'] for img in enriched_images if img['card_color'] == 'red')
-
-                if blue_agents_found or red_agents_found:
-                    winning_team = 'blue' if blue_agents_found else 'red'
-                    print(f"{winning_team} team wins! All agents found.")
-                    game_over = True
-                    break
-
-                if selected_card_color == current_team:
-                    print(f"Correct guess! The {current_team} team can continue.")
-                    correct_guesses += 1
-                    if correct_guesses == number:
-                        previous_hints[current_team].append(
-                            f"I guessed all {number} cards correctly for hint {hint}. This hint does not have to be considered anymore.")
-                else:
-                    previous_hints[current_team].append(
-                        f"I guessed {correct_guesses} cards out of {number} correctly for hint {hint}, and then I guessed card {card_number}, for hint {hint}, because {reasoning}. The card turned out to be {selected_card_color}.")
-                    current_team = 'blue' if current_team == 'red' else 'red'
-                    print(f"Wrong guess! Switching to the {current_team} team.")
-                    break  # Switch turns after a wrong guess
-
-            guesses += 1
+    print("LLM calls per stage:")
+    print(call_telemetry.summary_table())
+    call_telemetry.write_prometheus(telemetry_snapshot_path)
+    call_telemetry.close()
+    conversions = conversion_summary()
+    print(f"JSON conversion: {conversions.get('structured', 0)} structured, {conversions.get('local', 0)} extracted "
+          f"locally, {conversions.get('fallback', 0)} LLM fallbacks ({conversions['fallback_rate']:.0%}).")
 
     input("Press Enter to continue...")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--board", help="Directory or JSON manifest of card images to play with instead of the website")
+    parser.add_argument("--resume", nargs="?", const=checkpoint_path, metavar="CHECKPOINT",
+                        help=f"Continue the game saved in a checkpoint (default: {checkpoint_path})")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    main(board_path=args.board, api_key=configure_backend(args, fetch_api_key), resume_path=args.resume)
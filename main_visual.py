@@ -1,23 +1,128 @@
 import textwrap
-import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
 
-import requests
-from bs4 import BeautifulSoup
 import random
-from PIL import Image, ImageDraw, ImageFont
-from io import BytesIO
 import json
-from selenium import webdriver
-from selenium.webdriver.common.by import By
-from selenium.webdriver.support.ui import WebDriverWait
-from selenium.webdriver.support import expected_conditions as EC
+import argparse
+
+from board import Board, Card, other_team
+from board_sources import ImageDownloads, fetch_image_bytes, image_data_url, make_board_source, model_image_url
+from checkpoint import GameCheckpoint
+from concept_index import ConceptIndex
+from description_cache import DescriptionCache
+from description_pipeline import describe_concurrently, describe_in_batches
+from game_engine import new_game, play_game
+from hedging import HedgePolicy
+from grid_renderer import GridRenderer
+from hint_affinity import HintAffinity, load_word_vectors
+from image_preprocessing import preprocess_image
+from local_guesser import guesser_summary, local_guesses, record_guesser
+from llm_backends import add_backend_arguments, configure_backend
+from openrouter_client import chat_completion, set_hedge_policy, stream_chat_completion
+from prompt_layout import cached_prefix_messages
+from speculation import SpeculativeScheduler
+from structured_output import (CARD_DESCRIPTIONS_SCHEMA, GUESSES_SCHEMA, HINT_EVALUATION_SCHEMA, GuessStreamParser,
+                               conversion_summary, convert_answer, extract_guesses, extract_hint_evaluation,
+                               parse_card_descriptions, record_conversion, response_format, validate_guesses,
+                               validate_hint_evaluation)
+from telemetry import call_telemetry
 
 # Configuration
-URL = 'https://samdemaeyer.github.io/codenames-pictures/#/play'
 description_model = "google/gemini-pro-1.5"
 hints_model = "openai/gpt-4o"
 guesses_model = "openai/gpt-4o"
 json_conversion_model = "anthropic/claude-3-haiku:beta"
+# Fallback model per stage: a call still running after the stage's deadline is duplicated to it and the first good
+# answer wins
+fallback_models = {
+    "describe": "openai/gpt-4o",
+    "associations": "anthropic/claude-3.5-sonnet",
+    "hint": "anthropic/claude-3.5-sonnet",
+    "score": "anthropic/claude-3.5-sonnet",
+    "guesses": "anthropic/claude-3.5-sonnet",
+    "json_conversion": "openai/gpt-4o-mini"
+}
+hedge_deadlines = {}  # Seconds before a call is hedged, per stage (default: the p95 latency observed for the stage)
+hedge_min_samples = 10  # Number of calls to observe per stage before hedging on their p95 latency
+# Shortest p95-based hedge delay, in seconds. The p95 of a fast stage can be a few milliseconds, and below this floor
+# nearly every call would be duplicated for a gain no one notices
+hedge_min_delay = 0.5
+description_concurrency = 8  # Maximum number of description requests in flight at once
+# Cards described per request; with more than 1, the images of a batch go into one request (each after its card
+# ID) and the cards missing from the answer are described one by one
+description_batch_size = 1
+image_max_size = 768  # Longest side, in pixels, of the card images sent to the model and rendered (None: as served)
+image_quality = 85  # JPEG quality of the downscaled card images
+description_cache_path = "description_cache.sqlite"
+description_cache_max_entries = 1000
+guess_history_token_budget = 300  # Maximum size of the guess history in the guess prompt
+guess_streaming = True  # Reveal each guess as soon as it has been streamed, and stop the answer when the turn ends
+telemetry_path = "llm_calls.jsonl"  # One JSON record per LLM call is appended here
+telemetry_snapshot_path = "llm_metrics.prom"  # Prometheus text snapshot of the LLM call metrics, written after a game
+checkpoint_path = "game_checkpoint.json"  # Written after every turn; --resume continues the game from it
+# "parallel" scores independent candidates concurrently, "sequential" chains two hints, "local" ranks the board's words
+# with the local hint scorer and only scores the best few with the LLM
+hint_search_mode = "parallel"
+hint_candidates = 4  # Number of hint candidates generated per turn in parallel mode
+hint_search_concurrency = 4  # Maximum number of candidates being generated and scored at once
+hint_candidate_temperatures = [0.2, 0.6, 0.9, 1.2]  # Cycled over the candidates to make them diverse
+local_hint_shortlist = 3  # Number of locally ranked hint words that are scored by the LLM in "local" mode
+word_vectors_path = None  # GloVe-style word vectors for the local hint scorer (default: TF-IDF over the descriptions)
+# "llm" asks the LLM for every guess, "local" picks the cards of clear hints by description similarity and only asks
+# the LLM when the hint is ambiguous
+guesser_mode = "llm"
+local_guess_margin = 0.15  # Lead the picks of a clear hint need over the next closest card
+# "index" reads the associations of a turn from the board's concept index, "refine" has the LLM refine the index's
+# lists, "llm" has the LLM derive them from the descriptions every turn
+associations_mode = "index"
+# Prepare the hint candidates of a team while the other team is guessing (in "parallel" and "local" hint search mode)
+speculative_hints = True
+speculation_touch_score = 5  # A speculative candidate is redone when a revealed card scored at least this for it
+
+grid_renderer = GridRenderer()
+word_vectors = None  # Loaded from word_vectors_path on first use
+hint_affinities = weakref.WeakKeyDictionary()  # Board -> HintAffinity
+concept_indexes = weakref.WeakKeyDictionary()  # Board -> ConceptIndex
+
+# Static spymaster instructions, shared by the associations, hint and score calls
+hint_instructions = """
+    1. **Word Association:** The hint should be a single word that relates to multiple images on the board.
+    2. **Number:** The number of cards related to the hint.
+    3. **Clarity:** The hint should be clear and concise, avoiding ambiguity.
+    4. **Avoiding Bad Associations:** Ensure the hint does not relate to the assassin, other team, or neutral cards.
+    5. **Strong Association:** The hint should strongly relate to the cards you want your team to guess.
+    6. **Common Themes:** Look for common themes or connections between the cards.
+    7. **Risk Management:** Balance the number of cards with the strength of the association.
+    8. **Zero Guesses:** If you don't want your team to guess any cards, use a hint with the number '0'.
+"""
+
+spymaster_system_prompt = f"""
+    You are the spymaster of a team in Codenames: Pictures. Every picture on the board is given as a card number with a description.
+
+    Hint Instructions:
+    {hint_instructions}
+    """
+
+# Static guesser instructions
+guess_instructions = """
+    ### Instructions for Guessing in Codenames: Pictures
+
+    **1. Basics of Guessing:**
+       - **Guess Structure:** Provide a list of card numbers and reasons for each guess. Order the list based on the certainty of each guess, with the most certain guess first.
+       - **Goal:** Identify all of your team's agents based on the given hint, avoiding the assassin and the opposing team's agents.
+
+    **2. Considerations for Successful Guessing:** 
+        - **Hint Interpretation:** Match the hint to the image descriptions, considering previous hints and guesses. 
+        - **Association:** Ensure the guesses are strongly associated with the hint. Avoid ambiguous associations. 
+        - **Previous Hints:** After guessing all cards related to the current hint, you can consider previous hints that were not fully guessed for the extra 1 guess you can make. Don't use this if you are not confident, or if you have already guessed all cards related to the previous hints.
+        - **Risk Management:** Balance between confident guesses and avoiding the assassin or opposing team's cards. If you don't know, don't guess more than the number you got with the current hint. 
+
+    """
+
+description_prompt = "Write a short paragraph, of at least a few sentences, describing the image. Don't describe the drawing style or the colour, but purely focus on the content of the image. Don't start with an introductory phrase like 'The image depicts / shows...', just describe the image right away. Make sure to include enough detail, and describe all aspects of the image."
+batch_description_prompt = "Each of the images above follows a line with its card ID ('Card 1:', 'Card 2:', ...). Describe every image separately, following these instructions for each of them: " + description_prompt + " Answer with the card ID and the description of every image."
 
 
 # Function to fetch API key from settings file
@@ -28,40 +133,93 @@ def fetch_api_key(filepath="settings.json"):
 
 
 # Function to describe an image using OpenAI
-def describe_image(image_url, api_key):
+def describe_image(image_url, api_key, image_bytes=None):
     prompt = [
         {
             'type': 'image_url',
             'image_url': {
-                'url': image_url
+                'url': image_data_url(image_bytes) if image_bytes is not None else model_image_url(image_url)
             }
         },
         {
             'type': 'text',
-            'text': "Write a short paragraph, of at least a few sentences, describing the image. Don't describe the drawing style or the colour, but purely focus on the content of the image. Don't start with an introductory phrase like 'The image depicts / shows...', just describe the image right away. Make sure to include enough detail, and describe all aspects of the image."
+            'text': description_prompt
         }
     ]
 
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers={"Authorization": f"Bearer {api_key}"},
-        json={
-            "model": description_model,
-            "messages": [{"role": "user", "content": prompt}]
-        }
-    )
+    result = chat_completion(api_key, description_model, [{"role": "user", "content": prompt}], stage="describe")
 
-    if response.status_code == 200:
-        result = response.json()
+    if result is not None:
         description = result["choices"][0]["message"]["content"]
         return description
     else:
         return "Error: Unable to get description from the API."
 
 
+# Function to describe an image, consulting the description cache before calling the API
+def describe_image_cached(image_url, api_key, cache=None, downloads=None):
+    if cache is None:
+        return describe_image(image_url, api_key, downloads.get(image_url) if downloads is not None else None)
+
+    image_bytes = downloads.get(image_url) if downloads is not None else fetch_image_bytes(image_url)
+    description = cache.get(image_bytes, description_model, description_prompt)
+    if description is None:
+        description = describe_image(image_url, api_key, image_bytes)
+        if not description.startswith("Error:"):
+            cache.put(image_bytes, description_model, description_prompt, description)
+    return description
+
+
+# Function to start downloading the card images, downscaled and recompressed for the model and the grid
+def card_image_downloads(image_urls):
+    return ImageDownloads(image_urls, preprocess=partial(preprocess_image, max_size=image_max_size,
+                                                         quality=image_quality))
+
+
+# Function to describe several images in one request. Every image follows a line with its card ID, and the answer is
+# mapped back to the images by these IDs. Returns {image_url: description} for the images that were described.
+def describe_image_batch(image_urls, api_key, downloads=None):
+    prompt = []
+    for card_id, image_url in enumerate(image_urls, start=1):
+        url = image_data_url(downloads.get(image_url)) if downloads is not None else model_image_url(image_url)
+        prompt.append({'type': 'text', 'text': f"Card {card_id}:"})
+        prompt.append({'type': 'image_url', 'image_url': {'url': url}})
+    prompt.append({'type': 'text', 'text': batch_description_prompt})
+
+    result = chat_completion(api_key, description_model, [{"role": "user", "content": prompt}], stage="describe",
+                             response_format=response_format("card_descriptions", CARD_DESCRIPTIONS_SCHEMA))
+    if result is None:
+        return {}
+    descriptions = parse_card_descriptions(result["choices"][0]["message"]["content"], len(image_urls))
+    return {image_urls[card_id - 1]: description for card_id, description in descriptions.items()}
+
+
+# Function to describe a batch of images, consulting the description cache first and only sending the cards that
+# are not in it. The descriptions are cached under the batch prompt, which is the prompt that produced them.
+def describe_image_batch_cached(image_urls, api_key, cache=None, downloads=None):
+    if cache is None:
+        return describe_image_batch(image_urls, api_key, downloads)
+
+    descriptions, uncached = {}, []
+    for image_url in image_urls:
+        image_bytes = downloads.get(image_url) if downloads is not None else fetch_image_bytes(image_url)
+        description = cache.get(image_bytes, description_model, batch_description_prompt)
+        if description is None:
+            uncached.append((image_url, image_bytes))
+        else:
+            descriptions[image_url] = description
+    if uncached:
+        batch_descriptions = describe_image_batch([image_url for image_url, _ in uncached], api_key, downloads)
+        for image_url, image_bytes in uncached:
+            if image_url in batch_descriptions:
+                cache.put(image_bytes, description_model, batch_description_prompt, batch_descriptions[image_url])
+                descriptions[image_url] = batch_descriptions[image_url]
+    return descriptions
+
+
 # Function to generate the spymaster grid labels
-def generate_spymaster_grid_labels():
-    starting_player = random.choice(['blue', 'red'])
+def generate_spymaster_grid_labels(rng=random):
+    starting_player = rng.choice(['blue', 'red'])
     other_player = 'red' if starting_player == 'blue' else 'blue'
 
     grid_labels = (
@@ -70,118 +228,127 @@ def generate_spymaster_grid_labels():
             ['neutral'] * 4 +
             ['assassin']
     )
-    random.shuffle(grid_labels)
+    rng.shuffle(grid_labels)
 
     return starting_player, grid_labels
 
 
 # Function to generate descriptions for all image URLs
-def generate_descriptions(image_urls, api_key):
+def generate_descriptions(image_urls, api_key, max_workers=description_concurrency, cache=None, downloads=None,
+                          batch_size=description_batch_size):
+    if batch_size > 1:
+        results = describe_in_batches(image_urls,
+                                      lambda urls: describe_image_batch_cached(urls, api_key, cache, downloads),
+                                      lambda url: describe_image_cached(url, api_key, cache, downloads),
+                                      batch_size, max_workers)
+    else:
+        results = describe_concurrently(image_urls, lambda url: describe_image_cached(url, api_key, cache, downloads),
+                                        max_workers)
+
     descriptions = []
-    for url in image_urls:
-        description = describe_image(url, api_key)
+    for result in results:
+        description = result["description"]
+        if result["error"] is not None:
+            description = f"Error: Unable to get description from the API ({result['error']})."
         wrapped_description = textwrap.fill(description, width=80)  # Wrap text to 80 characters per line
-        print(f"Description for {url}:\n{wrapped_description}\n")
+        print(f"Description for {result['image_url']} ({result['latency']:.2f}s):\n{wrapped_description}\n")
         descriptions.append(description)
-    return descriptions
 
+    if cache is not None:
+        stats = cache.stats()
+        print(f"Description cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries.")
+    return descriptions
 
-# Function to download and process images from the website
-def download_and_enrich_images(driver, grid_labels, descriptions):
-    # Parse page source with BeautifulSoup
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
 
-    image_elements = soup.find_all('img', class_='card-img')
-    image_urls = ['https://samdemaeyer.github.io' + img['src'] for img in image_elements]
+# Function to collect the downloaded board images and enrich them with labels and descriptions.
+# The image bytes are those the descriptions were made from; they are only decoded when something needs the pixels.
+def download_and_enrich_images(image_urls, grid_labels, descriptions, downloads=None):
+    downloads = downloads or card_image_downloads(image_urls)
 
     images = []
     for i, (img_url, description) in enumerate(zip(image_urls, descriptions), start=1):
-        img_response = requests.get(img_url)
-        img = Image.open(BytesIO(img_response.content))
-        img_bytes = BytesIO()
-        img.save(img_bytes, format='JPEG')
-        img_bytes = img_bytes.getvalue()
-
-        images.append({
-            "image_bytes": img_bytes,
-            "image_url": img_url,
-            "card_number": i,
-            "card_color": grid_labels[i - 1],  # Assign pre-generated color
-            "description": description,  # Add description
-            "viewed": False  # Initialize as not viewed
-        })
-
-    return images
-
-
-# Function to visualize the game grid
-def visualize_game_grid(images):
-    grid_size = 5
-    image_size = 200
-    margin = 10
-    colors = {
-        'blue': 'blue',
-        'red': 'red',
-        'neutral': 'yellow',
-        'assassin': 'black'
-    }
-
-    # Create a blank canvas for the grid
-    grid_img = Image.new('RGB', (
-        grid_size * (image_size + margin) + margin,
-        grid_size * (image_size + margin) + margin
-    ), 'white')
-    draw = ImageDraw.Draw(grid_img)
-    font = ImageFont.load_default()
-
-    for i, img_data in enumerate(images):
-        img = Image.open(BytesIO(img_data['image_bytes'])).resize((image_size, image_size))
-        row = i // grid_size
-        col = i % grid_size
-
-        x = col * (image_size + margin) + margin
-        y = row * (image_size + margin) + margin
-
-        grid_img.paste(img, (x, y))
-
-        # Draw the number on the image
-        draw.text((x + 10, y + 10), str(img_data['card_number']), fill='black', font=font)
-
-        # Draw the circle for the color
-        color = colors[img_data['card_color']]
-        draw.ellipse([(x + image_size - 20, y + 10), (x + image_size - 10, y + 20)], fill=color)
-
-        # Draw overlay if viewed
-        if img_data['viewed']:
-            overlay = Image.new('RGBA', (image_size, image_size), (0, 0, 0, 128))
-            grid_img.paste(overlay, (x, y), overlay)
-
-    grid_img.show()
+        img_bytes = downloads.get(img_url)
 
+        images.append(Card(
+            card_number=i,
+            card_color=grid_labels[i - 1],  # Assign pre-generated color
+            description=description,
+            image_url=img_url,
+            image_bytes=img_bytes
+        ))
 
-# Function to generate associations to avoid and to aim for
-def generate_associations(images, current_team, api_key):
-    unviewed_images = [img for img in images if not img['viewed']]
-    current_team_images = [img for img in unviewed_images if img['card_color'] == current_team]
-    other_team_images = [img for img in unviewed_images if
-                         img['card_color'] != current_team and img['card_color'] != 'neutral' and img[
-                             'card_color'] != 'assassin']
-    neutral_images = [img for img in unviewed_images if img['card_color'] == 'neutral']
-    assassin_image = [img for img in unviewed_images if img['card_color'] == 'assassin']
+    return Board(images)
+
+
+# Function to visualize the game grid, reusing the tiles of the previous render
+def visualize_game_grid(images, renderer=None, show=True):
+    renderer = renderer or grid_renderer
+    grid_img = renderer.render(images)
+    if show:
+        grid_img.show()
+    return grid_img
+
+
+# Function to render the board section of the spymaster prompts. It is built once per turn and shared by the
+# associations, hint and score calls, so their requests start with the same prefix.
+def spymaster_board_prompt(board, current_team):
+    def build(partition):
+        return f"""
+    You are the spymaster of the {current_team} team.
 
-    prompt_text = f"""
     Other team images (avoid these, they give points to the other team):
-    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in other_team_images])}
+    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in partition.other_team])}
 
     Neutral images (avoid these. they are not that bad, but they end your turn and don't give points):
-    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in neutral_images])}
+    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in partition.neutral])}
 
     Assassin image (avoid this at all costs, it ends the game):
-    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in assassin_image])}
+    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in partition.assassin])}
 
     Current team images (these are the images you want your team to guess):
-    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in current_team_images])}
+    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in partition.current_team])}
+    """
+
+    return board.memoized(current_team, "spymaster_board_prompt", build)
+
+
+# Function to render the associations as a stable prompt section for the hint and score calls of a turn
+def associations_prompt(associations):
+    return f"""
+    Associations evaluation:
+    {associations}
+    """
+
+
+# Function to get the concept index of a board. It is built once per board and drops revealed cards as they are
+# revealed.
+def board_concept_index(board):
+    index = concept_indexes.get(board)
+    if index is None:
+        index = ConceptIndex.for_board(board)
+        concept_indexes[board] = index
+    return index
 
+
+# Function to generate associations to avoid and to aim for
+def generate_associations(board, current_team, api_key, mode=associations_mode):
+    if mode in ("index", "refine"):
+        index_associations = board_concept_index(board).render_associations(current_team)
+        if mode == "index":
+            return index_associations
+        prompt_text = f"""
+    Create two lists of associations, starting from the draft lists below, which were derived from the words that the
+    image descriptions share. Merge related concepts into themes, add themes that the words miss and drop the ones
+    that are not useful:
+    - One list of associations to avoid (from other team, neutral, assassin images), grouped by: catastrophic, bad, and not ideal.
+    - One list of associations to aim for (from current team images).
+
+    Draft lists:
+    {index_associations}
+    """
+    else:
+        index_associations = None
+        prompt_text = """
     Create two lists of associations:
     - One list of associations to avoid (from other team, neutral, assassin images), grouped by: catastrophic, bad, and not ideal.
     - One list of associations to aim for (from current team images).
@@ -190,85 +357,43 @@ def generate_associations(images, current_team, api_key):
     Create a summary with common themes and associations to aim for.
     """
 
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers={"Authorization": f"Bearer {api_key}"},
-        json={
-            "model": hints_model,
-            "messages": [{"role": "user", "content": prompt_text}]
-        }
-    )
+    messages = cached_prefix_messages(hints_model, spymaster_system_prompt,
+                                      [spymaster_board_prompt(board, current_team)], prompt_text)
+    result = chat_completion(api_key, hints_model, messages, stage="associations")
 
-    if response.status_code == 200:
-        result = response.json()
+    if result is not None:
         associations = result["choices"][0]["message"]["content"]
         return associations
+    elif index_associations is not None:
+        return index_associations
     else:
         return "Error: Unable to get associations from the API."
 
 
 # Function to generate a hint
-def generate_hint(images, current_team, api_key, associations, previous_hints):
-    unviewed_images = [img for img in images if not img['viewed']]
-    current_team_images = [img for img in unviewed_images if img['card_color'] == current_team]
-    other_team_images = [img for img in unviewed_images if
-                         img['card_color'] != current_team and img['card_color'] != 'neutral' and img[
-                             'card_color'] != 'assassin']
-    neutral_images = [img for img in unviewed_images if img['card_color'] == 'neutral']
-    assassin_image = [img for img in unviewed_images if img['card_color'] == 'assassin']
-
-    hint_instructions = """
-
-    1. **Word Association:** The hint should be a single word that relates to multiple images on the board.
-    2. **Number:** The number of cards related to the hint.
-    3. **Clarity:** The hint should be clear and concise, avoiding ambiguity.
-    4. **Avoiding Bad Associations:** Ensure the hint does not relate to the assassin, other team, or neutral cards.
-    5. **Strong Association:** The hint should strongly relate to the cards you want your team to guess.
-    6. **Common Themes:** Look for common themes or connections between the cards.
-    7. **Risk Management:** Balance the number of cards with the strength of the association.
-    8. **Zero Guesses:** If you don't want your team to guess any cards, use a hint with the number '0'.
-
-    """
-
+def generate_hint(board, current_team, api_key, associations, previous_hints, temperature=None, seed=None):
     prompt_text = f"""
-    Based on the following associations, generate a possible hint.
-    
-    Hint Instructions:
-    {hint_instructions}
-
-    Associations evaluation:
-    {associations}
+    Based on the associations above, generate a possible hint.
 
     Other hints we considered. Take into account that this hint should be different from the previous ones:
     {chr(10).join(previous_hints)}
 
-    Other team images (avoid these, they give points to the other team):
-    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in other_team_images])}
-
-    Neutral images (avoid these. they are not that bad, but they end your turn and don't give points):
-    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in neutral_images])}
-
-    Assassin image (avoid this at all costs, it ends the game):
-    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in assassin_image])}
-
-    Current team images (these are the images you want your team to guess):
-    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in current_team_images])}
-
     Return:
     - A hint consisting of one word and a number. Look at the hint instructions for how to craft an effective hint.
     """
 
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers={"Authorization": f"Bearer {api_key}"},
-        json={
-            "model": hints_model,
-            "messages": [{"role": "user", "content": prompt_text}]
-        }
-    )
+    sampling = {}
+    if temperature is not None:
+        sampling["temperature"] = temperature
+    if seed is not None:
+        sampling["seed"] = seed
+
+    messages = cached_prefix_messages(hints_model, spymaster_system_prompt,
+                                      [spymaster_board_prompt(board, current_team), associations_prompt(associations)],
+                                      prompt_text)
+    result = chat_completion(api_key, hints_model, messages, stage="hint", **sampling)
 
-    if response.status_code == 200:
-        result = response.json()
+    if result is not None:
         hint = result["choices"][0]["message"]["content"]
         return hint
     else:
@@ -276,35 +401,12 @@ def generate_hint(images, current_team, api_key, associations, previous_hints):
 
 
 # Function to score a hint
-def score_hint(images, current_team, api_key, hint, associations):
-    unviewed_images = [img for img in images if not img['viewed']]
-    current_team_images = [img for img in unviewed_images if img['card_color'] == current_team]
-    other_team_images = [img for img in unviewed_images if
-                         img['card_color'] != current_team and img['card_color'] != 'neutral' and img[
-                             'card_color'] != 'assassin']
-    neutral_images = [img for img in unviewed_images if img['card_color'] == 'neutral']
-    assassin_image = [img for img in unviewed_images if img['card_color'] == 'assassin']
-
+def score_hint(board, current_team, api_key, hint, associations):
     prompt_text = f"""
     Based on the following hint, evaluate its effectiveness.
 
     Hint: {hint}
 
-    Associations evaluation:
-    {associations}
-
-    Other team images (avoid these, they give points to the other team):
-    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in other_team_images])}
-
-    Neutral images (avoid these. they are not that bad, but they end your turn and don't give points):
-    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in neutral_images])}
-
-    Assassin image (avoid this at all costs, it ends the game):
-    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in assassin_image])}
-
-    Current team images (these are the images you want your team to guess):
-    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in current_team_images])}
-
     Provide:
     - For each unviewed image:
         - assign a score from 1 to 10, indicating how associated the image is with the hint.
@@ -320,38 +422,170 @@ def score_hint(images, current_team, api_key, hint, associations):
     Return word and number for the hint, general_score and short reasoning for the evaluation.
     """
 
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers={"Authorization": f"Bearer {api_key}"},
-        json={
-            "model": hints_model,
-            "messages": [{"role": "user", "content": prompt_text}]
-        }
-    )
+    messages = cached_prefix_messages(hints_model, spymaster_system_prompt,
+                                      [spymaster_board_prompt(board, current_team), associations_prompt(associations)],
+                                      prompt_text)
+    result = chat_completion(api_key, hints_model, messages, stage="score",
+                             response_format=response_format("hint_evaluation", HINT_EVALUATION_SCHEMA))
 
-    if response.status_code == 200:
-        result = response.json()
+    if result is not None:
         hint_evaluation = result["choices"][0]["message"]["content"]
         return hint_evaluation
     else:
         return "Error: Unable to get hint evaluation from the API."
 
 
-# Adjusted function to generate the best hint
-def generate_best_hint(images, current_team, api_key):
-    print(f"Evaluating associations for the {current_team} team...")
-    associations = generate_associations(images, current_team, api_key)
-
-    hint1 = generate_hint(images, current_team, api_key, associations, [])
-    hint1_evaluation = score_hint(images, current_team, api_key, hint1, associations)
+# Function to generate and score a single, independent hint candidate
+def generate_scored_hint_candidate(board, current_team, api_key, associations, candidate_index):
+    temperature = hint_candidate_temperatures[candidate_index % len(hint_candidate_temperatures)]
+    hint = generate_hint(board, current_team, api_key, associations, [], temperature=temperature, seed=candidate_index)
+    hint_evaluation = score_hint(board, current_team, api_key, hint, associations)
+    return convert_hint_evaluation_to_json(hint_evaluation, api_key)
+
+
+# Function to generate hint candidates concurrently and score each of them as soon as it is generated
+def generate_hint_candidates(board, current_team, api_key, associations, num_candidates=hint_candidates,
+                             max_workers=hint_search_concurrency):
+    def run_candidate(candidate_index):
+        try:
+            return generate_scored_hint_candidate(board, current_team, api_key, associations, candidate_index)
+        except Exception as e:
+            print(f"Hint candidate {candidate_index + 1} failed: {e}")
+            return None
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, num_candidates))) as executor:
+        candidates = list(executor.map(run_candidate, range(num_candidates)))
+
+    return [candidate for candidate in candidates if candidate is not None and candidate['word']]
+
+
+# Function to get the local hint scorer of a board; the card descriptions are embedded once per board
+def board_hint_affinity(board):
+    global word_vectors
+    affinity = hint_affinities.get(board)
+    if affinity is None:
+        if word_vectors_path and word_vectors is None:
+            word_vectors = load_word_vectors(word_vectors_path)
+        affinity = HintAffinity(board.cards, word_vectors)
+        hint_affinities[board] = affinity
+    return affinity
+
+
+# Function to rank the candidate hint words locally and score only the best few with the LLM
+def generate_local_hint_candidates(board, current_team, api_key, associations, shortlist=local_hint_shortlist,
+                                   max_workers=hint_search_concurrency, exclude=()):
+    affinity = board_hint_affinity(board)
+    partition = board.partition(current_team)
+    ranked = [candidate for candidate in affinity.rank(affinity.candidate_words(partition), partition)
+              if candidate['word'].lower() not in exclude][:shortlist]
+    for candidate in ranked:
+        print(f"Local hint candidate: {candidate['word']} {candidate['number']} (score {candidate['score']:.2f}, "
+              f"cards {candidate['cards']})")
+
+    def score_candidate(candidate):
+        try:
+            hint_evaluation = score_hint(board, current_team, api_key, f"{candidate['word']} {candidate['number']}",
+                                         associations)
+            return convert_hint_evaluation_to_json(hint_evaluation, api_key)
+        except Exception as e:
+            print(f"Scoring hint candidate {candidate['word']} failed: {e}")
+            return None
+
+    if not ranked:
+        return []
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(ranked)))) as executor:
+        candidates = list(executor.map(score_candidate, ranked))
+    return [candidate for candidate in candidates if candidate is not None and candidate['word']]
+
+
+# Function to generate the hint candidates of a turn in "parallel" or "local" search mode, leaving out the words in
+# exclude. count overrides the number of candidates of the mode.
+def search_hint_candidates(board, current_team, api_key, associations, search_mode=hint_search_mode, count=None,
+                           exclude=()):
+    if search_mode == "local":
+        return generate_local_hint_candidates(board, current_team, api_key, associations,
+                                              shortlist=count or local_hint_shortlist, exclude=exclude)
+    hints = generate_hint_candidates(board, current_team, api_key, associations, num_candidates=count or hint_candidates)
+    return [hint for hint in hints if hint['word'].lower() not in exclude]
+
+
+# Function to do the spymaster work of a turn ahead of time, on a snapshot of the board taken while the other team
+# is guessing
+def speculate_hint_candidates(board, current_team, api_key, search_mode=hint_search_mode):
+    associations = generate_associations(board, current_team, api_key)
+    return associations, search_hint_candidates(board, current_team, api_key, associations, search_mode)
+
+
+# Function to take the speculative spymaster work of a turn, as (associations, hint candidates), or None when there
+# is none to use. A candidate is kept when none of the cards revealed since the snapshot scored at least
+# speculation_touch_score for it; the other candidates are generated again, with fresh associations when one of the
+# team's own cards was revealed.
+def take_speculative_hints(board, current_team, api_key, speculation, search_mode=hint_search_mode):
+    if not speculation.pending(current_team):
+        return None
+    speculated, revealed = speculation.take(board, current_team)
+    if speculated is None:
+        speculation.record("miss")
+        return None
+    associations, hints = speculated
+    revealed_numbers = {card.card_number for card in revealed}
+
+    def touched(hint):
+        card_scores = hint.get('card_scores')
+        if not card_scores:
+            return bool(revealed_numbers)
+        return any(card_scores.get(card_number, 0) >= speculation_touch_score for card_number in revealed_numbers)
+
+    kept = [hint for hint in hints if not touched(hint)]
+    if hints and len(kept) == len(hints):
+        speculation.record("hit", reused=len(kept))
+        print(f"Using the speculative hint candidates of the {current_team} team.")
+        return associations, hints
+    if not kept:
+        speculation.record("miss", redone=len(hints))
+        return None
+
+    redone = len(hints) - len(kept)
+    print(f"Using {len(kept)} of {len(hints)} speculative hint candidates of the {current_team} team, "
+          f"generating {redone} again...")
+    if any(card.card_color == current_team for card in revealed):
+        associations = generate_associations(board, current_team, api_key)
+    fresh = search_hint_candidates(board, current_team, api_key, associations, search_mode, count=redone,
+                                   exclude={hint['word'].lower() for hint in kept})
+    speculation.record("patched", reused=len(kept), redone=redone)
+    return associations, kept + fresh
+
+
+# Adjusted function to generate the best hint. speculated holds the associations and hint candidates when they have
+# been prepared ahead of the turn.
+def generate_best_hint(board, current_team, api_key, search_mode=hint_search_mode, speculated=None):
+    if speculated is not None:
+        associations, hints = speculated
+    else:
+        print(f"Evaluating associations for the {current_team} team...")
+        associations = generate_associations(board, current_team, api_key)
+        hints = None
+
+    if search_mode in ("parallel", "local"):
+        if hints is None:
+            hints = search_hint_candidates(board, current_team, api_key, associations, search_mode)
+        for i, hint_json in enumerate(hints, start=1):
+            print(f"Hint candidate {i}: {hint_json['word']} {hint_json['number']} with general score {hint_json['general_score']}.")
+            print(f"Reasoning: {textwrap.fill(hint_json['reasoning'], width=80)}\n")
+        if hints:
+            return max(hints, key=lambda x: x['general_score'])
+        print("No hint candidates could be generated, falling back to the sequential search.")
+
+    hint1 = generate_hint(board, current_team, api_key, associations, [])
+    hint1_evaluation = score_hint(board, current_team, api_key, hint1, associations)
     hint1_json = convert_hint_evaluation_to_json(hint1_evaluation, api_key)
     print(f"First hint considered: {hint1_json['word']} {hint1_json['number']} with general score {hint1_json['general_score']}.")
     hint1_wrapped_reasoning = textwrap.fill(hint1_json['reasoning'], width=80)
     print(f"Reasoning: {hint1_wrapped_reasoning}\n")
 
     hint1_plus_evaluation = f"Hint: {hint1_json['word']} {hint1_json['number']}. Evaluation: {hint1_json['reasoning']}"
-    hint2 = generate_hint(images, current_team, api_key, associations, [hint1_plus_evaluation])
-    hint2_evaluation = score_hint(images, current_team, api_key, hint2, associations)
+    hint2 = generate_hint(board, current_team, api_key, associations, [hint1_plus_evaluation])
+    hint2_evaluation = score_hint(board, current_team, api_key, hint2, associations)
     hint2_json = convert_hint_evaluation_to_json(hint2_evaluation, api_key)
     print(f"Second hint considered: {hint2_json['word']} {hint2_json['number']} with general score {hint2_json['general_score']}. Reasoning: {hint2_json['reasoning']}")
     hint2_wrapped_reasoning = textwrap.fill(hint2_json['reasoning'], width=80)
@@ -363,8 +597,14 @@ def generate_best_hint(images, current_team, api_key):
     return best_hint
 
 
-# Function to convert hint evaluation to JSON
+# Function to convert hint evaluation to JSON, only asking the LLM when the answer is neither structured nor extractable
 def convert_hint_evaluation_to_json(hint_evaluation, api_key):
+    return convert_answer(hint_evaluation, validate_hint_evaluation, extract_hint_evaluation,
+                          lambda: convert_hint_evaluation_to_json_with_llm(hint_evaluation, api_key))
+
+
+# Function to convert hint evaluation to JSON with an extra LLM call (last-resort fallback)
+def convert_hint_evaluation_to_json_with_llm(hint_evaluation, api_key):
     prompt_text = f"""
     Convert the following hint evaluation into a JSON object with fields: 'word', 'number', 'reasoning', and 'general_score'.
     Return just the JSON object starting with {{ and ending with }}.
@@ -372,54 +612,32 @@ def convert_hint_evaluation_to_json(hint_evaluation, api_key):
     {hint_evaluation}
     """
 
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers={"Authorization": f"Bearer {api_key}"},
-        json={
-            "model": json_conversion_model,
-            "messages": [{"role": "user", "content": prompt_text}]
-        }
-    )
+    result = chat_completion(api_key, json_conversion_model, [{"role": "user", "content": prompt_text}], stage="json_conversion")
 
-    if response.status_code == 200:
-        result = response.json()
+    if result is not None:
         hint_json = result["choices"][0]["message"]["content"]
         return parse_clean_json(hint_json)
     else:
         return {"word": "", "number": 0, "reasoning": "", "general_score": 0}
 
 
-# Function to generate a list of guesses
-def generate_guesses(images, word, number, api_key, current_team, previous_hints=[]):
-    unviewed_images = [img for img in images if not img['viewed']]
-
-    if not unviewed_images:
-        return "No cards available to select."
-
-    guess_instructions = """
-    ### Instructions for Guessing in Codenames: Pictures
-
-    **1. Basics of Guessing:**
-       - **Guess Structure:** Provide a list of card numbers and reasons for each guess. Order the list based on the certainty of each guess, with the most certain guess first.
-       - **Goal:** Identify all of your team's agents based on the given hint, avoiding the assassin and the opposing team's agents.
+# Function to render the unviewed image descriptions for the guesser, once per turn
+def guesser_board_prompt(board, current_team):
+    def build(partition):
+        return f"""
+    Images descriptions:
+    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in partition.unviewed])}
+    """
 
-    **2. Considerations for Successful Guessing:** 
-        - **Hint Interpretation:** Match the hint to the image descriptions, considering previous hints and guesses. 
-        - **Association:** Ensure the guesses are strongly associated with the hint. Avoid ambiguous associations. 
-        - **Previous Hints:** After guessing all cards related to the current hint, you can consider previous hints that were not fully guessed for the extra 1 guess you can make. Don't use this if you are not confident, or if you have already guessed all cards related to the previous hints.
-        - **Risk Management:** Balance between confident guesses and avoiding the assassin or opposing team's cards. If you don't know, don't guess more than the number you got with the current hint. 
+    return board.memoized(current_team, "guesser_board_prompt", build)
 
-    """
 
+# Function to build the guesses request for a hint
+def guesses_messages(board, word, number, current_team, previous_hints):
     prompt_text = f"""
     You are on the {current_team} team.
 
     Previous information: {chr(10).join(previous_hints)}
-
-    Images descriptions:
-    {chr(10).join([f'Card {img["card_number"]}: {img["description"]}' for img in unviewed_images])}
-
-    {guess_instructions}
     
     You received the hint "{word} {number}". Based on this hint, you need to guess the cards related to this hint.
     First create a list of each card with a score between 1 and 10, indicating how certain you are that the card is related to the hint.
@@ -429,17 +647,22 @@ def generate_guesses(images, word, number, api_key, current_team, previous_hints
     This list should include the card number and the reasoning for each guess.
     """
 
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers={"Authorization": f"Bearer {api_key}"},
-        json={
-            "model": guesses_model,
-            "messages": [{"role": "user", "content": prompt_text}]
-        }
-    )
+    return cached_prefix_messages(guesses_model, guess_instructions, [guesser_board_prompt(board, current_team)],
+                                  prompt_text)
+
+
+# Function to generate a list of guesses
+def generate_guesses(board, word, number, api_key, current_team, previous_hints=[]):
+    unviewed_images = board.partition(current_team).unviewed
 
-    if response.status_code == 200:
-        result = response.json()
+    if not unviewed_images:
+        return "No cards available to select."
+
+    messages = guesses_messages(board, word, number, current_team, previous_hints)
+    result = chat_completion(api_key, guesses_model, messages, stage="guesses",
+                             response_format=response_format("guesses", GUESSES_SCHEMA))
+
+    if result is not None:
         guesses = result["choices"][0]["message"]["content"]
         # print(f"Guesses with reasoning: {guesses}")
         return guesses
@@ -447,8 +670,14 @@ def generate_guesses(images, word, number, api_key, current_team, previous_hints
         return "Error: Unable to get guesses from the API."
 
 
-# Function to convert guesses to JSON
+# Function to convert guesses to JSON, only asking the LLM when the answer is neither structured nor extractable
 def convert_guesses_to_json(guesses, api_key):
+    return convert_answer(guesses, validate_guesses, extract_guesses,
+                          lambda: convert_guesses_to_json_with_llm(guesses, api_key))
+
+
+# Function to convert guesses to JSON with an extra LLM call (last-resort fallback)
+def convert_guesses_to_json_with_llm(guesses, api_key):
     prompt_text = f"""
     Convert the following guesses into a valid JSON list with fields: 'card_number' (integer) and 'reasoning' (string).
     Return just the JSON object, starting with [ and ending with ].
@@ -456,25 +685,63 @@ def convert_guesses_to_json(guesses, api_key):
     {guesses}
     """
 
-    response = requests.post(
-        "https://openrouter.ai/api/v1/chat/completions",
-        headers={"Authorization": f"Bearer {api_key}"},
-        json={
-            "model": json_conversion_model,
-            "messages": [
-                {"role": "user", "content": prompt_text}
-            ]
-        }
-    )
+    result = chat_completion(api_key, json_conversion_model, [{"role": "user", "content": prompt_text}], stage="json_conversion")
 
-    if response.status_code == 200:
-        result = response.json()
+    if result is not None:
         guesses_json = result["choices"][0]["message"]["content"]
         return parse_clean_json(guesses_json)
     else:
         return []
 
 
+# Function to stream the guesses for a hint, yielding each guess as soon as its JSON object is complete. When the
+# answer does not follow the schema, it is converted as a whole once it is complete. Closing the generator (the turn
+# ended) aborts the request.
+def stream_guesses(board, word, number, api_key, current_team, previous_hints=[]):
+    if not board.partition(current_team).unviewed:
+        return
+
+    parser = GuessStreamParser()
+    chunks = stream_chat_completion(api_key, guesses_model,
+                                    guesses_messages(board, word, number, current_team, previous_hints),
+                                    stage="guesses", response_format=response_format("guesses", GUESSES_SCHEMA))
+    try:
+        for chunk in chunks:
+            yield from parser.feed(chunk)
+    finally:
+        chunks.close()
+        if parser.guesses:
+            record_conversion("structured")
+
+    if not parser.guesses:
+        yield from convert_guesses_to_json(parser.text or "Error: Unable to get guesses from the API.", api_key)
+
+
+# Function to give the hint for a turn (the spymaster side of the game engine)
+def give_hint(board, current_team, api_key, speculation=None):
+    speculated = None
+    if speculation is not None:
+        speculated = take_speculative_hints(board, current_team, api_key, speculation)
+    best_hint = generate_best_hint(board, current_team, api_key, speculated=speculated)
+    return best_hint["word"], int(best_hint["number"])
+
+
+# Function to make the guesses for a hint (the team side of the game engine)
+def make_guesses(board, word, number, current_team, previous_hints, api_key, mode=guesser_mode):
+    if mode == "local":
+        guesses = local_guesses(board_hint_affinity(board), word, number, board.partition(current_team),
+                                local_guess_margin)
+        record_guesser("local" if guesses is not None else "fallback")
+        if guesses is not None:
+            return guesses
+
+    if guess_streaming:
+        return stream_guesses(board, word, number, api_key, current_team, previous_hints)
+
+    guesses_with_reasoning = generate_guesses(board, word, number, api_key, current_team, previous_hints)
+    return convert_guesses_to_json(guesses_with_reasoning, api_key)
+
+
 def parse_clean_json(message_content):
     # Find the first occurrences of '[' and '{'
     first_square_bracket = message_content.find("[")
@@ -509,140 +776,101 @@ def parse_clean_json(message_content):
 
 
 # Main function to coordinate the grid generation, image download, description, and hint generation
-def main():
+def main(board_path=None, api_key=None, resume_path=None):
     # Fetch API key
-    api_key = fetch_api_key()
+    api_key = api_key or fetch_api_key()
+    call_telemetry.stream_to(telemetry_path)
+    set_hedge_policy(HedgePolicy(fallback_models, hedge_deadlines, hedge_min_samples, hedge_min_delay))
+
+    if resume_path:
+        # Rebuild the game from its checkpoint, without scraping or describing the board again
+        checkpoint = GameCheckpoint.load(resume_path)
+        board, starting_player = checkpoint.board, checkpoint.current_team
+        if checkpoint.result["winner"] is not None:
+            print(f"The game in {resume_path} has already ended: the {checkpoint.result['winner']} team won.")
+            return
+        print(f"Resuming the game from {resume_path} at turn {checkpoint.result['turns'] + 1}.")
+    else:
+        # Generate spymaster grid labels
+        starting_player, grid_labels = generate_spymaster_grid_labels()
 
-    # Generate spymaster grid labels
-    starting_player, grid_labels = generate_spymaster_grid_labels()
+        # Load the board image URLs, from the website or from a local directory / manifest
+        image_urls = make_board_source(board_path).load()
+        if not image_urls:
+            print("No images found on the board.")
+            return
 
-    # Set up Selenium WebDriver (Chrome in this case)
-    driver = webdriver.Chrome()
-    driver.get(URL)
+        # Start downloading the images in the background, so the downloads overlap with the descriptions
+        downloads = card_image_downloads(image_urls)
 
-    # Wait for images to load
-    try:
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_all_elements_located((By.CLASS_NAME, 'card-img'))
-        )
-    except Exception as e:
-        print(f"Error: {e}")
-        driver.quit()
-        return []
+        # Generate descriptions for all image URLs, reusing cached descriptions for cards we have seen before
+        description_cache = DescriptionCache(description_cache_path, description_cache_max_entries)
+        descriptions = generate_descriptions(image_urls, api_key, cache=description_cache, downloads=downloads)
 
-    # Use the same browser instance to get image URLs and generate descriptions
-    soup = BeautifulSoup(driver.page_source, 'html.parser')
+        # Enrich the downloaded images with the grid labels and descriptions
+        board = download_and_enrich_images(image_urls, grid_labels, descriptions, downloads)
 
-    image_elements = soup.find_all('img', class_='card-img')
-    image_urls = ['https://samdemaeyer.github.io' + img['src'] for img in image_elements]
+        if not board:
+            print("No images found or error in downloading images.")
+            return
+        checkpoint = GameCheckpoint(board, starting_player, *new_game(starting_player, guess_history_token_budget))
 
-    # Generate descriptions for all image URLs
-    descriptions = generate_descriptions(image_urls, api_key)
+    # Write a checkpoint now and after every turn, so a crashed game can be resumed
+    checkpoint_file = resume_path or checkpoint_path
+    checkpoint.save(checkpoint_file)
 
-    # Download and enrich images with the grid labels and descriptions
-    enriched_images = download_and_enrich_images(driver, grid_labels, descriptions)
+    def save_checkpoint(board, next_team, guess_history, result):
+        checkpoint.current_team = next_team
+        checkpoint.save(checkpoint_file)
 
-    driver.quit()
-
-    if not enriched_images:
-        print("No images found or error in downloading images.")
-        return
+    board_concept_index(board)
 
     print(f"Starting player: {starting_player}")
-    # for card in enriched_images:
+    # for card in board:
     #     print(
     #         f"Card {card['card_number']}: {card['card_color']}, URL: {card['image_url']}, Description: {card['description']}")
 
-    visualize_game_grid(enriched_images)
-
-    previous_hints = {
-        "blue": [],
-        "red": []
-    }
-    current_team = starting_player
-    game_over = False
-    while not game_over:
-        # Generate hints for the current team
-        best_hint = generate_best_hint(enriched_images, current_team, api_key)
-
-        word = best_hint["word"]
-        number = int(best_hint["number"])
-        print(f"Hint given by the {current_team} team: {word} {number}")
-
-        # Generate list of guesses
-        guesses_with_reasoning = generate_guesses(enriched_images, word, number, api_key, current_team,
-                                                  previous_hints[current_team])
-        # print(f"Guesses with reasoning: {guesses_with_reasoning}")
-
-        # Convert guesses to JSON
-        guesses_json = convert_guesses_to_json(guesses_with_reasoning, api_key)
-        # print(f"Guesses: {guesses_json}")
-
-        guesses = 0
-        correct_guesses = 0
-        max_guesses = number + 1 if number != 0 else float('inf')
-
-        end_turn_reason = "All guesses made."
-
-        for guess in guesses_json:
-            if guesses > max_guesses:
-                end_turn_reason = "Maximum number of guesses reached."
-                break
-
-            card_number = guess['card_number']
-            reasoning = guess['reasoning']
-
-            selected_card_index = next(
-                (i for i, img in enumerate(enriched_images) if img['card_number'] == card_number), None)
-            if selected_card_index is not None:
-                selected_card_color = enriched_images[selected_card_index]['card_color']
-                enriched_images[selected_card_index]['viewed'] = True
-
-                visualize_game_grid(enriched_images)  # Update the visualization
-
-                print(f"Card {card_number} selected by the {current_team} team. Reasoning: {reasoning}")
-
-                if selected_card_color == 'assassin':
-                    print(f"Game over! {current_team} team selected the assassin.")
-                    game_over = True
-                    break
-
-                previous_hints[current_team].append(
-                    f"I picked card {card_number}, for hint {word}, because {reasoning}. The card turned out to be {selected_card_color}.")
-
-                # Check if any team has found all their agents
-                blue_agents_found = all(img['viewed'] for img in enriched_images if img['card_color'] == 'blue')
-                red_agents_found = all(img['viewed'] for img in enriched_images if img['card_color'] == 'red')
-
-                if blue_agents_found or red_agents_found:
-                    winning_team = 'blue' if blue_agents_found else 'red'
-                    print(f"{winning_team} team wins! All agents found.")
-                    game_over = True
-                    break
-
-                if selected_card_color == current_team:
-                    print(f"Correct guess! The {current_team} team can continue.")
-                    correct_guesses += 1
-                    if correct_guesses == number:
-                        previous_hints[current_team].append(
-                            f"I guessed all {number} cards correctly for hint {word}. This hint does not have to be considered anymore.")
-                else:
-                    previous_hints[current_team].append(
-                        f"I guessed {correct_guesses} cards out of {number} correctly for hint {word}, and then I guessed card {card_number}, for hint {word}, because {reasoning}. The card turned out to be {selected_card_color}.")
-                    end_turn_reason = "Wrong guess!"
-                    break  # Switch turns after a wrong guess
-
-            guesses += 1
-
-            # Sleep for 2 seconds between guesses
-            time.sleep(2)
-
-        current_team = 'blue' if current_team == 'red' else 'red'
-        if not game_over:
-            print(f"Switching to the {current_team} team. Reason: {end_turn_reason}")
+    visualize_game_grid(board)
+
+    # Prepare the hint candidates of the next team while a team is guessing
+    speculation = None
+    on_guessing = None
+    if speculative_hints and hint_search_mode in ("parallel", "local"):
+        speculation = SpeculativeScheduler(partial(speculate_hint_candidates, api_key=api_key))
+        on_guessing = lambda board, team: speculation.start(board, other_team(team))
+
+    # Update the visualization after every revealed card, and sleep for 2 seconds between guesses
+    play_game(board, starting_player, partial(give_hint, api_key=api_key, speculation=speculation),
+              partial(make_guesses, api_key=api_key), on_reveal=lambda board, card: visualize_game_grid(board),
+              guess_delay=2, guess_history_token_budget=guess_history_token_budget, on_guessing=on_guessing,
+              on_turn_end=save_checkpoint, guess_history=checkpoint.guess_history, result=checkpoint.result)
+    if speculation is not None:
+        speculation.shutdown()
+
+    print("LLM calls per stage:")
+    print(call_telemetry.summary_table())
+    call_telemetry.write_prometheus(telemetry_snapshot_path)
+    call_telemetry.close()
+    conversions = conversion_summary()
+    print(f"JSON conversion: {conversions.get('structured', 0)} structured, {conversions.get('local', 0)} extracted "
+          f"locally, {conversions.get('fallback', 0)} LLM fallbacks ({conversions['fallback_rate']:.0%}).")
+    if speculation is not None:
+        speculations = call_telemetry.speculation_summary()
+        print(f"Speculative hints: {speculations.get('hit', 0)} used as is, {speculations.get('patched', 0)} "
+              f"patched, {speculations.get('miss', 0)} discarded (hit rate {speculations['hit_rate']:.0%}).")
+    if guesser_mode == "local":
+        guessers = guesser_summary()
+        print(f"Local guesser: {guessers.get('local', 0)} hints picked locally, {guessers.get('fallback', 0)} left "
+              f"to the LLM ({guessers['fallback_rate']:.0%}).")
 
     input("Press Enter to continue...")
 
 
 if __name__ == "__main__":
-    main()
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--board", help="Directory or JSON manifest of card images to play with instead of the website")
+    parser.add_argument("--resume", nargs="?", const=checkpoint_path, metavar="CHECKPOINT",
+                        help=f"Continue the game saved in a checkpoint (default: {checkpoint_path})")
+    add_backend_arguments(parser)
+    args = parser.parse_args()
+    main(board_path=args.board, api_key=configure_backend(args, fetch_api_key), resume_path=args.resume)
@@ -0,0 +1,338 @@
+import json
+import random
+import threading
+import time
+from contextlib import ExitStack, nullcontext
+from email.utils import parsedate_to_datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from hedging import call_cancelled, cancellable_sleep, in_hedged_call, mark_call_started
+from telemetry import call_telemetry
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+
+# (connect, read) timeouts in seconds per pipeline stage
+stage_timeouts = {
+    "describe": (5, 90),
+    "associations": (5, 120),
+    "hint": (5, 90),
+    "score": (5, 90),
+    "json_conversion": (5, 30),
+    "guesses": (5, 90),
+    "default": (5, 60)
+}
+
+RETRYABLE_STATUS_CODES = {408, 429, 500, 502, 503, 504}
+
+
+# Function to read the Retry-After header, which is either a number of seconds or an HTTP date
+def parse_retry_after(value):
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+# Shared OpenRouter client with keep-alive connection pooling, per-stage timeouts and retries
+class OpenRouterClient:
+    def __init__(self, api_key, url=OPENROUTER_URL, timeouts=None, max_retries=4, backoff_base=0.5,
+                 backoff_max=30.0, pool_size=32):
+        self.api_key = api_key
+        self.url = url
+        self.timeouts = dict(stage_timeouts, **(timeouts or {}))
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._last_call = threading.local()  # Retries and time to first byte of this thread's last call
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update({"Authorization": f"Bearer {api_key}"})
+
+    def backoff_delay(self, attempt, retry_after=None):
+        if retry_after is not None:
+            return min(retry_after, self.backoff_max)
+        # Exponential backoff with full jitter
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+
+    # Retries and time to first byte of the last call made by the current thread, for the call telemetry
+    def last_call_stats(self):
+        return {"retries": getattr(self._last_call, "retries", 0), "ttfb": getattr(self._last_call, "ttfb", None)}
+
+    # Usage block of the last stream read by the current thread (None when the stream was closed before it arrived)
+    def last_stream_usage(self):
+        return getattr(self._last_call, "usage", None)
+
+    # Send a chat completion request and return the parsed response, or None when all attempts failed
+    def chat_completion(self, model, messages, stage="default", **request_fields):
+        if in_hedged_call():
+            return self.collect_stream(model, messages, stage, **request_fields)
+
+        timeout = self.timeouts.get(stage, self.timeouts["default"])
+        payload = dict(request_fields, model=model, messages=messages)
+        if self.url == OPENROUTER_URL:
+            payload.setdefault("usage", {"include": True})  # Ask OpenRouter to report the cost of the call
+
+        self._last_call.ttfb = None
+        for attempt in range(self.max_retries + 1):
+            if call_cancelled():
+                return None  # The hedge this call belongs to was already answered
+            self._last_call.retries = attempt
+            retry_after = None
+            try:
+                response = self.session.post(self.url, json=payload, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                print(f"[{stage}] Request to {model} failed (attempt {attempt + 1}): {e}")
+            else:
+                self._last_call.ttfb = response.elapsed.total_seconds()
+                if response.status_code == 200:
+                    return response.json()
+                print(f"[{stage}] Request to {model} returned {response.status_code} (attempt {attempt + 1})")
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    return None
+                if response.status_code == 429:
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+
+            if attempt < self.max_retries:
+                cancellable_sleep(self.backoff_delay(attempt, retry_after))
+
+        return None
+
+    # Send a chat completion request as a stream and put the answer together into a regular response. Hedged calls go
+    # this way, so the losing call can be aborted: closing the stream stops the generation (and its cost) at the
+    # provider. Returns None when the call failed or was cancelled.
+    def collect_stream(self, model, messages, stage="default", **request_fields):
+        stream = self.stream_chat_completion(model, messages, stage=stage, **request_fields)
+        try:
+            content = "".join(stream)
+        finally:
+            stream.close()
+        if call_cancelled() or not getattr(self._last_call, "complete", False):
+            return None
+        return {
+            "model": model,
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": self.last_stream_usage() or {}
+        }
+
+    # Send a streaming chat completion request and yield the pieces of the answer as they arrive as server-sent events.
+    # Attempts are retried until the response starts; closing the generator closes the connection, which stops the
+    # generation.
+    def stream_chat_completion(self, model, messages, stage="default", **request_fields):
+        timeout = self.timeouts.get(stage, self.timeouts["default"])
+        payload = dict(request_fields, model=model, messages=messages, stream=True)
+        if self.url == OPENROUTER_URL:
+            payload.setdefault("usage", {"include": True})
+
+        self._last_call.ttfb = None
+        self._last_call.usage = None
+        self._last_call.complete = False  # Whether the whole answer arrived
+        response = None
+        for attempt in range(self.max_retries + 1):
+            if call_cancelled():
+                return
+            self._last_call.retries = attempt
+            start = time.perf_counter()
+            retry_after = None
+            try:
+                response = self.session.post(self.url, json=payload, timeout=timeout, stream=True)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                print(f"[{stage}] Stream from {model} failed (attempt {attempt + 1}): {e}")
+            else:
+                if response.status_code == 200:
+                    break
+                print(f"[{stage}] Stream from {model} returned {response.status_code} (attempt {attempt + 1})")
+                response.close()
+                if response.status_code not in RETRYABLE_STATUS_CODES:
+                    return
+                if response.status_code == 429:
+                    retry_after = parse_retry_after(response.headers.get("Retry-After"))
+            response = None
+
+            if attempt < self.max_retries:
+                cancellable_sleep(self.backoff_delay(attempt, retry_after))
+        if response is None:
+            return
+
+        response.encoding = "utf-8"
+        try:
+            for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                if call_cancelled():
+                    print(f"[{stage}] Stream from {model} aborted: the hedge was already answered")
+                    break
+                # Blank lines separate events; lines starting with ':' are keep-alive comments
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    self._last_call.complete = True
+                    break
+                event = json.loads(data)
+                if event.get("usage"):
+                    self._last_call.usage = event["usage"]
+                for choice in event.get("choices") or []:
+                    content = (choice.get("delta") or {}).get("content")
+                    if content:
+                        if self._last_call.ttfb is None:
+                            self._last_call.ttfb = time.perf_counter() - start
+                        yield content
+            else:
+                self._last_call.complete = True
+        except (requests.RequestException, ValueError) as e:
+            print(f"[{stage}] Stream from {model} broke off: {e}")
+        finally:
+            response.close()
+
+
+# Process-wide limit on the chat completion requests: at most max_concurrent of them in flight, started at no more
+# than rate per second on average (a token bucket that allows bursts of up to burst requests). Used as a context
+# manager around each request; either limit can be None.
+class RateLimiter:
+    def __init__(self, rate=None, burst=None, max_concurrent=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate or 1.0)
+        self.max_concurrent = max_concurrent
+        self.in_flight = 0
+        self.waited = 0.0  # Total seconds requests spent waiting for the limiter
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._condition = threading.Condition()
+
+    def acquire(self):
+        start = time.monotonic()
+        with self._condition:
+            while True:
+                now = time.monotonic()
+                if self.rate is not None:
+                    self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                concurrency_ok = self.max_concurrent is None or self.in_flight < self.max_concurrent
+                if concurrency_ok and (self.rate is None or self._tokens >= 1):
+                    break
+                timeout = (1 - self._tokens) / self.rate if concurrency_ok else None
+                self._condition.wait(timeout)
+            if self.rate is not None:
+                self._tokens -= 1
+            self.in_flight += 1
+            self.waited += time.monotonic() - start
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify()
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.release()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+_backend = None
+_hedge_policy = None
+_rate_limiter = None
+
+
+# Function to get the process-wide client for an API key, so every call shares one connection pool
+def get_client(api_key):
+    with _clients_lock:
+        client = _clients.get(api_key)
+        if client is None:
+            client = OpenRouterClient(api_key)
+            _clients[api_key] = client
+        return client
+
+
+# Function to replace OpenRouter by another backend for every chat completion in this process (None restores it).
+# A backend has the same chat_completion(model, messages, stage=..., **request_fields) method as OpenRouterClient.
+def set_backend(backend):
+    global _backend
+    _backend = backend
+
+
+def get_backend():
+    return _backend
+
+
+# Function to hedge slow calls with a fallback model per stage (see hedging.HedgePolicy); None turns hedging off
+def set_hedge_policy(hedge_policy):
+    global _hedge_policy
+    _hedge_policy = hedge_policy
+
+
+# Function to limit the chat completion requests of the whole process (see RateLimiter); None removes the limit
+def set_rate_limiter(rate_limiter):
+    global _rate_limiter
+    _rate_limiter = rate_limiter
+
+
+def get_rate_limiter():
+    return _rate_limiter
+
+
+def rate_limited():
+    return _rate_limiter if _rate_limiter is not None else nullcontext()
+
+
+# Function to send a chat completion through the configured backend, or the shared OpenRouter client, hedging it
+# when a hedge policy is set. Every request is recorded in the call telemetry.
+def chat_completion(api_key, model, messages, stage="default", **request_fields):
+    backend = _backend if _backend is not None else get_client(api_key)
+
+    def send(model, hedge):
+        with rate_limited():
+            mark_call_started()  # Time spent waiting for the rate limiter does not count towards the hedge deadline
+            start = time.perf_counter()
+            result = backend.chat_completion(model, messages, stage=stage, **request_fields)
+        call_stats = backend.last_call_stats() if hasattr(backend, "last_call_stats") else {}
+        call_telemetry.record_call(stage, model, time.perf_counter() - start, result, hedge=hedge,
+                                   cancelled=call_cancelled(), **call_stats)
+        return result
+
+    if _hedge_policy is None:
+        return send(model, False)
+    return _hedge_policy.call(send, stage, model)
+
+
+# Function to stream a chat completion through the configured backend, yielding the pieces of the answer as they
+# arrive. Backends without streaming answer in one piece. The call is recorded in the telemetry when the stream ends
+# or is closed; the completion tokens of a stream closed early are estimated from the text received. The rate limiter
+# slot is released as soon as the answer starts, so a caller that reads the stream slowly does not hold up other calls.
+def stream_chat_completion(api_key, model, messages, stage="default", **request_fields):
+    backend = _backend if _backend is not None else get_client(api_key)
+    if not hasattr(backend, "stream_chat_completion"):
+        result = chat_completion(api_key, model, messages, stage=stage, **request_fields)
+        if result is not None:
+            yield result["choices"][0]["message"]["content"]
+        return
+
+    slot = ExitStack()
+    slot.enter_context(rate_limited())
+    start = time.perf_counter()
+    received = []
+    try:
+        for content in backend.stream_chat_completion(model, messages, stage=stage, **request_fields):
+            slot.close()
+            received.append(content)
+            yield content
+    finally:
+        slot.close()
+        usage = backend.last_stream_usage() if hasattr(backend, "last_stream_usage") else None
+        if usage is None and received:
+            usage = {"completion_tokens": (len("".join(received)) + 3) // 4}
+        call_stats = backend.last_call_stats() if hasattr(backend, "last_call_stats") else {}
+        call_telemetry.record_call(stage, model, time.perf_counter() - start,
+                                   {"usage": usage} if received else None, **call_stats)
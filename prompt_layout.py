@@ -0,0 +1,29 @@
+# Model prefixes of providers that only cache prompt prefixes marked with an explicit cache breakpoint.
+# Other providers (e.g. OpenAI) cache long identical prefixes automatically.
+CACHE_BREAKPOINT_PROVIDERS = ("anthropic/", "google/")
+
+
+def uses_cache_breakpoints(model):
+    return model.startswith(CACHE_BREAKPOINT_PROVIDERS)
+
+
+def text_part(text, cache_breakpoint=False):
+    part = {"type": "text", "text": text}
+    if cache_breakpoint:
+        part["cache_control"] = {"type": "ephemeral"}
+    return part
+
+
+# Function to lay out a request so provider-side prompt caching can reuse its prefix. The static instructions go in
+# the system message, followed by the parts that stay the same for the rest of the turn (board, associations) in a
+# fixed order, and only then the part that changes from call to call.
+def cached_prefix_messages(model, system_prompt, stable_parts, dynamic_part):
+    breakpoints = uses_cache_breakpoints(model)
+    user_content = [text_part(part) for part in stable_parts if part]
+    if breakpoints and user_content:
+        user_content[-1]["cache_control"] = {"type": "ephemeral"}
+    user_content.append(text_part(dynamic_part))
+    return [
+        {"role": "system", "content": [text_part(system_prompt, cache_breakpoint=breakpoints)]},
+        {"role": "user", "content": user_content}
+    ]
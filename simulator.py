@@ -0,0 +1,112 @@
+# Headless self-play: runs many complete games without a browser, display, sleeps or prompts, spread over a process
+# pool, and reports throughput and game statistics.
+# Run from the project root with e.g.: python simulator.py --games 1000 --workers 8
+import argparse
+import contextlib
+import io
+import os
+import random
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+from PIL import Image
+
+import main_visual
+from board_sources import LocalBoardSource
+from game_engine import play_game, silent
+from llm_backends import StubBackend
+from openrouter_client import set_backend
+
+
+# Function to create a deck of distinct synthetic card images, for runs without a real card set
+def make_synthetic_deck(directory, num_cards=100, size=(64, 64)):
+    rng = random.Random(0)
+    for i in range(num_cards):
+        color = tuple(rng.randrange(256) for _ in range(3))
+        Image.new('RGB', size, color).save(os.path.join(directory, f"card_{i:03d}.png"))
+    return directory
+
+
+# Function to set up the LLM backend once per worker process
+def init_worker(backend_factory):
+    set_backend(backend_factory())
+
+
+# Function to play one headless game. The seed fixes the grid labels and the cards drawn from the deck.
+# make_guesses(board, word, number, team, history_lines) replaces the guessers of main_visual.
+def run_game(seed, cards_path, api_key="headless", make_guesses=None):
+    make_guesses = make_guesses or partial(main_visual.make_guesses, api_key=api_key)
+    random.seed(seed)
+    start = time.perf_counter()
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        starting_player, grid_labels = main_visual.generate_spymaster_grid_labels()
+        image_urls = LocalBoardSource(cards_path, board_size=len(grid_labels)).load()
+        descriptions = main_visual.generate_descriptions(image_urls, api_key)
+        board = main_visual.download_and_enrich_images(image_urls, grid_labels, descriptions)
+        result = play_game(board, starting_player, partial(main_visual.give_hint, api_key=api_key),
+                           make_guesses,
+                           guess_history_token_budget=main_visual.guess_history_token_budget, log=silent)
+
+    result["seed"] = seed
+    result["seconds"] = time.perf_counter() - start
+    return result
+
+
+# Function to summarize a list of game results
+def summarize(results, elapsed):
+    games = len(results)
+    summary = {
+        "games": games,
+        "seconds": elapsed,
+        "games_per_second": games / elapsed if elapsed else 0.0,
+        "assassin_rate": sum(1 for r in results if r["assassin_picked_by"]) / games if games else 0.0,
+        "unfinished_rate": sum(1 for r in results if r["winner"] is None) / games if games else 0.0,
+        "average_turns": sum(r["turns"] for r in results) / games if games else 0.0,
+        "starting_team_win_rate": {}
+    }
+    for team in ("blue", "red"):
+        started = [r for r in results if r["starting_team"] == team]
+        wins = sum(1 for r in started if r["winner"] == team)
+        summary["starting_team_win_rate"][team] = wins / len(started) if started else 0.0
+    return summary
+
+
+# Function to run many games over a process pool
+def simulate(num_games, cards_path, workers=None, seed=0, backend_factory=StubBackend):
+    seeds = [seed + i for i in range(num_games)]
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(backend_factory,)) as executor:
+        results = list(executor.map(partial(run_game, cards_path=cards_path), seeds, chunksize=max(1, num_games // 64)))
+    return results, summarize(results, time.perf_counter() - start)
+
+
+def print_summary(summary):
+    print(f"Games: {summary['games']} in {summary['seconds']:.2f}s ({summary['games_per_second']:.1f} games/sec)")
+    for team, rate in summary["starting_team_win_rate"].items():
+        print(f"Win rate when {team} starts: {rate:.1%}")
+    print(f"Assassin rate: {summary['assassin_rate']:.1%}")
+    print(f"Unfinished (turn limit): {summary['unfinished_rate']:.1%}")
+    print(f"Average turns: {summary['average_turns']:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--games", type=int, default=100)
+    parser.add_argument("--workers", type=int, default=None, help="Number of worker processes (default: CPU count)")
+    parser.add_argument("--cards", help="Directory of card images (default: a synthetic deck)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="Simulated latency per LLM call, in seconds")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as deck_directory:
+        cards_path = args.cards or make_synthetic_deck(deck_directory)
+        _, summary = simulate(args.games, cards_path, args.workers, args.seed,
+                              partial(StubBackend, latency=args.latency))
+    print_summary(summary)
+
+
+if __name__ == "__main__":
+    main()
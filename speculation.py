@@ -0,0 +1,54 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from board import Board, Card
+from telemetry import call_telemetry
+
+
+# Function to copy a board, so work on the copy is not affected by the cards revealed on the original meanwhile
+def snapshot_board(board):
+    return Board(Card(**card.to_dict()) for card in board.cards)
+
+
+# Runs the spymaster work of a team ahead of its turn. While the other team is guessing, work(snapshot, team) runs in
+# the background on a snapshot of the board; when the team's turn starts, take() returns its result together with the
+# cards that were revealed since the snapshot, so the caller can decide what of it still holds.
+class SpeculativeScheduler:
+    def __init__(self, work, max_workers=2, telemetry=call_telemetry):
+        self.work = work
+        self.telemetry = telemetry
+        self._pending = {}  # Team -> (snapshot, future)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculation")
+
+    def start(self, board, team):
+        previous = self._pending.pop(team, None)
+        if previous is not None:
+            previous[1].cancel()
+        snapshot = snapshot_board(board)
+        self._pending[team] = (snapshot, self._executor.submit(self.work, snapshot, team))
+
+    def pending(self, team):
+        return team in self._pending
+
+    # The result of the speculative work for a team (waiting for it if it is still running) and the cards revealed
+    # since it started, or (None, None) when nothing was started or the work failed
+    def take(self, board, team):
+        pending = self._pending.pop(team, None)
+        if pending is None:
+            return None, None
+        snapshot, future = pending
+        try:
+            result = future.result()
+        except Exception as e:
+            print(f"Speculative work for the {team} team failed: {e}")
+            return None, None
+        revealed = [board.card(card.card_number) for card in snapshot.unviewed()
+                    if board.card(card.card_number).viewed]
+        return result, revealed
+
+    def record(self, outcome, reused=0, redone=0):
+        self.telemetry.record_speculation("hint", outcome, reused, redone)
+
+    # Drop the work that has not started yet and wait for the running work, so it does not outlive the game
+    def shutdown(self):
+        self._pending.clear()
+        self._executor.shutdown(wait=True, cancel_futures=True)
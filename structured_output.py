@@ -0,0 +1,333 @@
+import json
+import re
+import threading
+from collections import Counter
+
+# How each hint or guess answer was turned into JSON: "structured" (the model honoured the schema),
+# "local" (deterministic extraction from free text) or "fallback" (an extra conversion call to the LLM)
+conversion_counts = Counter()
+_conversion_lock = threading.Lock()
+
+HINT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "brainstorm": {"type": "string"},
+        "hint": {"type": "string"},
+        "number": {"type": "integer"},
+        "reasoning": {"type": "string"}
+    },
+    "required": ["brainstorm", "hint", "number", "reasoning"],
+    "additionalProperties": False
+}
+
+HINT_EVALUATION_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "card_scores": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "card_number": {"type": "integer"},
+                    "score": {"type": "integer"}
+                },
+                "required": ["card_number", "score"],
+                "additionalProperties": False
+            }
+        },
+        "word": {"type": "string"},
+        "number": {"type": "integer"},
+        "general_score": {"type": "number"},
+        "reasoning": {"type": "string"}
+    },
+    "required": ["card_scores", "word", "number", "general_score", "reasoning"],
+    "additionalProperties": False
+}
+
+GUESSES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "analysis": {"type": "string"},
+        "guesses": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "card_number": {"type": "integer"},
+                    "reasoning": {"type": "string"}
+                },
+                "required": ["card_number", "reasoning"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["analysis", "guesses"],
+    "additionalProperties": False
+}
+
+
+CARD_DESCRIPTIONS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "descriptions": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "card_id": {"type": "integer"},
+                    "description": {"type": "string"}
+                },
+                "required": ["card_id", "description"],
+                "additionalProperties": False
+            }
+        }
+    },
+    "required": ["descriptions"],
+    "additionalProperties": False
+}
+
+
+# Function to build the response_format field that asks the provider for output matching a JSON schema
+def response_format(name, schema):
+    return {
+        "type": "json_schema",
+        "json_schema": {"name": name, "strict": True, "schema": schema}
+    }
+
+
+def record_conversion(kind):
+    with _conversion_lock:
+        conversion_counts[kind] += 1
+
+
+# Function to summarize how often the LLM conversion fallback was needed
+def conversion_summary():
+    with _conversion_lock:
+        total = sum(conversion_counts.values())
+        return dict(conversion_counts, total=total,
+                    fallback_rate=conversion_counts["fallback"] / total if total else 0.0)
+
+
+# Function to load the JSON value in a model answer, tolerating text or code fences around it
+def load_json_value(text):
+    text = text.strip()
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    for opening, closing in (("{", "}"), ("[", "]")):
+        start, end = text.find(opening), text.rfind(closing)
+        if start == -1 or end <= start:
+            continue
+        try:
+            return json.loads(text[start:end + 1])
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def to_int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+# Functions to validate (and normalize) a structured answer, returning None when it does not match the schema
+def validate_hint(data):
+    if not isinstance(data, dict):
+        return None
+    hint, number = data.get("hint"), to_int(data.get("number"))
+    if not isinstance(hint, str) or not hint.strip() or number is None:
+        return None
+    return {"hint": hint.strip(), "number": number}
+
+
+def validate_hint_evaluation(data):
+    if not isinstance(data, dict):
+        return None
+    word, number, general_score = data.get("word"), to_int(data.get("number")), to_float(data.get("general_score"))
+    if not isinstance(word, str) or not word.strip() or number is None or general_score is None:
+        return None
+    card_scores = {}
+    for entry in data.get("card_scores") or []:
+        if isinstance(entry, dict):
+            card_number, score = to_int(entry.get("card_number")), to_float(entry.get("score"))
+            if card_number is not None and score is not None:
+                card_scores[card_number] = score
+    return {"word": word.strip(), "number": number, "reasoning": str(data.get("reasoning", "")),
+            "general_score": general_score, "card_scores": card_scores}
+
+
+def validate_guesses(data):
+    if isinstance(data, dict):
+        data = data.get("guesses")
+    if not isinstance(data, list):
+        return None
+    guesses = []
+    for guess in data:
+        card_number = to_int(guess.get("card_number")) if isinstance(guess, dict) else None
+        if card_number is None:
+            return None
+        guesses.append({"card_number": card_number, "reasoning": str(guess.get("reasoning", ""))})
+    return guesses
+
+
+# A hint word followed by its number, e.g. 'Feline 3', '"Feline" 3', '**Feline, 3**' or 'Feline - 3'
+HINT_PATTERN = re.compile(r"[\"'*“]*([A-Za-z][A-Za-z'\-]*)[\"'*”]*\s*[,:\-–]?\s*[\"'*]*\(?(\d{1,2})\)?\b")
+HINT_LABEL_PATTERN = re.compile(r"\b(?:hint|clue|word)\b[^A-Za-z0-9\n]*", re.IGNORECASE)
+# Filler between a label and the hint itself, as in "The hint is Ocean 2" or "my final hint is: **Feline 3**"
+HINT_FILLER_PATTERN = re.compile(r"(?:\b(?:is|was|will|be|would|the|a|an|my|our|final|then|i|choose|give|go|with|here)"
+                                 r"\b[^A-Za-z0-9\n]*)*", re.IGNORECASE)
+SCORE_PATTERN = re.compile(r"general[ _]score\W*?(\d+(?:\.\d+)?)", re.IGNORECASE)
+REASONING_PATTERN = re.compile(r"\breasoning\b[^A-Za-z0-9\n]*(.+)", re.IGNORECASE)
+GUESS_SECTION_PATTERN = re.compile(r"^.*\b(?:guess(?:es)?|picks?)\b.*$", re.IGNORECASE | re.MULTILINE)
+CARD_PATTERN = re.compile(r"\bcard\s*#?\s*(\d{1,2})\b", re.IGNORECASE)
+CARD_SECTION_PATTERN = re.compile(r"^\W*card\s*(?:id\s*)?#?\s*(\d{1,3})\W*?[:.\-–][\s*_]*(.+?)"
+                                  r"(?=^\W*card\s*(?:id\s*)?#?\s*\d|\Z)", re.IGNORECASE | re.MULTILINE | re.DOTALL)
+
+
+# Function to pull the concluding "Word N" hint out of free text. Filler words and markdown between the label and the
+# hint are skipped. The last labelled hint wins, because the prompts ask the model to conclude with its choice.
+def extract_hint(text):
+    candidates = []
+    for label in HINT_LABEL_PATTERN.finditer(text):
+        match = HINT_PATTERN.match(text, HINT_FILLER_PATTERN.match(text, label.end()).end())
+        if match and match.group(1).lower() not in ("is", "the", "a", "and", "number"):
+            candidates.append(match)
+    if not candidates:
+        return None
+    match = candidates[-1]
+    return {"hint": match.group(1), "number": int(match.group(2))}
+
+
+def extract_hint_evaluation(text):
+    hint = extract_hint(text)
+    score = SCORE_PATTERN.findall(text)
+    if hint is None or not score:
+        return None
+    reasoning = REASONING_PATTERN.findall(text)
+    if not reasoning:
+        reasoning = [paragraph for paragraph in text.split("\n\n") if paragraph.strip()][-1:]
+    return {"word": hint["hint"], "number": hint["number"], "reasoning": reasoning[-1].strip(),
+            "general_score": float(score[-1])}
+
+
+# Function to pull the final list of guessed card numbers out of free text. Only the part after the last line
+# that introduces the guesses is used, so the per-card score listing that precedes it is ignored.
+def extract_guesses(text, max_card_number=25):
+    sections = [line for line in GUESS_SECTION_PATTERN.finditer(text) if not CARD_PATTERN.search(line.group(0))]
+    if not sections:
+        return None
+    conclusion = text[sections[-1].start():]
+
+    guesses = []
+    seen = set()
+    for line in conclusion.splitlines():
+        match = CARD_PATTERN.search(line)
+        if not match:
+            continue
+        card_number = int(match.group(1))
+        if card_number in seen or not 1 <= card_number <= max_card_number:
+            continue
+        seen.add(card_number)
+        reasoning = line[match.end():].strip(" :-*–")
+        guesses.append({"card_number": card_number, "reasoning": reasoning})
+    return guesses or None
+
+
+# Function to read the per-card descriptions out of a batched description answer: {card ID: description} for the IDs
+# from 1 to count with a non-empty description. Answers that do not follow the schema are read from 'Card <ID>: ...'
+# paragraphs. Cards that are missing are left out.
+def parse_card_descriptions(text, count):
+    data = load_json_value(text)
+    entries = data.get("descriptions") if isinstance(data, dict) else data
+    if isinstance(entries, list):
+        pairs = [(to_int(entry.get("card_id")), entry.get("description")) for entry in entries
+                 if isinstance(entry, dict)]
+    else:
+        pairs = [(int(match.group(1)), match.group(2)) for match in CARD_SECTION_PATTERN.finditer(text)]
+
+    descriptions = {}
+    for card_id, description in pairs:
+        if card_id is not None and 1 <= card_id <= count and isinstance(description, str) and description.strip():
+            descriptions.setdefault(card_id, description.strip())
+    return descriptions
+
+
+# Function to turn a model answer into JSON: structured output first, then local extraction, then the LLM fallback
+def convert_answer(text, validate, extract, fallback):
+    structured = validate(load_json_value(text))
+    if structured is not None:
+        record_conversion("structured")
+        return structured
+
+    extracted = extract(text)
+    if extracted is not None:
+        record_conversion("local")
+        return extracted
+
+    record_conversion("fallback")
+    return fallback()
+
+
+# Incremental parser for a streamed guesses answer in the GUESSES_SCHEMA format. feed() takes the next piece of the
+# answer and returns the guesses whose JSON object was completed by it, so each guess can be acted on while the rest
+# of the answer is still being generated. Strings are tracked, so braces inside the reasoning do not confuse it.
+class GuessStreamParser:
+    def __init__(self):
+        self.text = ""
+        self.position = 0
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False
+        self.string_start = None
+        self.last_string = None  # Last string closed at the top level of the answer object, i.e. a key or a value
+        self.guesses_depth = None  # Depth inside the "guesses" array, while in it
+        self.item_start = None
+        self.guesses = []
+
+    def feed(self, chunk):
+        self.text += chunk
+        completed = []
+        for i in range(self.position, len(self.text)):
+            c = self.text[i]
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif c == "\\":
+                    self.escaped = True
+                elif c == '"':
+                    self.in_string = False
+                    if self.depth == 1:
+                        self.last_string = self.text[self.string_start + 1:i]
+                continue
+
+            if c == '"':
+                self.in_string = True
+                self.string_start = i
+            elif c in "{[":
+                self.depth += 1
+                if c == "[" and self.depth == 2 and self.last_string == "guesses":
+                    self.guesses_depth = 2
+                elif c == "{" and self.guesses_depth is not None and self.depth == self.guesses_depth + 1:
+                    self.item_start = i
+            elif c in "}]":
+                if c == "}" and self.item_start is not None and self.depth == self.guesses_depth + 1:
+                    guess = validate_guesses([load_json_value(self.text[self.item_start:i + 1])])
+                    if guess is not None:
+                        completed += guess
+                    self.item_start = None
+                elif c == "]" and self.depth == self.guesses_depth:
+                    self.guesses_depth = None
+                self.depth -= 1
+        self.position = len(self.text)
+        self.guesses += completed
+        return completed
@@ -0,0 +1,300 @@
+import bisect
+import json
+import threading
+import time
+from collections import Counter, deque
+
+# Estimated prices in USD per million tokens (input, cached input, output), used when the provider does not report
+# the cost of a call itself
+MODEL_PRICES = {
+    "openai/gpt-4o": (2.50, 1.25, 10.00),
+    "google/gemini-pro-1.5": (1.25, 0.3125, 5.00),
+    "anthropic/claude-3-haiku:beta": (0.25, 0.03, 1.25),
+    "anthropic/claude-3.5-sonnet": (3.00, 0.30, 15.00),
+    "openai/gpt-4o-mini": (0.15, 0.075, 0.60)
+}
+
+
+# Fixed-bucket latency histogram (in seconds). Percentiles come from the most recent window samples, so a long-running
+# process keeps a bounded amount of memory per histogram and its percentiles follow the current latency.
+class LatencyHistogram:
+    buckets = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+    window = 1000
+
+    def __init__(self):
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.samples = deque(maxlen=self.window)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._ordered = None  # Sorted samples, until the next observation
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self._ordered = None
+
+    def merge(self, other):
+        self.counts = [count + other_count for count, other_count in zip(self.counts, other.counts)]
+        self.samples.extend(other.samples)
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+        self._ordered = None
+
+    def percentile(self, fraction):
+        if not self.samples:
+            return 0.0
+        if self._ordered is None:
+            self._ordered = sorted(self.samples)
+        ordered = self._ordered
+        return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+    def summary(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(0.5),
+            "p95": self.percentile(0.95),
+            "max": self.max,
+            "buckets": {f"le_{bound}": count for bound, count in zip(self.buckets + ("inf",), self.counts)}
+        }
+
+
+# Function to estimate the cost of a call from its token counts, or None for models without a known price
+def estimate_cost(model, prompt_tokens, cached_tokens, completion_tokens):
+    prices = MODEL_PRICES.get(model)
+    if prices is None:
+        return None
+    input_price, cached_price, output_price = prices
+    return ((prompt_tokens - cached_tokens) * input_price + cached_tokens * cached_price
+            + completion_tokens * output_price) / 1_000_000
+
+
+# Totals of the calls of one stage and model. Hedges are counted for the model of the call that was hedged.
+class CallTotals:
+    counters = ("calls", "failures", "retries", "prompt_tokens", "cached_tokens", "completion_tokens", "cost", "hedges",
+                "hedge_wins")
+
+    def __init__(self):
+        self.calls = 0
+        self.failures = 0
+        self.retries = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.latency = LatencyHistogram()
+        self.ttfb = LatencyHistogram()
+
+    def add(self, other):
+        for field in self.counters:
+            setattr(self, field, getattr(self, field) + getattr(other, field))
+        self.latency.merge(other.latency)
+        self.ttfb.merge(other.ttfb)
+
+
+# Telemetry of the chat completion calls: one record per call (stage, model, wall time, time to first byte, token
+# usage, retries and cost), streamed to a JSONL file when one is set, and aggregated per stage and model for the
+# Prometheus snapshot and the end-of-game summary table.
+class Telemetry:
+    def __init__(self, path=None):
+        self.totals = {}  # (stage, model) -> CallTotals
+        self.speculations = Counter()  # Outcome -> number of turns
+        self._file = None
+        self._lock = threading.Lock()
+        if path:
+            self.stream_to(path)
+
+    def stream_to(self, path):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+            self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def write_record(self, record):
+        if self._file is not None:
+            self._file.write(json.dumps(record) + "\n")
+
+    # Record one call. result is the parsed response, or None when the call failed; hedge marks the duplicate request
+    # of a hedged call, and cancelled the losing call of a hedge. A cancelled call is not a failure, and its latency
+    # is left out of the percentiles, which would otherwise drift up with every call cut short by its hedge.
+    def record_call(self, stage, model, seconds, result, ttfb=None, retries=0, hedge=False, cancelled=False):
+        usage = (result or {}).get("usage") or {}
+        prompt_tokens = usage.get("prompt_tokens") or 0
+        cached_tokens = (usage.get("prompt_tokens_details") or {}).get("cached_tokens") or 0
+        completion_tokens = usage.get("completion_tokens") or 0
+        cost = usage.get("cost")
+        if cost is None:
+            cost = estimate_cost(model, prompt_tokens, cached_tokens, completion_tokens)
+
+        record = {
+            "event": "call",
+            "timestamp": round(time.time(), 3),
+            "stage": stage,
+            "model": model,
+            "hedge": hedge,
+            "cancelled": cancelled,
+            "ok": result is not None,
+            "seconds": round(seconds, 4),
+            "ttfb": round(ttfb, 4) if ttfb is not None else None,
+            "prompt_tokens": prompt_tokens,
+            "cached_tokens": cached_tokens,
+            "completion_tokens": completion_tokens,
+            "retries": retries,
+            "cost": cost
+        }
+
+        with self._lock:
+            totals = self.totals.setdefault((stage, model), CallTotals())
+            totals.calls += 1
+            totals.failures += result is None and not cancelled
+            totals.retries += retries
+            totals.prompt_tokens += prompt_tokens
+            totals.cached_tokens += cached_tokens
+            totals.completion_tokens += completion_tokens
+            totals.cost += cost or 0.0
+            if not cancelled:
+                totals.latency.observe(seconds)
+                if ttfb is not None:
+                    totals.ttfb.observe(ttfb)
+            self.write_record(record)
+        return record
+
+    # Record that a call of model was hedged with fallback_model after delay seconds, and whether the hedge won
+    def record_hedge(self, stage, model, fallback_model, delay, won):
+        record = {
+            "event": "hedge",
+            "timestamp": round(time.time(), 3),
+            "stage": stage,
+            "model": model,
+            "fallback_model": fallback_model,
+            "delay": round(delay, 4),
+            "won": won
+        }
+        with self._lock:
+            totals = self.totals.setdefault((stage, model), CallTotals())
+            totals.hedges += 1
+            totals.hedge_wins += won
+            self.write_record(record)
+        return record
+
+    # Record what came of the work done speculatively for a turn: "hit" (all of it was used), "patched" (part of it
+    # was redone because of the cards revealed in the meantime) or "miss" (none of it was used)
+    def record_speculation(self, stage, outcome, reused=0, redone=0):
+        record = {
+            "event": "speculation",
+            "timestamp": round(time.time(), 3),
+            "stage": stage,
+            "outcome": outcome,
+            "reused": reused,
+            "redone": redone
+        }
+        with self._lock:
+            self.speculations[outcome] += 1
+            self.write_record(record)
+        return record
+
+    # Counts of the speculation outcomes, with the share of turns for which the speculative work was used as is
+    def speculation_summary(self):
+        with self._lock:
+            summary = dict(self.speculations)
+        total = sum(summary.values())
+        summary["hit_rate"] = summary.get("hit", 0) / total if total else 0.0
+        return summary
+
+    # Latency percentile of the calls of a stage and model, or None while there are fewer than min_samples of them
+    def latency_percentile(self, stage, model, fraction, min_samples=1):
+        with self._lock:
+            totals = self.totals.get((stage, model))
+            if totals is None or totals.latency.count < min_samples:
+                return None
+            return totals.latency.percentile(fraction)
+
+    # Render the totals in the Prometheus text exposition format
+    def prometheus_text(self):
+        counters = (
+            ("llm_calls_total", "Chat completion calls", lambda t: t.calls),
+            ("llm_failures_total", "Chat completion calls that failed after all retries", lambda t: t.failures),
+            ("llm_retries_total", "Retried chat completion attempts", lambda t: t.retries),
+            ("llm_prompt_tokens_total", "Input tokens, including cached ones", lambda t: t.prompt_tokens),
+            ("llm_cached_tokens_total", "Input tokens served from the provider's prompt cache",
+             lambda t: t.cached_tokens),
+            ("llm_completion_tokens_total", "Output tokens", lambda t: t.completion_tokens),
+            ("llm_cost_usd_total", "Reported or estimated cost in USD", lambda t: t.cost),
+            ("llm_hedges_total", "Slow calls hedged with a request to the fallback model", lambda t: t.hedges),
+            ("llm_hedge_wins_total", "Hedged calls answered first by the fallback model", lambda t: t.hedge_wins)
+        )
+        with self._lock:
+            items = sorted(self.totals.items())
+            lines = []
+            for name, help_text, value in counters:
+                lines += [f"# HELP codenames_{name} {help_text}", f"# TYPE codenames_{name} counter"]
+                for (stage, model), totals in items:
+                    lines.append(f'codenames_{name}{{stage="{stage}",model="{model}"}} {value(totals)}')
+
+            for name, help_text, histogram in (
+                    ("llm_call_seconds", "Wall time of chat completion calls, including retries",
+                     lambda t: t.latency),
+                    ("llm_ttfb_seconds", "Time to the first response byte of the last attempt", lambda t: t.ttfb)):
+                lines += [f"# HELP codenames_{name} {help_text}", f"# TYPE codenames_{name} histogram"]
+                for (stage, model), totals in items:
+                    labels = f'stage="{stage}",model="{model}"'
+                    hist = histogram(totals)
+                    cumulative = 0
+                    for bound, count in zip(hist.buckets + ("+Inf",), hist.counts):
+                        cumulative += count
+                        lines.append(f'codenames_{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+                    lines.append(f"codenames_{name}_sum{{{labels}}} {hist.total}")
+                    lines.append(f"codenames_{name}_count{{{labels}}} {hist.count}")
+
+            if self.speculations:
+                lines += ["# HELP codenames_speculations_total Turns prepared speculatively, by outcome",
+                          "# TYPE codenames_speculations_total counter"]
+                for outcome, count in sorted(self.speculations.items()):
+                    lines.append(f'codenames_speculations_total{{outcome="{outcome}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+    def write_prometheus(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.prometheus_text())
+
+    # Per-stage totals, over all models
+    def stage_summary(self):
+        summary = {}
+        with self._lock:
+            for (stage, model), totals in sorted(self.totals.items()):
+                summary.setdefault(stage, CallTotals()).add(totals)
+        return summary
+
+    def summary_table(self):
+        header = (f"{'stage':<16}{'calls':>7}{'failed':>8}{'retries':>9}{'p50 s':>8}{'p95 s':>8}{'total s':>9}"
+                  f"{'input tok':>11}{'cached':>9}{'output tok':>12}{'cost $':>10}{'hedged':>8}{'won':>5}")
+        lines = [header, "-" * len(header)]
+        all_totals = CallTotals()
+        rows = list(self.stage_summary().items())
+        for stage, totals in rows:
+            all_totals.add(totals)
+        for i, (stage, totals) in enumerate(rows + [("total", all_totals)]):
+            if i == len(rows):
+                lines.append("-" * len(header))
+            lines.append(f"{stage:<16}{totals.calls:>7}{totals.failures:>8}{totals.retries:>9}"
+                         f"{totals.latency.percentile(0.5):>8.2f}{totals.latency.percentile(0.95):>8.2f}"
+                         f"{totals.latency.total:>9.1f}{totals.prompt_tokens:>11}{totals.cached_tokens:>9}"
+                         f"{totals.completion_tokens:>12}{totals.cost:>10.4f}{totals.hedges:>8}{totals.hedge_wins:>5}")
+        return "\n".join(lines)
+
+
+# Process-wide telemetry of every chat completion call
+call_telemetry = Telemetry()